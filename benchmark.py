@@ -0,0 +1,94 @@
+"""Time the per-frame recognition of the hand pose:
+    - FeatureExtractor.addSampleFrame then the scores of the RubineModel (the RecoPipeline path)
+    - the FrameKernel, in pure Python
+    - the FrameKernel compiled by Numba, when it is installed
+
+    python benchmark.py [--frames 20000] [--classes 5] [--seg 5]"""
+import argparse
+import random
+import time
+
+from recoDataStructure import *
+from featureExtraction import FeatureExtractor
+from classifier import RubineModel
+import frameKernel
+
+def createGloves(frame_nb, seed=0):
+    rnd = random.Random(seed)
+    res = list()
+    i = 0
+    while i < frame_nb:
+        fingers = list()
+        for name in FINGER_NAME_LIST:
+            pos = [rnd.uniform(-100, 100), rnd.uniform(-100, 100), rnd.uniform(-100, 100)]
+            fingers.append(Finger(name, pos, [0.0] * 9, 8.0, [40.0, 25.0, 20.0], [10.0, 20.0]))
+        res.append(Glove(i / 60.0, 0, 1.0, 1, 5, fingers, [0.0, 0.0, 0.0], [0.0] * 9))
+        i += 1
+    return res
+
+def createModel(class_nb, seed=0):
+    rnd = random.Random(seed)
+    weight_matrix = [[rnd.uniform(-100, 100) for i in range(6)] for c in range(class_nb)]
+    base_weight_list = [rnd.uniform(-10000, 0) for c in range(class_nb)]
+    return RubineModel(range(class_nb), ["class%d" % c for c in range(class_nb)], weight_matrix, base_weight_list)
+
+def runExtractor(glove_list, model, seg_threshold):
+    fe = FeatureExtractor(seg_threshold)
+    res = list()
+    for g in glove_list:
+        fe.addSampleFrame(g)
+        if fe._seg_activated:
+            score_list = model.getScores([fe.getRecoTuple()._s_list])[0]
+            res.append(model._name_list[score_list.index(max(score_list))])
+    return res
+
+def runKernel(glove_list, model, seg_threshold, compiled):
+    kernel = frameKernel.FrameKernel(seg_threshold, compiled)
+    kernel.setModel(model)
+    res = list()
+    for g in glove_list:
+        name = kernel.addFrame(g)
+        if name is not None:
+            res.append(name)
+    return res
+
+def timeRun(func, *args):
+    # the first run compiles the kernel when Numba is used
+    func(*args)
+    best = None
+    k = 0
+    while k < 3:
+        t = time.perf_counter()
+        res = func(*args)
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+        k += 1
+    return best, res
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame recognition benchmark")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--classes", type=int, default=5)
+    parser.add_argument("--seg", type=int, default=5)
+    args = parser.parse_args()
+
+    glove_list = createGloves(args.frames)
+    model = createModel(args.classes)
+
+    run_list = [("extractor + model", runExtractor, (glove_list, model, args.seg)),
+                ("kernel, pure Python", runKernel, (glove_list, model, args.seg, False))]
+    if frameKernel.hasCompiledKernel():
+        run_list.append(("kernel, Numba", runKernel, (glove_list, model, args.seg, True)))
+    else:
+        print("Numba is not installed, the compiled kernel is skipped.")
+
+    reference = None
+    for title, func, run_args in run_list:
+        t, res = timeRun(func, *run_args)
+        if reference is None:
+            reference = res
+        print("%-22s %8.2f us/frame   same result: %s" % (title, t / args.frames * 1e6, res == reference))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import io
+import math
+import struct
+
+from recoDataStructure import *
+
+# Recordings and models can be compressed, the codec is chosen by the extension of the file:
+#   .gz -> gzip, .xz/.lzma -> lzma, .zst -> zstandard (if the module is installed)
+# A recording whose name contains .gdq is stored with the delta + quantised codec below,
+# which can itself be compressed, e.g. "flat.gdq.gz".
+
+GDQ_MAGIC = b"GDQ1"
+
+# Quantisation step for each field of a glove record (see GLOVE_RECORD_SIZE)
+FINGER_STEP_LIST = [0.001]*3 + [0.000001]*9 + [0.001] + [0.001]*3 + [0.001]*2
+GLOVE_STEP_LIST = [0.0001, 1, 0.0001, 1, 1] + [0.001]*3 + [0.000001]*9 + FINGER_STEP_LIST * 5
+
+
+def getCompression(file_path):
+    """Return the name of the compression used for a file according to its extension, or None"""
+    if file_path.endswith(".gz"):
+        return "gzip"
+    if file_path.endswith(".xz") or file_path.endswith(".lzma"):
+        return "lzma"
+    if file_path.endswith(".zst"):
+        return "zstd"
+    return None
+
+def isDeltaQuantized(file_path):
+    """Whether a recording is stored with the delta + quantised codec"""
+    return ".gdq" in file_path
+
+def openFile(file_path, mode='r'):
+    """Open a file, compressed or not according to its extension.
+        mode is one of 'r', 'w', 'rb', 'wb'; text modes are utf-8"""
+    compression = getCompression(file_path)
+    binary = 'b' in mode
+    base_mode = mode.replace('b', '').replace('t', '')
+    # the compression modules are only imported for compressed files, to start faster
+    if compression == "gzip":
+        import gzip
+        return gzip.open(file_path, base_mode + ('b' if binary else 't'))
+    if compression == "lzma":
+        import lzma
+        return lzma.open(file_path, base_mode + ('b' if binary else 't'))
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise IOError("The zstandard module is needed to open "+file_path)
+        if base_mode == 'r':
+            f = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+        else:
+            f = zstandard.ZstdCompressor().stream_writer(open(file_path, 'wb'), closefd=True)
+        if binary:
+            return f
+        return io.TextIOWrapper(f, encoding='utf-8')
+    if binary:
+        return open(file_path, base_mode + 'b')
+    return open(file_path, base_mode)
+
+
+def encodeVarint(v, out):
+    """Append a signed integer to a bytearray as a zigzag varint"""
+    if v >= 0:
+        v = v << 1
+    else:
+        v = ((-v) << 1) - 1
+    while v > 0x7f:
+        out.append((v & 0x7f) | 0x80)
+        v >>= 7
+    out.append(v)
+
+def decodeVarint(buf, pos):
+    """Read a zigzag varint from buf at pos, return (value, new pos).
+        Raise IndexError if buf ends in the middle of the number"""
+    res = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        res |= (b & 0x7f) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    if res & 1:
+        return -((res + 1) >> 1), pos
+    return res >> 1, pos
+
+
+class DeltaQuantizedWriter:
+    """Write gloves to a binary stream: every field is quantised with its step and stored
+        as the varint of the difference with the previous frame. Every keyframe_interval frames
+        the values are stored as they are so that a reader can start from there."""
+    def __init__(self, f, step_list=GLOVE_STEP_LIST, keyframe_interval=256):
+        self._file = f
+        self._step_list = step_list
+        self._keyframe_interval = keyframe_interval
+        self._previous = None
+        self._frame_nb = 0
+
+        header = bytearray(GDQ_MAGIC)
+        encodeVarint(len(step_list), header)
+        encodeVarint(keyframe_interval, header)
+        header += struct.pack('<%dd' % len(step_list), *step_list)
+        self._file.write(bytes(header))
+
+    def encodeGlove(self, glove, out):
+        rec = glove.toRecord()
+        q_list = [int(round(v / step)) for v, step in zip(rec, self._step_list)]
+        if self._frame_nb % self._keyframe_interval == 0:
+            self._previous = [0]*len(q_list)
+        previous = self._previous
+        i = 0
+        while i < len(q_list):
+            encodeVarint(q_list[i] - previous[i], out)
+            i += 1
+        self._previous = q_list
+        self._frame_nb += 1
+
+    def writeGloves(self, glove_list):
+        out = bytearray()
+        for glove in glove_list:
+            self.encodeGlove(glove, out)
+        self._file.write(bytes(out))
+
+    def close(self):
+        self._file.close()
+
+
+class DeltaQuantizedReader:
+    """Read back the gloves written by DeltaQuantizedWriter, one chunk of the stream at a time"""
+    def __init__(self, f, chunk_size=65536):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+
+        if self.readBytes(len(GDQ_MAGIC)) != GDQ_MAGIC:
+            raise IOError("Not a delta quantised glove recording")
+        size = self.readVarint()
+        self._keyframe_interval = self.readVarint()
+        self._step_list = list(struct.unpack('<%dd' % size, self.readBytes(8 * size)))
+        # number of decimals of each step, to give back clean values
+        self._digit_list = [max(0, int(math.ceil(-math.log10(step)))) for step in self._step_list]
+        self._previous = None
+        self._frame_nb = 0
+
+    def fill(self):
+        """Keep the unread bytes and append a new chunk, return False at the end of the stream"""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def readBytes(self, n):
+        while len(self._buffer) - self._pos < n:
+            if not self.fill():
+                raise IOError("Unexpected end of the recording")
+        res = self._buffer[self._pos:self._pos+n]
+        self._pos += n
+        return res
+
+    def readVarint(self):
+        while True:
+            try:
+                v, self._pos = decodeVarint(self._buffer, self._pos)
+                return v
+            except IndexError:
+                if not self.fill():
+                    raise IOError("Unexpected end of the recording")
+
+    def readRecord(self):
+        """Return the next glove record, or None at the end of the stream"""
+        if self._frame_nb % self._keyframe_interval == 0:
+            self._previous = [0]*len(self._step_list)
+        previous = self._previous
+        n = len(self._step_list)
+        while True:
+            start = self._pos
+            try:
+                q_list = [0]*n
+                pos = start
+                i = 0
+                while i < n:
+                    v, pos = decodeVarint(self._buffer, pos)
+                    q_list[i] = previous[i] + v
+                    i += 1
+                self._pos = pos
+                break
+            except IndexError:
+                self._pos = start
+                if not self.fill():
+                    if len(self._buffer) != self._pos:
+                        print("The recording ends with an incomplete frame, it is ignored.")
+                    return None
+        self._previous = q_list
+        self._frame_nb += 1
+        return [round(q * step, d) for q, step, d in zip(q_list, self._step_list, self._digit_list)]
+
+    def __iter__(self):
+        """Yield the gloves of the stream one by one"""
+        rec = self.readRecord()
+        while rec is not None:
+            yield gloveFromRecord(rec)
+            rec = self.readRecord()
+
+    def close(self):
+        self._file.close()
@@ -1,19 +1,42 @@
+import copy
+import marshal
+import math
+import os
+
 from recoDataStructure import *
+from recoUtils import kMeans
+import captureCodec
 
-class Rubine:
-    """This is a classifier using the algorithm introduced by Rubine"""
+# the part of the samples of a class used for the training, the rest is kept to check the precision
+DEFAULT_TRAIN_RATIO = 0.8
+# how many samples of a user a class of the base model is worth, see Rubine.setBaseModel
+DEFAULT_PRIOR_WEIGHT = 10
+# the number of training samples needed by a class adapted from a base model
+ADAPTED_MIN_SAMPLE_NB = 1
+
+class Classifier:
+    """The interface of the classifiers used by the RecoPipeline.
+        It manages the gesture classes and their samples, the precision check and the model file;
+        a classifier implements train, which builds its model for a gesture class,
+        getScores, which gives a score per trained class for a list of samples, and updateModel"""
     def __init__(self, feature_file):
+        """feature_file --> the file listing the names of the features, or the list of the names"""
         self._class_list = list()
+        # gesture class name -> index in the class list
+        self._class_index = dict()
         self._feature_file = feature_file
         self._feature_list = self.createFeatureListFromFile()
-        
-        # empty matrix
-        self._cc_matrix = Matrix(len(self._feature_list))
-        self._inverted_cc_matrix = None
+        self._train_ratio = DEFAULT_TRAIN_RATIO
+        # the maximum number of samples kept per class, see setSampleBudget
+        self._sample_budget = None
+        self._budget_policy = 'reservoir'
+        self._budget_tolerance = DEFAULT_BUDGET_TOLERANCE
     
     
     def createFeatureListFromFile(self):
         """Initiate the feature list from file"""
+        if isinstance(self._feature_file, list):
+            return [Feature(name) for name in self._feature_file]
         fea_file = open(self._feature_file, 'r')
         lines = fea_file.readlines()
         fea_file.close()
@@ -21,16 +44,15 @@ class Rubine:
         feature_list = list()
         # Create a list of Features
         for line in lines:
-            f = Feature(line[0:-1])
-            feature_list.append(f)
+            # the last line may have no end of line
+            name = line.rstrip("\r\n")
+            if name != "":
+                feature_list.append(Feature(name))
         return feature_list
 
     def hasGestureClass(self, gclass_name):
         """Verify if a geture class exists already in the classifier"""
-        for c in self._class_list:
-            if c._name == gclass_name:
-                return True
-        return False
+        return gclass_name in self._class_index
 
     def createEmptyFeatureList(self):
         f_list = list()
@@ -42,97 +64,216 @@ class Rubine:
         """Create a gesture class with empty sampleList and weights"""
         
         c = GestureClass(gclass_name, self.createEmptyFeatureList())
-        self._class_list.append(c)
+        self.addGestureClass(c)
         print("New gesture classe <",gclass_name,"> has been added.")
 
+    def addGestureClass(self, gclass):
+        """Add a gesture class to the classifier. If a class with the same name exists already,
+            it is replaced so that no class appears twice in the common covariance matrix.
+            Return False if a class was replaced"""
+        if self._sample_budget is not None:
+            gclass.setSampleBudget(self._sample_budget, self._budget_policy, self._budget_tolerance, train_ratio=self._train_ratio)
+        index = self._class_index.get(gclass._name)
+        if index is not None:
+            print("The gesture class <",gclass._name,"> exists already, it is replaced.")
+            self._class_list[index] = gclass
+            self.updateModel()
+            return False
+        self._class_index[gclass._name] = len(self._class_list)
+        self._class_list.append(gclass)
+        return True
+
     def getGestureClassByName(self, gclass_name):
-        for g in self._class_list:
-            if g._name == gclass_name:
-                return g
-        return None
+        index = self._class_index.get(gclass_name)
+        if index is None:
+            return None
+        return self._class_list[index]
+
+    def mergeClassifier(self, other):
+        """Merge the gesture classes of another classifier into this one.
+            The samples of a class known by both are appended to our class, which has to be trained again"""
+        for c in other._class_list:
+            gclass = self.getGestureClassByName(c._name)
+            if gclass is None:
+                new_class = GestureClass(c._name, self.createEmptyFeatureList())
+                for s in c._sample_list:
+                    new_class.addSample(list(s))
+                self.addGestureClass(new_class)
+            else:
+                for s in c._sample_list:
+                    gclass.addSample(list(s))
+                print("Samples of <",c._name,"> have been merged, the class has to be trained again.")
 
     def addRecoTupleForTraining(self, rt, gclass_name):
         """Add a frame of data into the sample list of a given gesture class"""
         gclass = self.getGestureClassByName(gclass_name)
         if gclass is not None:
-            gclass._sample_list.append(rt._s_list)
+            gclass.addSample(rt._s_list)
         else:
             print("The gesture class <",gclass_name,"> doesn't exist.")
 
-    def calculateCommonCovarianceMatrix(self):
-        """Get the common covariance matrix by using the covariance matrix of each gesture class"""
-        i = 0
-        j = 0
-        while i < self._cc_matrix._size:
-            while j < self._cc_matrix._size:
-                res = 0
-                sample_nb = 0
-                for gclass in self._class_list:
-                    res += gclass._co_matrix.get(i,j)
-                    sample_nb += len(gclass._sample_list)
-                res = res / (sample_nb - len(self._class_list))
-                self._cc_matrix.set(i,j,round(res,GP))
-                j += 1
-            j = 0
-            i += 1
-        print("Common Covariance Matrix is done")
-        #print(self._cc_matrix)
-        self._inverted_cc_matrix = self._cc_matrix.inverted()
-        if self._inverted_cc_matrix is not None:
-            print("Inversed CCMatrix is done")
-            #print(self._inverted_cc_matrix)
-        else:
-            print("Can't get inversed CCMatrix")
+    def setTrainRatio(self, ratio):
+        """The part of the samples of a class used by train, 0.8 by default"""
+        self._train_ratio = ratio
+        if self._sample_budget is not None:
+            for c in self._class_list:
+                c._train_ratio = ratio
+
+    def setSampleBudget(self, budget, policy='reservoir', tolerance=DEFAULT_BUDGET_TOLERANCE):
+        """Keep at most budget samples per class, chosen by 'reservoir' or 'kcenter'
+            (see GestureClass.setSampleBudget). The classes with more samples are reduced now,
+            the ones added later too"""
+        self._sample_budget = budget
+        self._budget_policy = policy
+        self._budget_tolerance = tolerance
+        for c in self._class_list:
+            c.setSampleBudget(budget, policy, tolerance, train_ratio=self._train_ratio)
+
+    def getFeatureNames(self):
+        return [f._name for f in self._feature_list]
 
+    def getTrainedClassNames(self):
+        """The names of the classes which can be recognized, in the order of the score lists"""
+        return [c._name for c in self._class_list if c._train_sample_nb > 0]
+
+    def createSnapshot(self):
+        """Return a copy of the classifier which can be trained in another thread while this one
+            keeps recognizing: the classes and their cached statistics are copied, the samples are shared"""
+        snapshot = copy.copy(self)
+        snapshot._class_list = [c.copy() for c in self._class_list]
+        snapshot._class_index = dict(self._class_index)
+        return snapshot
+
+    def swapModel(self, snapshot):
+        """Replace the model used for the recognition by the one of a trained snapshot,
+            with a single assignment so that it can be called from any thread"""
+        raise NotImplementedError
+
+    def installSnapshot(self, snapshot):
+        """Take the classes of a trained snapshot, except the ones which got new samples since the
+            snapshot was taken, and its model. Called from the thread which owns the classifier.
+            Return the names of the classes which got new samples: they keep them with the trained
+            weights of the snapshot, and have to be trained again (see ModelTrainer.poll)"""
+        stale_list = list()
+        for c in snapshot._class_list:
+            index = self._class_index.get(c._name)
+            if index is None:
+                continue
+            live = self._class_list[index]
+            if live._version == c._version:
+                self._class_list[index] = c
+            else:
+                # the weights are the ones of the model served until the next training
+                live._train_sample_nb = c._train_sample_nb
+                live._feature_list = c._feature_list
+                live._base_weight = c._base_weight
+                stale_list.append(c._name)
+        self.swapModel(snapshot)
+        return stale_list
+
+    def updateModel(self):
+        """Called when the gesture classes were replaced or loaded from file"""
+        pass
 
     def train(self, gclass_name):
-        """Use 80 percent of sample list to calculate weight for each feature of a gesture class"""
-        gclass = self.getGestureClassByName(gclass_name)
-        if gclass is None:
-            print("The gesture",gclass_name,"doesn't exist.")
-        else:
-            gclass._train_sample_nb = int(len(gclass._sample_list) * 0.8)
-            if gclass._train_sample_nb < 20:
-                # not enough samples
-                #print("not enough samples")
-                return 1
+        """Build the model for a gesture class with its samples.
+            Return 0 if done, 1 if there are not enough samples"""
+        raise NotImplementedError
+
+    def setBaseModelFile(self, fpath, prior_weight):
+        """Called when a model file refers to the base model it was adapted from"""
+        print("The base model",fpath,"is ignored by this classifier.")
+
+    def getBaseModelFile(self):
+        """Return (file, prior weight) of the base model the classifier is adapted from, or None"""
+        return None
+
+    def canTrainFromStatistics(self):
+        """Whether trainFromStatistics is implemented, i.e. the classifier can be trained out of core"""
+        return False
+
+    def trainFromStatistics(self, stats_dict, sample_nb_dict):
+        """Build the model from the SampleStatistics of the training samples of some classes,
+            for the classifiers whose model only depends on them (see RecoPipeline.trainOutOfCore).
+            sample_nb_dict --> class name -> number of samples, training and test ones.
+            Return a dict class name -> 0 if done, 1 if there are not enough samples"""
+        raise NotImplementedError
+
+    def getScores(self, sample_list):
+        """Return, for each sample, the list of scores of the trained classes (the higher the better)"""
+        raise NotImplementedError
+
+    def getModel(self):
+        """The model the classifier recognizes with, replaced as a whole by each training.
+            None if the classifier has no such model"""
+        return None
+
+    def getProbabilities(self, sample_list):
+        """Like getScores, but the scores of a sample are turned into probabilities which sum to 1"""
+        raise NotImplementedError
+
+    def fit(self, sample_list, label_list):
+        """Train the classifier from scratch with a list of samples and their class names"""
+        for c in self._class_list:
+            c.clearSamples()
+        return self.partialFit(sample_list, label_list)
+
+    def partialFit(self, sample_list, label_list):
+        """Add samples to the classes (created if needed) and train again the classes which got new samples.
+            Return a dict class name -> result of train"""
+        name_list = list()
+        for s, name in zip(sample_list, label_list):
+            if not self.hasGestureClass(name):
+                self.createGestureClass(name)
+            if name not in name_list:
+                name_list.append(name)
+            self.getGestureClassByName(name).addSample(list(s))
+        res = dict()
+        for name in name_list:
+            res[name] = self.train(name)
+        return res
+
+    def predict(self, sample_list):
+        """Return the name of the recognized class for each sample"""
+        name_list = self.getTrainedClassNames()
+        res = list()
+        for score_list in self.getScores(sample_list):
+            if len(score_list) == 0:
+                res.append("")
             else:
-                # 1) calculate covariance matrix for this class
-                gclass.calculateCovarianceMatrix()
-            
-                # 2) calculate common covariance matrix
-                self.calculateCommonCovarianceMatrix()
+                res.append(name_list[score_list.index(max(score_list))])
+        return res
 
-                # 3) calculate weight for each feature and base weight
-                for g in self._class_list:
-                    g.calculateFeatureWeight(self._inverted_cc_matrix)
-                    g.calculateBaseWeight()
-                
-                print("Training has been done successfully. Gesture <",gclass_name,"> was updated.")
-                return 0
+    def predictWithConfidence(self, s_list):
+        """Return (name of the recognized class, its probability) for the sample list of one
+            RecoTuple, ("", 0.0) if no class is trained"""
+        name_list = self.getTrainedClassNames()
+        prob_list = self.getProbabilities([s_list])[0]
+        if len(prob_list) == 0:
+            return "", 0.0
+        p = max(prob_list)
+        return name_list[prob_list.index(p)], p
 
-    def showTrainingResult(self):
-        print("Showing the training result:\n The common variance matrix:")
-        print(self._cc_matrix)
-        for g in self._class_list:
-            g.showTrainingResult()
+    def score(self, sample_list, label_list):
+        """Return the fraction of the samples which are recognized as their label"""
+        if len(sample_list) == 0:
+            return 0.0
+        right_num = 0
+        for name, label in zip(self.predict(sample_list), label_list):
+            if name == label:
+                right_num += 1
+        return right_num / float(len(sample_list))
 
     def recognition(self, s_list):
-        """Take the sample list of one RecoTuple and pass it to each gesutre class, then compare the score given by each class,
-        return the name of the class who gives the highest score"""
-        # get scores and compare them
-        mv = -100000
-        c_name = ""
-        for c in self._class_list:
-            v = c.giveScore(s_list)
-            print("class:",c._name,"has score",v)
-            if v > mv:
-                mv = v
-                c_name = c._name
-                
-        print("The highest score",mv,"is given by class:",c_name)
+        """Return the name of the class recognized for the sample list of one RecoTuple"""
+        c_name = self.predict([s_list])[0]
+        print("The sample is recognized as class:",c_name)
         return c_name
-        
+
+    def showTrainingResult(self):
+        for g in self._class_list:
+            print(g._name, ":", g._train_sample_nb, "training samples")
+
     def calcultatePrecision(self, gclass_name):
         """Use 20 percent of sample list to calculate precision of the classification for a given gesture class
             It's the percentage of right guess
@@ -140,6 +281,9 @@ class Rubine:
         gclass = self.getGestureClassByName(gclass_name)
         total_num = len(gclass._sample_list)
         test_num = total_num - gclass._train_sample_nb
+        if test_num <= 0:
+            print("There is no test sample for <",gclass_name,">")
+            return
         right_num = 0
         i = gclass._train_sample_nb
         while i < total_num:
@@ -154,14 +298,15 @@ class Rubine:
         res = ""
         for c in self._class_list:
             res += str(c)
-        # write to file
-        with open(fpath, 'w') as f:
+        # write to file, compressed if the extension asks for it
+        with captureCodec.openFile(fpath, 'w') as f:
             f.write(res)
         print("The trained classifier has been saved successfully.")
 
     def loadClassifierFromFile(self, fpath):
-        """Load the classifier directly from file so we don't have to do the training each time we lance the program"""
-        c_file = open(fpath, 'r') #'conf/trained_classifier.txt', 'r')
+        """Load the classifier directly from file so we don't have to do the training each time we lance the program.
+            A class which exists already in the classifier is replaced by the one of the file"""
+        c_file = captureCodec.openFile(fpath, 'r') #'conf/trained_classifier.txt', 'r')
         lines = c_file.readlines()
         c_file.close()
 
@@ -170,9 +315,12 @@ class Rubine:
         # Create a list of GestureClass
         i = 0
         while i < len(lines):
-            if lines[i][:-1] == "<class>":
+            if lines[i][:-1] == "<base>":
+                self.setBaseModelFile(lines[i+1][:-1], float(lines[i+2][:-1]))
+                i += 4
+            elif lines[i][:-1] == "<class>":
                 i += 1
-                c = GestureClass(lines[i][:-1], self._feature_list)
+                c = GestureClass(lines[i][:-1], self.createEmptyFeatureList())
                 print("new gesture :",c._name,"added")
                 i += 1
                 k = 0
@@ -185,13 +333,702 @@ class Rubine:
                 c._train_sample_nb = int(lines[i][:-1])
                 i += 2
                 k = 0
-                while k < c._train_sample_nb:
-                    sample = map(float, lines[i+k].split())
-                    c._sample_list.append(sample)
+                # a class trained out of core has no samples
+                while k < c._train_sample_nb and lines[i+k][:-1] != "</samples>":
+                    sample = list(map(float, lines[i+k].split()))
+                    c.addSample(sample)
                     k += 1
-                self._class_list.append(c)
-                i += k+2
+                i += k
+                while i < len(lines) and lines[i][:-1] != "</class>":
+                    if lines[i][:-1] == "<statistics>":
+                        i = c.readStatistics(lines, i+1)
+                    i += 1
+                self.addGestureClass(c)
             else:
                 i += 1
+        self.updateModel()
                     
         print(len(self._class_list)," gesture classes have been loaded.")
+
+    def getCompiledPath(self, fpath):
+        return fpath + ".cache"
+
+    def saveCompiledModel(self, fpath):
+        """Save the classifier loaded from the model file fpath as plain lists with marshal,
+            next to the model file, so that it is loaded without parsing any text"""
+        stat = os.stat(fpath)
+        class_list = list()
+        for c in self._class_list:
+            stats = None
+            if c.isTrainedOutOfCore():
+                stats = [c._sample_nb, c._avg_list, c._co_matrix._rowlist]
+            class_list.append([c._name, [f._weight for f in c._feature_list], c._base_weight,
+                               c._train_sample_nb, c._sample_list[:c._train_sample_nb], stats])
+        data = {'source': [stat.st_mtime_ns, stat.st_size],
+                'features': [f._name for f in self._feature_list],
+                'classes': class_list}
+        base = self.getBaseModelFile()
+        if base is not None:
+            data['base'] = list(base)
+        try:
+            with open(self.getCompiledPath(fpath), 'wb') as f:
+                marshal.dump(data, f)
+        except (IOError, OSError) as e:
+            print("Can't save the compiled model:", e)
+
+    def loadCompiledModel(self, fpath):
+        """Load the compiled model of the model file fpath.
+            Return False if there is none or if it is older than the model file"""
+        try:
+            stat = os.stat(fpath)
+            with open(self.getCompiledPath(fpath), 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return False
+        if data.get('source') != [stat.st_mtime_ns, stat.st_size] or data.get('features') != [f._name for f in self._feature_list]:
+            return False
+        for entry in data['classes']:
+            name, w_list, base_weight, train_sample_nb, sample_list = entry[:5]
+            c = GestureClass(name, self.createEmptyFeatureList())
+            for f, w in zip(c._feature_list, w_list):
+                f._weight = w
+            c._base_weight = base_weight
+            c._train_sample_nb = train_sample_nb
+            for sample in sample_list:
+                c.addSample(sample)
+            if len(entry) > 5 and entry[5] is not None:
+                sample_nb, avg_list, rowlist = entry[5]
+                c._version += 1
+                c._sample_nb = sample_nb
+                c._avg_list = avg_list
+                c._co_matrix._rowlist = rowlist
+                c._avg_key = c.getStatisticsKey()
+                c._co_key = c.getStatisticsKey()
+            self.addGestureClass(c)
+        if 'base' in data:
+            self.setBaseModelFile(data['base'][0], data['base'][1])
+        self.updateModel()
+        return True
+
+    def loadClassifier(self, fpath):
+        """Load the classifier from its compiled model if it is up to date,
+            from the model file otherwise, then compile it for the next time"""
+        if self.loadCompiledModel(fpath):
+            return
+        self.loadClassifierFromFile(fpath)
+        self.saveCompiledModel(fpath)
+
+
+class RubineModel:
+    """The weights of the trained classes of a Rubine classifier, stacked row by row.
+        A model is never modified once built: a training builds a new one which replaces
+        the old one in a single assignment, so the recognition never sees half-updated weights"""
+    def __init__(self, class_index_list, name_list, weight_matrix, base_weight_list):
+        # the position in the class list of the class of each row
+        self._class_index_list = tuple(class_index_list)
+        self._name_list = tuple(name_list)
+        self._weight_matrix = tuple([tuple(w_list) for w_list in weight_matrix])
+        self._base_weight_list = tuple(base_weight_list)
+
+    def getScores(self, sample_list):
+        res = list()
+        for s_list in sample_list:
+            score_list = list()
+            for w_list, v in zip(self._weight_matrix, self._base_weight_list):
+                for w, s in zip(w_list, s_list):
+                    v += w * s
+                score_list.append(v)
+            res.append(score_list)
+        return res
+
+
+class HierarchicalRubineModel(RubineModel):
+    """A RubineModel whose classes are grouped by the distance between their averages. The group of
+        a sample is found first by the discriminants of the groups, which are the ones of a Rubine
+        class whose average is the average of the group (the classes share the common covariance
+        matrix, so the weights of a group are the average of the weights of its classes); then only
+        the classes of the group are scored. The classes of the other groups get the score -inf.
+        With G groups of C classes, a sample costs about G + C / G discriminants instead of C"""
+    def __init__(self, class_index_list, name_list, weight_matrix, base_weight_list, group_list, group_weight_matrix, group_base_weight_list):
+        RubineModel.__init__(self, class_index_list, name_list, weight_matrix, base_weight_list)
+        # the rows of the classes of each group
+        self._group_list = tuple([tuple(row_list) for row_list in group_list])
+        self._group_weight_matrix = tuple([tuple(w_list) for w_list in group_weight_matrix])
+        self._group_base_weight_list = tuple(group_base_weight_list)
+
+    def getGroupNumber(self):
+        return len(self._group_list)
+
+    def getFlatScores(self, sample_list):
+        """The scores of all the classes, as a RubineModel gives them"""
+        return RubineModel.getScores(self, sample_list)
+
+    def getScores(self, sample_list):
+        res = list()
+        for s_list in sample_list:
+            best = 0
+            best_v = None
+            for g, (w_list, v) in enumerate(zip(self._group_weight_matrix, self._group_base_weight_list)):
+                for w, s in zip(w_list, s_list):
+                    v += w * s
+                if best_v is None or v > best_v:
+                    best = g
+                    best_v = v
+            score_list = [float("-inf")] * len(self._base_weight_list)
+            for row in self._group_list[best]:
+                v = self._base_weight_list[row]
+                for w, s in zip(self._weight_matrix[row], s_list):
+                    v += w * s
+                score_list[row] = v
+            res.append(score_list)
+        return res
+
+
+class Rubine(Classifier):
+    """This is a classifier using the algorithm introduced by Rubine"""
+    def __init__(self, feature_file):
+        Classifier.__init__(self, feature_file)
+        
+        # empty matrix
+        self._cc_matrix = Matrix(len(self._feature_list))
+        self._inverted_cc_matrix = None
+        # the statistics the common matrix was computed from, and a counter
+        # bumped each time it changes so the gesture classes can cache their weights
+        self._cc_key = None
+        self._cc_version = 0
+
+        # the weights used for the recognition, replaced as a whole after each training
+        self._model = RubineModel(list(), list(), list(), list())
+
+        # the population model the classes are adapted from, see setBaseModel
+        self._base = None
+        self._base_path = None
+        self._prior_weight = DEFAULT_PRIOR_WEIGHT
+
+        # the number of groups of classes of the hierarchical model, None for a flat model
+        self._group_nb = None
+    
+    
+    def buildWeightMatrix(self):
+        """Stack the weights of the trained classes, in the order of the class list, into a new model for the recognition"""
+        class_index_list = list()
+        weight_matrix = list()
+        base_weight_list = list()
+        for index, c in enumerate(self._class_list):
+            if c.isTrained():
+                class_index_list.append(index)
+                weight_matrix.append([f._weight for f in c._feature_list])
+                base_weight_list.append(c._base_weight)
+        name_list = [self._class_list[index]._name for index in class_index_list]
+        if self._group_nb is not None and len(class_index_list) > self._group_nb:
+            self._model = self.buildHierarchicalModel(class_index_list, name_list, weight_matrix, base_weight_list)
+        else:
+            self._model = RubineModel(class_index_list, name_list, weight_matrix, base_weight_list)
+
+    def setHierarchical(self, group_nb):
+        """Recognize with a HierarchicalRubineModel of group_nb groups of classes, None to score
+            all the classes. Worth it with dozens of classes"""
+        self._group_nb = group_nb
+        self.buildWeightMatrix()
+
+    def buildHierarchicalModel(self, class_index_list, name_list, weight_matrix, base_weight_list):
+        """Group the classes by k-means on their averages, with the Mahalanobis distance of the common
+            covariance matrix C. As the weights of a class are inv(C) * average, the distance between
+            two classes is (weights a - weights b) . (average a - average b), no matrix is needed"""
+        size = len(self._feature_list)
+        point_list = list()
+        n_list = list()
+        for index, w_list in zip(class_index_list, weight_matrix):
+            c = self._class_list[index]
+            point_list.append(list(c.calculateFeatureAverages()) + list(w_list))
+            n_list.append(c.getSampleNumber())
+
+        def distance(a, b):
+            res = 0
+            i = 0
+            while i < size:
+                res += (a[size + i] - b[size + i]) * (a[i] - b[i])
+                i += 1
+            return res
+
+        group_list = kMeans(point_list, n_list, self._group_nb, distance)
+        group_weight_matrix = list()
+        group_base_weight_list = list()
+        for row_list in group_list:
+            total = sum([n_list[row] for row in row_list])
+            avg_list = [sum([n_list[row] * point_list[row][i] for row in row_list]) / total for i in range(size)]
+            w_list = [sum([n_list[row] * point_list[row][size + i] for row in row_list]) / total for i in range(size)]
+            group_weight_matrix.append(w_list)
+            group_base_weight_list.append(-sum([w * a for w, a in zip(w_list, avg_list)]) / 2)
+        return HierarchicalRubineModel(class_index_list, name_list, weight_matrix, base_weight_list,
+                                       group_list, group_weight_matrix, group_base_weight_list)
+
+    def updateModel(self):
+        if self._base is not None and self.adaptToBaseModel():
+            # some classes of the base model have no weights yet
+            self.updateAdaptedWeights()
+        self.buildWeightMatrix()
+
+    def getTrainedClassNames(self):
+        return list(self._model._name_list)
+
+    def getModel(self):
+        """The RubineModel (or HierarchicalRubineModel) of the trained classes"""
+        return self._model
+
+    def setBaseModel(self, base, prior_weight=DEFAULT_PRIOR_WEIGHT, base_path=None):
+        """Adapt this classifier, e.g. the one of a user, from a base model trained with the samples
+            of many users: the classes of the base model are recognized at once, and the samples of
+            the user move the averages and the covariance matrices away from the ones of the base.
+            prior_weight --> how many samples of the user a class of the base model is worth
+            base_path --> the file of the base model, saved with the classifier"""
+        self._base = base
+        self._base_path = base_path
+        self._prior_weight = prior_weight
+        self.adaptToBaseModel()
+        self.updateAdaptedWeights()
+
+    def loadBaseModel(self, fpath, prior_weight=DEFAULT_PRIOR_WEIGHT):
+        base = Rubine(self._feature_file)
+        base.loadClassifier(fpath)
+        self.setBaseModel(base, prior_weight, fpath)
+
+    def getBaseModelFile(self):
+        if self._base_path is None:
+            return None
+        return (self._base_path, self._prior_weight)
+
+    def setBaseModelFile(self, fpath, prior_weight):
+        """The classes are adapted from the base model by updateModel, at the end of the loading,
+            without changing the weights saved in the file"""
+        if not os.path.isfile(fpath):
+            print("The base model",fpath,"doesn't exist, the classes of the user aren't adapted.")
+            return
+        self._base = Rubine(self._feature_file)
+        self._base.loadClassifier(fpath)
+        self._base_path = fpath
+        self._prior_weight = prior_weight
+
+    def adaptToBaseModel(self):
+        """Give each class of the base model as a prior to the class of the same name.
+            Return True if a class had to be created"""
+        created = False
+        for b in self._base._class_list:
+            if b._train_sample_nb == 0:
+                continue
+            b.calculateCovarianceMatrix()
+            gclass = self.getGestureClassByName(b._name)
+            if gclass is None:
+                self.createGestureClass(b._name)
+                gclass = self.getGestureClassByName(b._name)
+                created = True
+            if gclass.isTrainedOutOfCore():
+                # it has enough samples
+                continue
+            if gclass._prior is not b or gclass._prior_weight != self._prior_weight:
+                gclass.setPrior(b, self._prior_weight)
+        return created
+
+    def updateAdaptedWeights(self):
+        for g in self._class_list:
+            if g.isTrained():
+                g.calculateCovarianceMatrix()
+        self.updateWeights()
+
+    def saveClassifierToFile(self, fpath):
+        """The file of a classifier adapted from a base model starts with the base model file,
+            the classes only keep the samples of the user"""
+        if self._base_path is None:
+            Classifier.saveClassifierToFile(self, fpath)
+            return
+        res = "<base>\n" + self._base_path + "\n" + str(self._prior_weight) + "\n</base>\n"
+        for c in self._class_list:
+            res += str(c)
+        with captureCodec.openFile(fpath, 'w') as f:
+            f.write(res)
+        print("The adapted classifier has been saved successfully.")
+
+    def createSnapshot(self):
+        snapshot = Classifier.createSnapshot(self)
+        # the common matrix is modified in place by the training
+        snapshot._cc_matrix = self._cc_matrix.copy()
+        return snapshot
+
+    def swapModel(self, snapshot):
+        self._model = snapshot._model
+
+    def installSnapshot(self, snapshot):
+        stale_list = Classifier.installSnapshot(self, snapshot)
+        self._cc_matrix = snapshot._cc_matrix
+        self._inverted_cc_matrix = snapshot._inverted_cc_matrix
+        self._cc_key = snapshot._cc_key
+        self._cc_version = snapshot._cc_version
+        return stale_list
+
+    def getCommonCovarianceKey(self):
+        key = list()
+        for gclass in self._class_list:
+            key.append((gclass._co_key, gclass.getSampleNumber()))
+        return tuple(key)
+
+    def calculateCommonCovarianceMatrix(self):
+        """Get the common covariance matrix by using the covariance matrix of each gesture class"""
+        key = self.getCommonCovarianceKey()
+        if key == self._cc_key and self._inverted_cc_matrix is not None:
+            # none of the class matrices changed since the last time
+            return False
+        sample_nb = 0
+        for gclass in self._class_list:
+            sample_nb += gclass.getSampleNumber()
+        i = 0
+        j = 0
+        while i < self._cc_matrix._size:
+            while j < self._cc_matrix._size:
+                res = 0
+                for gclass in self._class_list:
+                    res += gclass._co_matrix.get(i,j)
+                res = res / (sample_nb - len(self._class_list))
+                self._cc_matrix.set(i,j,round(res,GP))
+                j += 1
+            j = 0
+            i += 1
+        self._cc_key = key
+        self._cc_version += 1
+        print("Common Covariance Matrix is done")
+        #print(self._cc_matrix)
+        self._inverted_cc_matrix = self._cc_matrix.inverted()
+        if self._inverted_cc_matrix is not None:
+            print("Inversed CCMatrix is done")
+            #print(self._inverted_cc_matrix)
+        else:
+            print("Can't get inversed CCMatrix")
+        return True
+
+
+    def train(self, gclass_name):
+        """Use 80 percent (the train ratio) of sample list to calculate weight for each feature of a gesture class.
+            The statistics of the other classes are cached, only the ones of this class and the
+            common matrix are computed again"""
+        gclass = self.getGestureClassByName(gclass_name)
+        if gclass is None:
+            print("The gesture",gclass_name,"doesn't exist.")
+        elif gclass.isTrainedOutOfCore():
+            # no new samples since the class was trained out of core
+            print("Gesture <",gclass_name,"> is trained out of core already.")
+            return 1
+        else:
+            gclass._train_sample_nb = int(len(gclass._sample_list) * self._train_ratio)
+            # a class adapted from a base model only needs a few samples
+            min_sample_nb = 20
+            if gclass._prior is not None:
+                min_sample_nb = ADAPTED_MIN_SAMPLE_NB
+            if gclass._train_sample_nb < min_sample_nb:
+                # not enough samples
+                #print("not enough samples")
+                return 1
+            else:
+                # 1) calculate covariance matrix for this class, and for the
+                # classes which never had one (e.g. loaded from file)
+                for g in self._class_list:
+                    if g is gclass or (g._co_key is None and g.isTrained()):
+                        g.calculateCovarianceMatrix()
+            
+                self.updateWeights()
+                print("Training has been done successfully. Gesture <",gclass_name,"> was updated.")
+                return 0
+
+    def updateWeights(self):
+        """Compute the common covariance matrix from the ones of the classes, then the weights"""
+        # 2) calculate common covariance matrix
+        self.calculateCommonCovarianceMatrix()
+
+        # 3) calculate weight for each feature and base weight
+        for g in self._class_list:
+            if g.isTrained():
+                g.calculateFeatureWeight(self._inverted_cc_matrix, self._cc_version)
+        self.buildWeightMatrix()
+
+    def getFisherRatios(self):
+        """The Fisher ratio of each feature, in the order of the feature list: the variance of the
+            averages of the trained classes over the variance inside the classes (the diagonal of
+            the common covariance matrix). A feature with a low ratio hardly separates the classes.
+            Return None if fewer than 2 classes are trained"""
+        gclass_list = [g for g in self._class_list if g.isTrained()]
+        if len(gclass_list) < 2 or self._cc_key is None:
+            return None
+        sample_nb = 0
+        for g in gclass_list:
+            sample_nb += g.getSampleNumber()
+        res = list()
+        f_id = 0
+        while f_id < len(self._feature_list):
+            avg = 0
+            for g in gclass_list:
+                avg += g.getSampleNumber() * g.getFeatureAverage(f_id)
+            avg = avg / sample_nb
+            between = 0
+            for g in gclass_list:
+                between += g.getSampleNumber() * pow(g.getFeatureAverage(f_id) - avg, 2)
+            between = between / (len(gclass_list) - 1)
+            within = self._cc_matrix.get(f_id, f_id)
+            if within > 0:
+                res.append(between / within)
+            else:
+                res.append(float("inf"))
+            f_id += 1
+        return res
+
+    def canTrainFromStatistics(self):
+        return True
+
+    def trainFromStatistics(self, stats_dict, sample_nb_dict):
+        """The covariance matrix of a class only depends on the number of training samples, their
+            sums and the sums of their products, so the classes can be trained from SampleStatistics
+            accumulated over a stream without keeping the samples; the weights are the same"""
+        res = dict()
+        for name, stats in stats_dict.items():
+            if len(stats) < 20:
+                print("Not enough samples for gesture <",name,">")
+                res[name] = 1
+                continue
+            if not self.hasGestureClass(name):
+                self.createGestureClass(name)
+            self.getGestureClassByName(name).setStatistics(stats, sample_nb_dict[name])
+            res[name] = 0
+        if 0 not in res.values():
+            return res
+        # the classes loaded from file have no covariance matrix yet
+        for g in self._class_list:
+            if g._co_key is None and g.isTrained():
+                g.calculateCovarianceMatrix()
+        self.updateWeights()
+        print("Training out of core has been done successfully.")
+        return res
+
+    def showTrainingResult(self):
+        print("Showing the training result:\n The common variance matrix:")
+        print(self._cc_matrix)
+        for g in self._class_list:
+            g.showTrainingResult()
+
+    def recognition(self, s_list):
+        """Take the sample list of one RecoTuple and pass it to each gesutre class, then compare the score given by each class,
+        return the name of the class who gives the highest score"""
+        # get scores and compare them
+        mv = -100000
+        c_name = ""
+        model = self._model
+        for name, v in zip(model._name_list, model.getScores([s_list])[0]):
+            print("class:",name,"has score",v)
+            if v > mv:
+                mv = v
+                c_name = name
+                
+        print("The highest score",mv,"is given by class:",c_name)
+        return c_name
+        
+    def getScores(self, sample_list):
+        """The discriminant of each trained class for each sample, computed with the stacked weights"""
+        return self._model.getScores(sample_list)
+
+    def getProbabilities(self, sample_list):
+        """Rubine's estimate of the probability of each class: 1 / sum_j exp(v_j - v_i)"""
+        res = list()
+        for score_list in self.getScores(sample_list):
+            if len(score_list) == 0:
+                res.append(score_list)
+                continue
+            # shift by the highest score so that exp doesn't overflow
+            mv = max(score_list)
+            e_list = [math.exp(v - mv) for v in score_list]
+            total = sum(e_list)
+            res.append([e / total for e in e_list])
+        return res
+
+
+class EnsembleClassifier(Classifier):
+    """Combine several classifiers: every classifier gets the same training samples and the
+        recognized class is the one with the highest weighted sum of their probabilities.
+        Each classifier is saved to its own model file (see getMemberPath), the weights of the
+        ensemble are the ones it is created with"""
+    def __init__(self, classifier_list, weight_list=None):
+        Classifier.__init__(self, classifier_list[0].getFeatureNames())
+        # the gesture classes are managed by the classifiers themselves
+        self._classifier_list = classifier_list
+        if weight_list is None:
+            weight_list = [1.0] * len(classifier_list)
+        self._weight_list = weight_list
+        self._class_list = classifier_list[0]._class_list
+        self._feature_file = classifier_list[0]._feature_file
+        self._feature_list = classifier_list[0]._feature_list
+        self._train_ratio = classifier_list[0]._train_ratio
+        # the classifiers used for the recognition, replaced by a single assignment (see swapModel)
+        self._model = tuple(classifier_list)
+
+    def setTrainRatio(self, ratio):
+        self._train_ratio = ratio
+        for c in self._classifier_list:
+            c.setTrainRatio(ratio)
+
+    def setSampleBudget(self, budget, policy='reservoir', tolerance=DEFAULT_BUDGET_TOLERANCE):
+        self._sample_budget = budget
+        self._budget_policy = policy
+        self._budget_tolerance = tolerance
+        for c in self._classifier_list:
+            c.setSampleBudget(budget, policy, tolerance)
+
+    def addGestureClass(self, gclass):
+        """Each classifier gets its own copy of the class"""
+        res = True
+        for i, c in enumerate(self._classifier_list):
+            if not c.addGestureClass(gclass if i == 0 else gclass.copy()):
+                res = False
+        return res
+
+    def mergeClassifier(self, other):
+        for c in self._classifier_list:
+            c.mergeClassifier(other)
+        self._model = tuple(self._classifier_list)
+
+    def updateModel(self):
+        for c in self._classifier_list:
+            c.updateModel()
+        self._model = tuple(self._classifier_list)
+
+    def canTrainFromStatistics(self):
+        for c in self._classifier_list:
+            if not c.canTrainFromStatistics():
+                return False
+        return True
+
+    def trainFromStatistics(self, stats_dict, sample_nb_dict):
+        """Only if every classifier builds its model from the statistics, return 1 for a class
+            if one of them didn't have enough samples"""
+        return self.mergeResults([c.trainFromStatistics(stats_dict, sample_nb_dict) for c in self._classifier_list])
+
+    def hasGestureClass(self, gclass_name):
+        return self._classifier_list[0].hasGestureClass(gclass_name)
+
+    def createGestureClass(self, gclass_name):
+        for c in self._classifier_list:
+            c.createGestureClass(gclass_name)
+
+    def addRecoTupleForTraining(self, rt, gclass_name):
+        for c in self._classifier_list:
+            c.addRecoTupleForTraining(rt, gclass_name)
+
+    def train(self, gclass_name):
+        """Train every classifier, return 1 if one of them didn't have enough samples"""
+        res = 0
+        for c in self._classifier_list:
+            r = c.train(gclass_name)
+            if r != 0:
+                res = r
+        self._model = tuple(self._classifier_list)
+        return res
+
+    def fit(self, sample_list, label_list):
+        return self.mergeResults([c.fit(sample_list, label_list) for c in self._classifier_list])
+
+    def partialFit(self, sample_list, label_list):
+        return self.mergeResults([c.partialFit(sample_list, label_list) for c in self._classifier_list])
+
+    def mergeResults(self, res_dict_list):
+        """Merge the dicts class name -> result of train of the classifiers, like train"""
+        res = dict()
+        for res_dict in res_dict_list:
+            for name, r in res_dict.items():
+                if r != 0 or name not in res:
+                    res[name] = r
+        self._model = tuple(self._classifier_list)
+        return res
+
+    def getTrainedClassNames(self, model=None):
+        """The classes trained by at least one classifier"""
+        if model is None:
+            model = self._model
+        name_list = list()
+        for c in model:
+            for name in c.getTrainedClassNames():
+                if name not in name_list:
+                    name_list.append(name)
+        return name_list
+
+    def getProbabilities(self, sample_list):
+        """The weighted sum of the probabilities given by the classifiers, in one pass over the samples"""
+        # the same models for all the samples, even if they are swapped meanwhile
+        model = self._model
+        name_list = self.getTrainedClassNames(model)
+        res = [[0.0] * len(name_list) for s in sample_list]
+        for c, w in zip(model, self._weight_list):
+            # the position of the classes of this classifier in the combined list
+            column_list = [name_list.index(name) for name in c.getTrainedClassNames()]
+            for row, p_list in zip(res, c.getProbabilities(sample_list)):
+                for column, p in zip(column_list, p_list):
+                    row[column] += w * p
+        total = sum(self._weight_list)
+        for row in res:
+            for i in range(len(row)):
+                row[i] /= total
+        return res
+
+    def getScores(self, sample_list):
+        return self.getProbabilities(sample_list)
+
+    def showTrainingResult(self):
+        for c, w in zip(self._classifier_list, self._weight_list):
+            print("Classifier", c.__class__.__name__, "with weight", w)
+            c.showTrainingResult()
+
+    def getGestureClassByName(self, gclass_name):
+        return self._classifier_list[0].getGestureClassByName(gclass_name)
+
+    def createSnapshot(self):
+        snapshot = copy.copy(self)
+        snapshot._classifier_list = [c.createSnapshot() for c in self._classifier_list]
+        snapshot._class_list = snapshot._classifier_list[0]._class_list
+        return snapshot
+
+    def swapModel(self, snapshot):
+        """The trained classifiers of the snapshot recognize until installSnapshot, all of them at once"""
+        self._model = tuple(snapshot._classifier_list)
+
+    def installSnapshot(self, snapshot):
+        stale_list = list()
+        for c, s in zip(self._classifier_list, snapshot._classifier_list):
+            for name in c.installSnapshot(s):
+                if name not in stale_list:
+                    stale_list.append(name)
+        self._class_list = self._classifier_list[0]._class_list
+        self._model = tuple(self._classifier_list)
+        return stale_list
+
+    def getMemberPath(self, fpath, i):
+        """The model file of the i-th classifier: fpath for the first one, e.g. model.1.txt for the second"""
+        if i == 0:
+            return fpath
+        root, ext = os.path.splitext(fpath)
+        if ext in (".gz", ".xz", ".lzma", ".zst"):
+            root, ext2 = os.path.splitext(root)
+            ext = ext2 + ext
+        return root + "." + str(i) + ext
+
+    def saveClassifierToFile(self, fpath):
+        for i, c in enumerate(self._classifier_list):
+            c.saveClassifierToFile(self.getMemberPath(fpath, i))
+
+    def loadClassifierFromFile(self, fpath):
+        for i, c in enumerate(self._classifier_list):
+            c.loadClassifierFromFile(self.getMemberPath(fpath, i))
+        self._class_list = self._classifier_list[0]._class_list
+        self._model = tuple(self._classifier_list)
+
+    def saveCompiledModel(self, fpath):
+        for i, c in enumerate(self._classifier_list):
+            c.saveCompiledModel(self.getMemberPath(fpath, i))
+
+    def loadClassifier(self, fpath):
+        for i, c in enumerate(self._classifier_list):
+            c.loadClassifier(self.getMemberPath(fpath, i))
+        self._class_list = self._classifier_list[0]._class_list
+        self._model = tuple(self._classifier_list)
@@ -1,8 +1,23 @@
-import sys, os
+import sys, os, time
 from PySide import QtCore, QtGui, QtNetwork
 
-import recoDataStructure as rds
 from recoPipeline import RecoPipeline
+from recoWorker import RecoWorker, MODE_TRAINING, MODE_RECOGNITION, MODE_RECORDING
+from dataRecorder import GloveRecorder
+from framePreprocessing import FramePreprocessor, HandProfile
+from positionFilter import FingerPositionFilter
+from gesturePublisher import GesturePublisher, createTransport
+
+# the model trained with the samples of all the users, the models of new users are adapted from it
+BASE_MODEL_PATH = "conf/base_classifier.txt"
+# the maximum number of samples kept per gesture, however long the user trains
+SAMPLE_BUDGET = 500
+# period of the refresh of the recognition results, in ms
+DISPLAY_PERIOD = 40
+# when the recognition is late by more than this (in s), only the newest frame of each glove is recognized
+MAX_RECOGNITION_DELAY = 0.05
+# the recognized gestures are sent to the other applications there (see gesturePublisher), None not to send them
+GESTURE_EVENT_ADDRESS = "udp:127.0.0.1:6001"
 
 class ARTGloveClient(QtGui.QMainWindow):
     def __init__(self):
@@ -132,39 +147,80 @@ class ARTGloveClient(QtGui.QMainWindow):
         # Core application part
         self._uname = ""
         self._gname = ""
-        self._new_frame_arrive = False
         self._tr_rt_running = False
         self._re_rt_running = False
         self._tr_recording = False
-        
-        self._data = rds.ARTGloveFrame()
+
         self._glove_recorder = None
         self._tr_recording_nb = 0 # how many samples are recorded in the file
         
         self._rp = RecoPipeline()
+        self._rp.setPositionFilter(FingerPositionFilter())
+        self._rp.setSampleBudget(SAMPLE_BUDGET)
+        if GESTURE_EVENT_ADDRESS is not None:
+            publisher = GesturePublisher()
+            publisher.addTransport(createTransport(GESTURE_EVENT_ADDRESS))
+            self._rp.setPublisher(publisher)
+
+        # the pipeline runs in a worker thread, the datagrams are only queued here
+        self._worker = RecoWorker(self._rp)
+        self._worker.setMaxDelay(MAX_RECOGNITION_DELAY)
+        self._worker.start()
+        # number of times each gesture was recognized since the recognition started
+        self._re_count_dict = dict()
+        self._re_segment_nb = 0
+
+        # the results of the worker are shown at the display rate, whatever the frame rate
+        self._display_timer = QtCore.QTimer(self)
+        self._display_timer.timeout.connect(self.refreshDisplay)
+        self._display_timer.start(DISPLAY_PERIOD)
+
+        # the trainings are done in background, their results are checked periodically
+        self._training_timer = QtCore.QTimer(self)
+        self._training_timer.timeout.connect(self.checkTrainingResult)
+        self._training_timer.start(100)
         
     def processPendingDatagrams(self):
+        """Drain the datagrams waiting in the socket, each one with its receive time,
+            and queue them for the worker as one batch, in the current mode"""
+        msg_list = list()
         while self.udpSocket.hasPendingDatagrams():
             datagram, host, port = self.udpSocket.readDatagram(self.udpSocket.pendingDatagramSize())
             #str(datagram, encoding='utf-8')
-            if self._tr_rt_running:
-                self.buildGloveFrame(datagram.__str__())
-                if self._new_frame_arrive:
-                    #print(self._data)
-                    self._rp.trainRealTime(self._gname, self._data)
-            elif self._re_rt_running:
-                    self.buildGloveFrame(datagram.__str__())
-                    if self._new_frame_arrive:
-                        reco_gname = self._rp.recognition(self._data)
-                        if reco_gname is not None:
-                            self._re_gname_field.setText(reco_gname)
-            else:
-                if self._tr_recording:
-                    self.buildGloveFrame(datagram.__str__())
-                    if self._new_frame_arrive:
-                        self.recordGloveToFile()
-                        self._tr_recording_nb += 1
-                    
+            msg_list.append((datagram.__str__(), time.monotonic()))
+        if len(msg_list) == 0:
+            return
+        if self._tr_rt_running:
+            self._worker.pushBatch(msg_list, MODE_TRAINING, self._gname)
+        elif self._re_rt_running:
+            self._worker.pushBatch(msg_list, MODE_RECOGNITION)
+        elif self._tr_recording:
+            self._worker.pushBatch(msg_list, MODE_RECORDING, recorder=self._glove_recorder)
+
+    def refreshDisplay(self):
+        """Called by the timer: show the results of the worker since the last call,
+            at most one update of each widget"""
+        res = self._worker.poll()
+        if self._tr_recording:
+            self._tr_recording_nb += res['frames']
+        if res['segments'] == 0:
+            return
+        self._re_gname_field.setText(res['gesture'])
+        for gname, n in res['counts'].items():
+            self._re_count_dict[gname] = self._re_count_dict.get(gname, 0) + n
+        self._re_segment_nb += res['segments']
+        counts = ", ".join([gname+": "+str(n) for gname, n in sorted(self._re_count_dict.items())])
+        # the latencies of the frames since the last refresh, in ms
+        n, network, network_max = res['latency']['network']
+        n, decision, decision_max = res['latency']['decision']
+        self.statusBar().showMessage(str(self._re_segment_nb)+" gestures recognized ("+counts+"), "
+                                     +"latency %.1f ms (max %.1f) + network %.1f ms, "
+                                     % (decision * 1000, decision_max * 1000, network * 1000)
+                                     +str(res['dropped'])+" frames dropped, "+str(res['skipped'])+" skipped")
+
+    def closeEvent(self, event):
+        self._worker.stop()
+        super(ARTGloveClient, self).closeEvent(event)
 
     def trConfirmUserName(self):
         """ If the user does not exist, create a directory with the given name
@@ -184,13 +240,31 @@ class ARTGloveClient(QtGui.QMainWindow):
             self._re_toggle_button.setEnabled(True)
             self._re_file_button.setEnabled(True)
 
-            # load the classifier
-            fname = "conf/"+self._uname+"/trained_classifier.txt"
-            if os.path.isfile(fname):
-                self._rp._classifier.loadClassifierFromFile(fname)
+            # load the hand geometry of the user, it is estimated with the first frames otherwise
+            profile = HandProfile()
+            if os.path.isfile(self.getHandProfilePath()):
+                profile.loadFromFile(self.getHandProfilePath())
+            with self._worker.getLock():
+                self._rp.setPreprocessor(FramePreprocessor(profile=profile))
+
+                # load the classifier, or adapt a new one from the base model of all the users
+                fname = "conf/"+self._uname+"/trained_classifier.txt"
+                if os.path.isfile(fname):
+                    self._rp.loadClassifier(fname)
+                elif os.path.isfile(BASE_MODEL_PATH):
+                    self._rp.loadBaseModel(BASE_MODEL_PATH)
+                    self._tr_msg_box.append("The classifier is adapted from the base model, a few samples per gesture are enough.")
             
             self._tr_msg_box.append("Ready to train for user <"+self._uname+">.")
 
+    def getHandProfilePath(self):
+        return "conf/"+self._uname+"/hand_profile.txt"
+
+    def saveClassifier(self):
+        with self._worker.getLock():
+            self._rp.saveClassifier("conf/"+self._uname+"/trained_classifier.txt")
+            self._rp.saveHandProfile(self.getHandProfilePath())
+
     def trConfirmGestureName(self):
         self._gname = self._tr_gname_field.text()
         if self._gname == "":
@@ -210,9 +284,10 @@ class ARTGloveClient(QtGui.QMainWindow):
         """
         if not self._tr_rt_running:
             # to start
+            with self._worker.getLock():
+                if not self._rp.hasGestureClass(self._gname):
+                    self._rp.createGestureClass(self._gname)
             self._tr_rt_running = True
-            if not self._rp._classifier.hasGestureClass(self._gname):
-                self._rp._classifier.createGestureClass(self._gname)
             self._tr_rt_toggle_button.setText("Stop")
             self._tr_msg_box.append("Start training for <"+self._gname+">.")
         else:
@@ -220,21 +295,31 @@ class ARTGloveClient(QtGui.QMainWindow):
             self._tr_rt_running = False
             self._tr_rt_toggle_button.setText("Start")
 
-            # start to process training data
-            res = self._rp._classifier.train(self._gname)
+            # the training is done in background, the recognition goes on with the current model;
+            # it starts once the frames already received are added to the samples
+            self._worker.waitIdle()
+            with self._worker.getLock():
+                self._rp.trainInBackground(self._gname)
+            self._tr_msg_box.append("Stop training for <"+self._gname+">. Training in progress...")
+
+    def checkTrainingResult(self):
+        """Called by the timer: take the trainings done in background into account"""
+        with self._worker.getLock():
+            res_list = self._rp.pollTraining()
+        for gname, res in res_list:
             if res == 0:
-                self._rp._classifier.showTrainingResult()
-                self._rp._classifier.saveClassifierToFile("conf/"+self._uname+"/trained_classifier.txt")
-                self._tr_msg_box.append("Stop training for <"+self._gname+">. Classifier saved.")
+                self.saveClassifier()
+                self._tr_msg_box.append("Training for <"+gname+"> is finished. Classifier saved.")
             elif res == 1:
-                self._tr_msg_box.append("Stop training for <"+self._gname+">. Not enough samples so nothing changed.")
+                self._tr_msg_box.append("Training for <"+gname+">: not enough samples so nothing changed.")
 
     def trFileTraining(self):
         """Train the classifier with samples recorded in files """
         f_path = self._tr_file_fpath_field.text()
-        self._rp.trainFromFile(f_path, self._gname)
-        self._rp.calcultatePrecision(self._gname)
-        self._rp._classifier.saveClassifierToFile("conf/"+self._uname+"/trained_classifier.txt") 
+        with self._worker.getLock():
+            self._rp.trainFromFile(f_path, self._gname)
+            self._rp.calcultatePrecision(self._gname)
+        self.saveClassifier()
         self._tr_msg_box.append("Training for <"+self._gname+"> is finished. Classifier saved.")
 
     def trRecordDataToFile(self):
@@ -243,7 +328,8 @@ class ARTGloveClient(QtGui.QMainWindow):
             # to start
             if not os.path.exists("data/"+self._uname):
                 os.makedirs("data/"+self._uname)
-            self._glove_recorder = open("data/"+self._uname+"/"+self._gname+".dat", 'w+')
+            self._glove_recorder = GloveRecorder("data/"+self._uname+"/"+self._gname+".dat")
+            self._glove_recorder.start()
             self._tr_recording = True
             self._tr_recording_nb = 0
             self._tr_record_file_confirm_button.setText("Stop")
@@ -251,8 +337,14 @@ class ARTGloveClient(QtGui.QMainWindow):
         else:
             self._tr_recording = False
             self._tr_record_file_confirm_button.setText("Record")
-            self._glove_recorder.close()
-            self._tr_msg_box.append(str(self._tr_recording_nb)+" samples are saved in data/"+self._uname+"/"+self._gname+".dat")
+            # the frames still queued are recorded before the file is closed
+            self._worker.waitIdle()
+            self._tr_recording_nb += self._worker.poll()['frames']
+            self._glove_recorder.stop()
+            stats = self._glove_recorder.getStatistics()
+            self._tr_msg_box.append(str(stats['written'])+" samples are saved in data/"+self._uname+"/"+self._gname+".dat")
+            if stats['dropped'] != 0:
+                self._tr_msg_box.append(str(stats['dropped'])+" samples were dropped because the disk was too slow.")
         
 
     def reRealtimeRecognition(self):
@@ -262,10 +354,15 @@ class ARTGloveClient(QtGui.QMainWindow):
         """
         if not self._re_rt_running:
             # to start
-            if len(self._rp._classifier._class_list) == 0:
+            if self._rp.getGestureClassNumber() == 0:
                 self._re_msg_box.append("The pipeline is not trained yet.")
             else:
+                # the segment and the motion of the last run are forgotten
+                with self._worker.getLock():
+                    self._rp.reset()
                 self._re_rt_running = True
+                self._re_count_dict = dict()
+                self._re_segment_nb = 0
                 self._re_toggle_button.setText("Stop")
                 self._re_msg_box.append("Start recognition process...")
         else:
@@ -276,52 +373,10 @@ class ARTGloveClient(QtGui.QMainWindow):
 
     def reFileRecognition(self):
         self._re_msg_box.append("Start to do recognition from file.")
-        self._rp.recognitionFromFile(self._re_fpath_field.text())
+        with self._worker.getLock():
+            self._rp.recognitionFromFile(self._re_fpath_field.text())
         self._re_msg_box.append("Recognition from file stopped.") 
 
-    def buildGloveFrame(self, msg):
-        """Convert ART message from string to a Glove object
-           Store the object inside a list (1 or more hands at a time)
-           Set new_frame_arrive to True if the new frame is not empty
-        """
-        lines = msg.split('\n')
-        self._data._fr = int(lines[0].split(' ')[1])
-        self._data._timestamp = float(lines[1].split(' ')[1])
-        gl_line = lines[2].split(' ', 2)
-        self._data._gl = int(gl_line[1])
-        if self._data._gl != 0:
-            data = gl_line[2]
-            data_lines = data.split('][')
-            base = data_lines[0][1:].split(' ')
-            pos = [ float(x) for x in data_lines[1].split(' ') ]
-            ori = [ float(x) for x in data_lines[2].split(' ') ]
-            finger_list = list()
-            finger_name_list = ['pouce', 'index', 'majeur','annulaire','auriculaire']
-            j = 0
-            while j < 5:
-                pos_f = [ float(x) for x in data_lines[3+3*j].split(' ') ]
-                ori_f = [ float(x) for x in data_lines[4+3*j].split(' ') ]
-                if j == 4:
-                    data_f = [ float(x) for x in data_lines[5+3*j][:-2].split(' ') ]
-                else:
-                    data_f = [ float(x) for x in data_lines[5+3*j].split(' ') ]
-                
-                finger = rds.Finger(finger_name_list[j], pos_f, ori_f, data_f[0], data_f[1:4], data_f[4:])
-                finger_list.append(finger)
-                j += 1
-            
-            self._data._glove_list = list()
-            self._data._glove_list.append(rds.Glove(self._data._timestamp, int(base[0]), float(base[1]), int(base[2]), int(base[3]), finger_list, pos, ori))
-            self._new_frame_arrive = True
-        else:
-            self._new_frame_arrive = False
-
-    def recordGloveToFile(self):
-        # Attention, only for one hand
-        glove = self._data._glove_list[0]
-        self._glove_recorder.write(glove.toFile())
-        self._glove_recorder.flush()
-
 
 
 if __name__ == "__main__":
@@ -1,4 +1,53 @@
+import itertools
+import random
+
 from recoDataStructure import *
+import captureCodec
+
+def buildGloveFrame(msg, frame):
+    """Convert an ART message from string to Glove objects stored in an ARTGloveFrame
+       (1 or more hands at a time). Return True if the new frame is not empty
+    """
+    lines = msg.split('\n')
+    frame._fr = int(lines[0].split(' ')[1])
+    frame._timestamp = float(lines[1].split(' ')[1])
+    gl_line = lines[2].split(' ', 2)
+    frame._gl = int(gl_line[1])
+    if frame._gl != 0:
+        data = gl_line[2]
+        data_lines = data.split('][')
+        base = data_lines[0][1:].split(' ')
+        pos = [ float(x) for x in data_lines[1].split(' ') ]
+        ori = [ float(x) for x in data_lines[2].split(' ') ]
+        finger_list = list()
+        j = 0
+        while j < 5:
+            pos_f = [ float(x) for x in data_lines[3+3*j].split(' ') ]
+            ori_f = [ float(x) for x in data_lines[4+3*j].split(' ') ]
+            if j == 4:
+                data_f = [ float(x) for x in data_lines[5+3*j][:-2].split(' ') ]
+            else:
+                data_f = [ float(x) for x in data_lines[5+3*j].split(' ') ]
+            
+            finger = Finger(FINGER_NAME_LIST[j], pos_f, ori_f, data_f[0], data_f[1:4], data_f[4:])
+            finger_list.append(finger)
+            j += 1
+        
+        frame._glove_list = list()
+        frame._glove_list.append(Glove(frame._timestamp, int(base[0]), float(base[1]), int(base[2]), int(base[3]), finger_list, pos, ori))
+        return True
+    else:
+        return False
+
+def getGloveKey(msg):
+    """The id of the glove of an ART message, read without parsing the message.
+        None if the message has no glove"""
+    gl_line = msg.split('\n', 3)[2]
+    start = gl_line.find('[')
+    if start == -1:
+        return None
+    return gl_line[start + 1:gl_line.find(' ', start)]
+
 
 class DataReceiver:
     """This class helps us to read data into the program.
@@ -15,26 +64,112 @@ class DataReceiver:
         # data structure for training from file
         self._gloveDataList = list()
 
+        # file path -> RecordingIndex of the recordings read by frame number or timestamp
+        self._index_dict = dict()
+
     def readDataFromFile(self, filePath):
         """Read a sample file and create a list of ARTGlove data samples"""
-        # read the file into a list
-        f = open(filePath, 'r')
-        lines = f.readlines()
-        f.close()
-        print(len(lines), "are read")
-
-        # create glove data and add it into the glove data list
-        indice = 0
-        limit = len(lines)
-        print(limit)
         n = 0
-        while indice + 53 <= limit:
-            glove = self.createGloveFromFile(lines[indice:indice+53])
-            n += 1
+        for glove in self.iterDataFromFile(filePath):
             self._gloveDataList.append(glove)
-            indice += 53
+            n += 1
         print(n,"samples are created.")
 
+    def iterDataFromFile(self, filePath):
+        """Yield the gloves of a sample file one by one, without reading the whole file in memory.
+            The file can be compressed (.gz, .xz, .zst) and/or stored with the delta codec (.gdq)"""
+        if captureCodec.isDeltaQuantized(filePath):
+            reader = captureCodec.DeltaQuantizedReader(captureCodec.openFile(filePath, 'rb'))
+            try:
+                for glove in reader:
+                    yield glove
+            finally:
+                reader.close()
+            return
+
+        f = captureCodec.openFile(filePath, 'r')
+        try:
+            lines = list()
+            for line in f:
+                lines.append(line)
+                # a glove is stored on 53 lines
+                if len(lines) == 53:
+                    yield self.createGloveFromFile(lines)
+                    lines = list()
+        finally:
+            f.close()
+
+    def getIndex(self, filePath):
+        """The RecordingIndex of a recording, kept until the recording changes.
+            None if the recording can't be indexed (compressed or delta quantised)"""
+        index = self._index_dict.get(filePath)
+        if index is not None and index.isUpToDate():
+            return index
+        from recordingIndex import getRecordingIndex
+        index = getRecordingIndex(filePath)
+        if index is not None:
+            self._index_dict[filePath] = index
+        return index
+
+    def iterFramesByNumber(self, filePath, index, number_list):
+        """Yield the gloves of the frames of number_list (increasing numbers), each one is read
+            from its offset in the recording"""
+        from recordingIndex import GLOVE_LINE_NB
+        f = open(filePath, 'rb')
+        try:
+            for i in number_list:
+                f.seek(index.getOffset(i))
+                lines = [f.readline().decode('utf-8') for k in range(GLOVE_LINE_NB)]
+                yield self.createGloveFromFile(lines)
+        finally:
+            f.close()
+
+    def iterFramesFromFile(self, filePath, start=0, stop=None, step=1):
+        """Yield the gloves of the frames start, start + step, ... before stop, like a slice of the
+            recording. The frames before start are skipped without being read when the recording is
+            indexed, so that a recording can be split into chunks read by parallel readers
+            (see RecordingIndex.getChunks)"""
+        index = self.getIndex(filePath)
+        if index is None:
+            for glove in itertools.islice(self.iterDataFromFile(filePath), start, stop, step):
+                yield glove
+            return
+        if stop is None or stop > len(index):
+            stop = len(index)
+        for glove in self.iterFramesByNumber(filePath, index, range(start, stop, step)):
+            yield glove
+
+    def readFrameFromFile(self, filePath, i):
+        """Return the glove of the frame i of a recording, None if there is no such frame"""
+        for glove in self.iterFramesFromFile(filePath, i, i + 1):
+            return glove
+        return None
+
+    def iterFramesBetween(self, filePath, t_start, t_end):
+        """Yield the gloves of the frames from the timestamp t_start included to t_end excluded"""
+        index = self.getIndex(filePath)
+        if index is None:
+            for glove in self.iterDataFromFile(filePath):
+                if glove._timestamp >= t_end:
+                    break
+                if glove._timestamp >= t_start:
+                    yield glove
+            return
+        start, stop = index.getFrameRange(t_start, t_end)
+        for glove in self.iterFramesFromFile(filePath, start, stop):
+            yield glove
+
+    def sampleFramesFromFile(self, filePath, frame_nb, seed=None):
+        """Return frame_nb gloves picked at random in a recording, in the order of the recording"""
+        index = self.getIndex(filePath)
+        rnd = random.Random(seed)
+        if index is None:
+            glove_list = list(self.iterDataFromFile(filePath))
+            number_list = sorted(rnd.sample(range(len(glove_list)), min(frame_nb, len(glove_list))))
+            return [glove_list[i] for i in number_list]
+        number_list = sorted(rnd.sample(range(len(index)), min(frame_nb, len(index))))
+        return list(self.iterFramesByNumber(filePath, index, number_list))
+
     def createFingerFromFile(self, n, lines):
         """Function called by the createGloveFromFile function"""
         pos_str = lines[0][0:-1].split(' ')
@@ -74,12 +209,11 @@ class DataReceiver:
         ori = list()
         for o in ori_str:
             ori.append(float(o))
-        finger_name_list = ['pouce','index','majeur','annulaire','auriculaire']
         i = 11
         n = 0
         fingers = list()
         while n < 5:
-            fingers.append(self.createFingerFromFile(finger_name_list[n],lines[i+n*8:i+7+n*8]))
+            fingers.append(self.createFingerFromFile(FINGER_NAME_LIST[n],lines[i+n*8:i+7+n*8]))
             n += 1
 
         lr = -1
@@ -88,7 +222,7 @@ class DataReceiver:
         else:
             lr = 1
 
-        g = Glove(lines[1][0:-1], 0, lines[2][0:-1], lr, int(lines[4][0:-1]), fingers, pos, ori)
+        g = Glove(float(lines[1][0:-1]), 0, float(lines[2][0:-1]), lr, int(lines[4][0:-1]), fingers, pos, ori)
         return g
 
     def readRealTimeData(self, g_frame):
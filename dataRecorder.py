@@ -0,0 +1,91 @@
+import threading
+
+from recoUtils import RingBuffer
+import captureCodec
+
+class GloveRecorder:
+    """Record glove frames to a file without blocking the thread which receives them.
+        The frames are pushed into a bounded ring buffer and a background thread
+        writes them to the file in large batches.
+        The format follows the extension of the file, e.g. "flat.dat.gz" is a compressed text
+        recording and "flat.gdq" uses the delta + quantised codec (see captureCodec)."""
+    def __init__(self, file_path, capacity=4096, batch_size=256, policy='drop_newest'):
+        self._file_path = file_path
+        self._batch_size = batch_size
+        self._buffer = RingBuffer(capacity, policy)
+
+        self._file = None
+        self._encoder = None
+        self._writer = None
+        self._running = False
+        self._error = None
+
+        # statistics
+        self._recorded_nb = 0
+        self._written_nb = 0
+        self._batch_nb = 0
+
+    def start(self):
+        """Open the file and start the writer thread"""
+        if captureCodec.isDeltaQuantized(self._file_path):
+            self._file = captureCodec.openFile(self._file_path, 'wb')
+            self._encoder = captureCodec.DeltaQuantizedWriter(self._file)
+        else:
+            self._file = captureCodec.openFile(self._file_path, 'w')
+        self._running = True
+        self._writer = threading.Thread(target=self.writeLoop, name="GloveRecorder")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def record(self, glove):
+        """Called for each new frame, only puts the glove into the buffer.
+            Return False if the frame (or an older one) was dropped because the buffer is full,
+            or because the recorder is stopped"""
+        self._recorded_nb += 1
+        return self._buffer.push(glove)
+
+    def writeLoop(self):
+        """Body of the writer thread: drain the buffer until the recorder is stopped"""
+        try:
+            while True:
+                glove_list = self._buffer.popAll(self._batch_size, 0.5)
+                if len(glove_list) != 0:
+                    self.writeBatch(glove_list)
+                elif not self._running:
+                    break
+            # the frames pushed before the buffer was closed
+            glove_list = self._buffer.popAll(self._batch_size, 0)
+            while len(glove_list) != 0:
+                self.writeBatch(glove_list)
+                glove_list = self._buffer.popAll(self._batch_size, 0)
+        except (IOError, OSError) as e:
+            self._error = e
+            self._buffer.close()
+
+    def writeBatch(self, glove_list):
+        if self._encoder is not None:
+            self._encoder.writeGloves(glove_list)
+        else:
+            self._file.write("".join([g.toFile() for g in glove_list]))
+        self._written_nb += len(glove_list)
+        self._batch_nb += 1
+
+    def stop(self):
+        """Write the frames left in the buffer, then close the file"""
+        if not self._running:
+            return
+        # no frame can be pushed once the buffer is closed, the writer drains it before leaving
+        self._buffer.close()
+        self._running = False
+        self._writer.join()
+        self._file.flush()
+        self._file.close()
+        self._file = None
+        if self._error is not None:
+            print("Error while recording to", self._file_path, ":", self._error)
+
+    def getStatistics(self):
+        """Return a dict with the number of recorded, written, dropped and pending frames"""
+        return {'recorded': self._recorded_nb, 'written': self._written_nb,
+                'dropped': self._buffer.getDroppedNumber(), 'pending': len(self._buffer),
+                'batches': self._batch_nb}
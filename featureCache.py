@@ -0,0 +1,130 @@
+import hashlib
+import os
+from array import array
+
+# number of records read from a cache file at a time
+READ_CHUNK_SIZE = 4096
+
+class CacheWriter:
+    """Append records (lists of numbers of the same size) to a new cache file.
+        The file only appears under its name when commit is called"""
+    def __init__(self, cache, path):
+        self._cache = cache
+        self._path = path
+        self._tmp_path = path + ".tmp" + str(os.getpid())
+        self._file = open(self._tmp_path, 'wb')
+        self._buffer = array('d')
+
+    def write(self, rec):
+        self._buffer.extend(rec)
+        if len(self._buffer) >= 65536:
+            self._buffer.tofile(self._file)
+            self._buffer = array('d')
+
+    def commit(self):
+        self._buffer.tofile(self._file)
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        self._cache.evict(os.path.dirname(self._path))
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class FeatureCache:
+    """A cache of the features extracted from the recordings, so that a recording used again
+        for training or evaluation is neither parsed nor passed to the feature extractor.
+        An entry is named after the hash of the content of the recording and of a string
+        describing what produced the features (feature list, preprocessing, segmentation),
+        so a modified recording or another configuration never gets stale features.
+        The entries are binary files of doubles, in a directory next to the recording by default;
+        the least recently used ones are removed when a directory holds more than max_size bytes."""
+    def __init__(self, cache_dir=None, max_size=256 * 1024 * 1024):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        # (path, modification time, size) -> content hash, to hash a file once per run
+        self._hash_dict = dict()
+        self._hit_nb = 0
+        self._miss_nb = 0
+
+    def getDirectory(self, file_path):
+        if self._cache_dir is not None:
+            return self._cache_dir
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), ".features")
+
+    def getContentHash(self, file_path):
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        res = self._hash_dict.get(key)
+        if res is None:
+            h = hashlib.sha1()
+            with open(file_path, 'rb') as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    h.update(block)
+            res = h.hexdigest()
+            self._hash_dict[key] = res
+        return res
+
+    def getPath(self, file_path, config):
+        """The cache file of the features of a recording produced with a configuration string"""
+        config_hash = hashlib.sha1(config.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.getDirectory(file_path), self.getContentHash(file_path) + "-" + config_hash)
+
+    def lookup(self, file_path, config):
+        """Return the cache file if it exists, None otherwise"""
+        path = self.getPath(file_path, config)
+        if os.path.isfile(path):
+            self._hit_nb += 1
+            # keep it away from the eviction
+            os.utime(path)
+            return path
+        self._miss_nb += 1
+        return None
+
+    def createWriter(self, file_path, config):
+        directory = self.getDirectory(file_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return CacheWriter(self, self.getPath(file_path, config))
+
+    def iterRecords(self, path, record_size):
+        """Yield the records of a cache file as lists"""
+        with open(path, 'rb') as f:
+            while True:
+                buf = array('d')
+                try:
+                    buf.fromfile(f, READ_CHUNK_SIZE * record_size)
+                except EOFError:
+                    # the last chunk is shorter
+                    pass
+                if len(buf) == 0:
+                    break
+                i = 0
+                while i + record_size <= len(buf):
+                    yield buf[i:i + record_size].tolist()
+                    i += record_size
+
+    def evict(self, directory):
+        """Remove the least recently used files of a directory until it is under the size limit"""
+        entry_list = list()
+        total = 0
+        for name in os.listdir(directory):
+            if ".tmp" in name:
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            entry_list.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entry_list.sort()
+        for mtime, size, path in entry_list:
+            if total <= self._max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def getStatistics(self):
+        return {'hits': self._hit_nb, 'misses': self._miss_nb}
@@ -1,64 +1,217 @@
+import math
+
 import recoUtils
 from recoDataStructure import *
 
+# feature name -> the fingers (index in FINGER_NAME_LIST) whose distance it is, None for the hand center
+FEATURE_FINGER_PAIRS = {
+    "DistHandThumb": (None, 0),
+    "DistHandIndex": (None, 1),
+    "DistHandMiddle": (None, 2),
+    "DistHandRing": (None, 3),
+    "DistHandLittle": (None, 4),
+    "DistThumbIndex": (0, 1),
+    "DistThumbMiddle": (0, 2),
+    "DistThumbRing": (0, 3),
+    "DistThumbLittle": (0, 4),
+    "DistIndexMiddle": (1, 2),
+    "DistIndexRing": (1, 3),
+    "DistIndexLittle": (1, 4),
+    "DistMiddleRing": (2, 3),
+    "DistMiddleLittle": (2, 4),
+    "DistRingLittle": (3, 4),
+}
+# the features of conf/feature_list.txt
+DEFAULT_FEATURE_NAME_LIST = ["DistHandThumb", "DistHandIndex", "DistHandMiddle", "DistThumbIndex", "DistIndexMiddle", "DistThumbMiddle"]
+HAND_CENTER = [0.0, 0.0, 0.0]
+
+# default parameters of the AdaptiveFeatureExtractor: the lengths of the segments in frames,
+# the speed of the features (mm/s) above which the hand is moving, and the weight of a new
+# frame in the smoothed features
+DEFAULT_MIN_SEGMENT_LENGTH = 5
+DEFAULT_MAX_SEGMENT_LENGTH = 30
+DEFAULT_MOTION_THRESHOLD = 80.0
+DEFAULT_MOTION_SMOOTHING = 0.3
+# the time between two frames of the tracker, used when the timestamps don't increase
+FRAME_PERIOD = 1.0 / 60
+
 class FeatureExtractor:
     """This class receives samples from DataReciver, then effectuates a segmentation and outputs a tuple"""
-    def __init__(self):
+    def __init__(self, seg_threshold=5, feature_name_list=None):
+        """feature_name_list --> the names of the features to compute (see FEATURE_FINGER_PAIRS),
+            the ones of conf/feature_list.txt by default"""
         # the threshold for a segmentation
-        self._seg_threshold = 5
+        self._seg_threshold = seg_threshold
         # a list containing lists of sample values for segmentation
         self._sample_list = list()
+        # the weight of each sample in the average, given by the preprocessing
+        self._weight_list = list()
         # a flag to tell us whether the segmentation is done and we can retrieve the tuple
         self._seg_activated = False
         # the output data structure
         self._tuple = None
+        # the fingers of each feature, see FEATURE_FINGER_PAIRS
+        self._pair_list = list()
+        self.setFeatureNames(feature_name_list)
     
-    def addSampleFrame(self, g):
+    def setFeatureNames(self, feature_name_list):
+        if feature_name_list is None:
+            feature_name_list = DEFAULT_FEATURE_NAME_LIST
+        pair_list = list()
+        for name in feature_name_list:
+            if name not in FEATURE_FINGER_PAIRS:
+                raise ValueError("Unknown feature " + name)
+            pair_list.append(FEATURE_FINGER_PAIRS[name])
+        self._pair_list = pair_list
+        self.reset()
+
+    def getFeatureNumber(self):
+        return len(self._pair_list)
+
+    def computeFeatures(self, g):
+        """Return the list of the feature values of a frame"""
+        # calculate data for each feature
+        s_list = list()
+        fingers = g._fingers
+        for a, b in self._pair_list:
+            if a is None:
+                s_list.append(recoUtils.distanceOfPosition(HAND_CENTER, fingers[b]._position))
+            else:
+                s_list.append(recoUtils.distanceOfPosition(fingers[a]._position, fingers[b]._position))
+        return s_list
+
+    def addSampleFrame(self, g, weight=1.0):
         """Function to be called whenever a new sample frame arrives
             g --> a data frame, basically a Glove object
+            weight --> the weight of the frame in the average of the segment
+        """
+        self.addFeatureFrame(self.computeFeatures(g), (g._timestamp,g._id,g._quality,g._l_or_r,g._finger_number), weight)
+
+    def addFeatureFrame(self, s_list, header, weight=1.0):
+        """Add the feature values of a frame to the segment
+            header --> (timestamp, id, quality, l_or_r, finger number) of the frame
         """
-        # calculate data for each feature
-        d_hand_thumb = recoUtils.distanceOfPosition([0.0, 0.0, 0.0], g._fingers[0]._position)
-        d_hand_index = recoUtils.distanceOfPosition([0.0, 0.0, 0.0], g._fingers[1]._position)
-        d_hand_middle = recoUtils.distanceOfPosition([0.0, 0.0, 0.0], g._fingers[2]._position)
-        d_thumb_index = recoUtils.distanceOfPosition(g._fingers[0]._position, g._fingers[1]._position)
-        d_index_middle = recoUtils.distanceOfPosition(g._fingers[1]._position, g._fingers[2]._position)
-        d_thumb_middle = recoUtils.distanceOfPosition(g._fingers[0]._position, g._fingers[2]._position)
-        
         # add a new list of sample values
-        s_list = [d_hand_thumb,d_hand_index,d_hand_middle,d_thumb_index,d_index_middle,d_thumb_middle]
-        
         self._sample_list.append(s_list)
+        self._weight_list.append(weight)
 
         # If we have enough samples to do a segmentation, we will
         # activate the output and create a RecoTuple
         if len(self._sample_list) == self._seg_threshold:
-            self._seg_activated = True
+            self.closeSegment(header)
+
+    def closeSegment(self, header):
+        """Create the RecoTuple of the frames of the segment, stamped with the header of its last frame"""
+        self._seg_activated = True
             
-            # get the average value of each feature sample
-            avg_values = [0.0,0.0,0.0,0.0,0.0,0.0]
+        # get the average value of each feature sample
+        avg_values = [0.0] * len(self._sample_list[0])
             
-            for slist in self._sample_list:
-                i = 0
-                while i < len(slist):
-                    avg_values[i] += slist[i]
-                    i += 1
-
-            if self._seg_threshold != 0:
-                i = 0
-                while i < len(avg_values):
-                    avg_values[i] = avg_values[i]/self._seg_threshold
-                    i += 1
+        for slist, w in zip(self._sample_list, self._weight_list):
+            i = 0
+            while i < len(slist):
+                avg_values[i] += w * slist[i]
+                i += 1
+
+        total_weight = sum(self._weight_list)
+        if total_weight != 0:
+            i = 0
+            while i < len(avg_values):
+                avg_values[i] = avg_values[i]/total_weight
+                i += 1
         
-            self._tuple = RecoTuple(g._timestamp,g._id,g._quality,g._l_or_r,g._finger_number, avg_values)
+        self._tuple = RecoTuple(header[0],header[1],header[2],header[3],header[4], avg_values)
 
-            #print("debug: ",avg_values)
+        #print("debug: ",avg_values)
             
-            # Reset the list of sample lists
-            del self._sample_list[:]
+        # Reset the list of sample lists
+        del self._sample_list[:]
+        del self._weight_list[:]
+
+    def getSegmentationConfig(self):
+        """A string describing how the segments are cut, see FeatureCache"""
+        return "seg=" + str(self._seg_threshold)
+
+    def reset(self):
+        """Forget the samples of the segment in progress"""
+        del self._sample_list[:]
+        del self._weight_list[:]
+        self._seg_activated = False
             
 
     def getRecoTuple(self):
         self._seg_activated = False
         return self._tuple
 
+
+class AdaptiveFeatureExtractor(FeatureExtractor):
+    """Cut the segments at the boundaries of the stable poses instead of every seg_threshold frames.
+        The motion energy of a frame is the speed of its features, i.e. how fast the distances between
+        the fingers and the hand change (see updateSpeed). The frames of a pose held still
+        are averaged; the segment is closed when the hand starts moving, if it has at least min_length
+        frames, or when it reaches max_length frames during a long hold. The frames of the moves
+        between two poses belong to no segment, so a transition isn't averaged with the poses around
+        it and a pose is classified once instead of every few frames"""
+    def __init__(self, min_length=DEFAULT_MIN_SEGMENT_LENGTH, max_length=DEFAULT_MAX_SEGMENT_LENGTH,
+                 motion_threshold=DEFAULT_MOTION_THRESHOLD, smoothing=DEFAULT_MOTION_SMOOTHING, feature_name_list=None):
+        self._min_length = min_length
+        self._max_length = max_length
+        self._motion_threshold = motion_threshold
+        self._smoothing = smoothing
+        # (timestamp, smoothed feature values) of the previous frame
+        self._previous = None
+        self._speed = 0.0
+        # the header of the last frame of the segment
+        self._header = None
+        FeatureExtractor.__init__(self, min_length, feature_name_list)
+
+    def getMotionSpeed(self):
+        """The speed of the smoothed features at the last frame, in mm/s"""
+        return self._speed
+
+    def isMoving(self):
+        return self._speed > self._motion_threshold
+
+    def updateSpeed(self, s_list, timestamp):
+        """The speed is the one of the features smoothed over the last frames, so that the jitter of
+            the tracker, which changes every frame, hardly counts next to the moves of the fingers"""
+        if self._previous is None:
+            self._previous = (timestamp, list(s_list))
+            return self._speed
+        t, m_list = self._previous
+        dt = timestamp - t
+        if dt <= 0:
+            dt = FRAME_PERIOD
+        d = 0.0
+        new_list = list()
+        for v, m in zip(s_list, m_list):
+            v = m + self._smoothing * (v - m)
+            d += (v - m) * (v - m)
+            new_list.append(v)
+        self._speed = math.sqrt(d) / dt
+        self._previous = (timestamp, new_list)
+        return self._speed
+
+    def addFeatureFrame(self, s_list, header, weight=1.0):
+        self.updateSpeed(s_list, header[0])
+        if self.isMoving():
+            # the pose held until now ends here
+            if len(self._sample_list) >= self._min_length:
+                self.closeSegment(self._header)
+            else:
+                del self._sample_list[:]
+                del self._weight_list[:]
+            return
+        self._sample_list.append(s_list)
+        self._weight_list.append(weight)
+        self._header = header
+        if len(self._sample_list) >= self._max_length:
+            self.closeSegment(header)
+
+    def getSegmentationConfig(self):
+        return "adaptive=%d,%d,%s,%s" % (self._min_length, self._max_length, self._motion_threshold, self._smoothing)
+
+    def reset(self):
+        FeatureExtractor.reset(self)
+        self._previous = None
+        self._speed = 0.0
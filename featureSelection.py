@@ -0,0 +1,184 @@
+"""Rank the features by their Fisher ratio and select the ones worth computing, on labelled recordings:
+
+    python featureSelection.py [options] GESTURE=FILE [GESTURE=FILE ...]
+
+The candidates are the features of conf/feature_list.txt (or --feature-file, or all the known
+features with --candidates all). The segments are cut once with all of them; a Rubine classifier
+trained on all the segments gives the Fisher ratio of each feature. Then the features are
+selected one at a time (greedy forward selection): each step adds the feature which gives the best
+cross-validated precision with the ones already selected, the Fisher ratio breaking the ties,
+until the precision doesn't improve by more than --min-gain. The selected list is written to
+--output, in the format of conf/feature_list.txt, with the per-frame cost saved."""
+import argparse
+import contextlib
+import os
+import sys
+
+from classifier import Rubine
+from featureExtraction import FeatureExtractor, FEATURE_FINGER_PAIRS
+from sweep import extractFrames, measureCost
+
+def cutSegments(recording_list, name_list, seg_threshold):
+    """Return a dict gesture class name -> list of the feature values of its segments"""
+    sample_dict = dict()
+    fe = FeatureExtractor(seg_threshold, list(name_list))
+    for gclass_name, frame_list in recording_list:
+        sample_list = sample_dict.setdefault(gclass_name, list())
+        for s_list, header, weight in frame_list:
+            fe.addFeatureFrame(s_list, header, weight)
+            if fe._seg_activated:
+                sample_list.append(fe.getRecoTuple()._s_list)
+        fe.reset()
+    return sample_dict
+
+def selectColumns(sample_dict, column_list):
+    res = dict()
+    for name, sample_list in sample_dict.items():
+        res[name] = [[s[i] for i in column_list] for s in sample_list]
+    return res
+
+def trainClassifier(sample_dict, name_list):
+    """A Rubine classifier trained on all the samples. Return None if a class has too few samples"""
+    classifier = Rubine(list(name_list))
+    classifier.setTrainRatio(1.0)
+    sample_list = list()
+    label_list = list()
+    for name, s_list in sample_dict.items():
+        sample_list += s_list
+        label_list += [name] * len(s_list)
+    if 1 in classifier.fit(sample_list, label_list).values():
+        return None
+    return classifier
+
+def crossValidate(sample_dict, name_list, fold_nb):
+    """The precision of a Rubine classifier over fold_nb folds. The folds are contiguous blocks of
+        the segments of each class: the segments next to each other in a recording look alike, so
+        taking every k-th one would test on segments almost seen in the training.
+        Return None if a class has too few samples"""
+    right_nb = 0
+    total_nb = 0
+    k = 0
+    while k < fold_nb:
+        train_dict = dict()
+        test_sample_list = list()
+        test_label_list = list()
+        for name, sample_list in sample_dict.items():
+            begin = len(sample_list) * k // fold_nb
+            end = len(sample_list) * (k + 1) // fold_nb
+            train_dict[name] = sample_list[:begin] + sample_list[end:]
+            test_sample_list += sample_list[begin:end]
+            test_label_list += [name] * (end - begin)
+        classifier = trainClassifier(train_dict, name_list)
+        if classifier is None:
+            return None
+        right_nb += classifier.score(test_sample_list, test_label_list) * len(test_sample_list)
+        total_nb += len(test_sample_list)
+        k += 1
+    return right_nb / total_nb
+
+def selectFeatures(sample_dict, name_list, ratio_list, fold_nb, min_gain, max_nb=None):
+    """Greedy forward selection. Return the list of (selected feature name, precision with it)"""
+    res = list()
+    column_list = list()
+    precision = 0.0
+    while len(column_list) < len(name_list) and (max_nb is None or len(column_list) < max_nb):
+        best = None
+        for i in range(len(name_list)):
+            if i in column_list:
+                continue
+            p = crossValidate(selectColumns(sample_dict, column_list + [i]), [name_list[j] for j in column_list + [i]], fold_nb)
+            if p is None:
+                continue
+            if best is None or (p, ratio_list[i]) > best[0]:
+                best = ((p, ratio_list[i]), i)
+        if best is None:
+            break
+        p = best[0][0]
+        if len(column_list) > 0 and p <= precision + min_gain:
+            break
+        column_list.append(best[1])
+        precision = p
+        res.append((name_list[best[1]], p))
+    return res
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="featureSelection", description="Rank and select the features of the Rubine classifier")
+    parser.add_argument("pairs", nargs="+", metavar="GESTURE=FILE")
+    parser.add_argument("--feature-file", default="conf/feature_list.txt", help="the candidate features")
+    parser.add_argument("--candidates", default=None, help="'all' for all the known features, or comma separated names")
+    parser.add_argument("--seg", type=int, default=5, help="segment length")
+    parser.add_argument("--folds", type=int, default=5, help="number of folds of the cross validation")
+    parser.add_argument("--min-gain", type=float, default=0.0, help="precision a feature must add to be selected")
+    parser.add_argument("--max", type=int, default=None, help="maximum number of selected features")
+    parser.add_argument("--output", default=None, help="write the selected features to this file, e.g. conf/feature_list.txt")
+    parser.add_argument("--filter", action="store_true", help="smooth the finger positions")
+    parser.add_argument("--normalize", action="store_true", help="filter bad frames and normalise the hand size")
+    args = parser.parse_args(argv)
+
+    pair_list = list()
+    for pair in args.pairs:
+        if "=" not in pair:
+            print("Expected GESTURE=FILE, got", pair, file=sys.stderr)
+            return 2
+        pair_list.append(tuple(pair.split("=", 1)))
+    if args.candidates == "all":
+        name_list = list(FEATURE_FINGER_PAIRS)
+    elif args.candidates is not None:
+        name_list = args.candidates.split(",")
+    else:
+        name_list = Rubine(args.feature_file).getFeatureNames()
+    for name in name_list:
+        if name not in FEATURE_FINGER_PAIRS:
+            print("Unknown feature", name, "- known ones:", " ".join(FEATURE_FINGER_PAIRS), file=sys.stderr)
+            return 2
+
+    recording_list, glove_list = extractFrames(pair_list, name_list, args.filter, args.normalize)
+    sample_dict = cutSegments(recording_list, name_list, args.seg)
+    print(" ".join(["%s: %d" % (name, len(s_list)) for name, s_list in sample_dict.items()]), "segments")
+
+    # the training prints its progress
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        full = trainClassifier(sample_dict, name_list)
+        ratio_list = None
+        if full is not None:
+            ratio_list = full.getFisherRatios()
+    if ratio_list is None:
+        print("At least 2 gestures with enough segments are needed.")
+        return 1
+    print("Fisher ratio of the features:")
+    for ratio, name in sorted(zip(ratio_list, name_list), reverse=True):
+        print("  %-16s %12.4f" % (name, ratio))
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        full_precision = crossValidate(sample_dict, name_list, args.folds)
+    if full_precision is None:
+        # the training part of a fold has (folds - 1) / folds of the segments
+        print("Not enough segments for", args.folds, "folds: every gesture needs 20 training segments in each fold.")
+        return 1
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        selection = selectFeatures(sample_dict, name_list, ratio_list, args.folds, args.min_gain, args.max)
+    print("Forward selection, cross-validated precision over", args.folds, "folds:")
+    for name, precision in selection:
+        print("  + %-14s %.4f" % (name, precision))
+    print("All the", len(name_list), "candidates: %.4f" % full_precision)
+    if len(selection) == 0:
+        print("No feature was selected.")
+        return 1
+
+    selected_list = [name for name, precision in selection]
+    column_list = [name_list.index(name) for name in selected_list]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pruned = trainClassifier(selectColumns(sample_dict, column_list), selected_list)
+        full_cost = measureCost(full, args.seg, name_list, glove_list)
+        cost = measureCost(pruned, args.seg, selected_list, glove_list)
+    print("Per-frame cost: %.2f us with the candidates, %.2f us with the selected features (%.0f%% saved)"
+          % (full_cost, cost, 100 * (1 - cost / full_cost)))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write("\n".join(selected_list) + "\n")
+        print("Selected features written to", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
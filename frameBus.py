@@ -0,0 +1,154 @@
+"""A ring buffer of glove frames in shared memory, to pass the frames received by one process
+    (the one which parses the UDP messages of the tracker) to other processes (recognition,
+    recording, visualisation) without pickling them.
+
+    The shared memory starts with a header of HEADER_SIZE unsigned integers, then holds
+    `capacity` slots of SLOT_SIZE doubles: a sequence number followed by a glove as
+    written by Glove.toRecord (GLOVE_RECORD_SIZE numbers).
+    There is a single writer, it never waits for the readers: the frame number i goes to the
+    slot i % capacity, whose sequence number is 2 * i + 1 while it is written and 2 * i + 2
+    once it is done. A reader copies a slot and checks that its sequence number didn't change,
+    the frames overwritten before it could read them are counted as lost."""
+from array import array
+from multiprocessing import shared_memory
+import time
+
+from recoDataStructure import GLOVE_RECORD_SIZE, gloveFromRecord
+
+MAGIC = 0x474C4F56 # "GLOV"
+# magic, record size, capacity, number of frames written
+HEADER_SIZE = 4
+SLOT_SIZE = 1 + GLOVE_RECORD_SIZE
+
+def getBusSize(capacity):
+    return HEADER_SIZE * 8 + capacity * SLOT_SIZE * 8
+
+def attachSharedMemory(name):
+    """Attach to an existing shared memory without letting this process destroy it at exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before Python 3.13 the resource tracker unlinks every segment a process attached to,
+    # it must not know about this one (it may be the tracker of the writer, after a fork)
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class FrameBusWriter:
+    """The publishing side of the bus, created by the process which receives the frames"""
+    def __init__(self, name=None, capacity=1024):
+        self._capacity = capacity
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=getBusSize(capacity))
+        self._header = self._shm.buf[:HEADER_SIZE * 8].cast('Q')
+        self._data = self._shm.buf[HEADER_SIZE * 8:getBusSize(capacity)].cast('d')
+        self._count = 0
+        self._header[0] = MAGIC
+        self._header[1] = GLOVE_RECORD_SIZE
+        self._header[2] = capacity
+        self._header[3] = 0
+
+    def getName(self):
+        """The name the readers attach to"""
+        return self._shm.name
+
+    def publish(self, glove):
+        i = self._count
+        base = (i % self._capacity) * SLOT_SIZE
+        d = self._data
+        d[base] = 2 * i + 1
+        d[base + 1:base + SLOT_SIZE] = array('d', glove.toRecord())
+        d[base] = 2 * i + 2
+        self._count = i + 1
+        self._header[3] = self._count
+
+    def publishFrame(self, g_frame):
+        """Publish every glove of an ARTGloveFrame"""
+        for glove in g_frame._glove_list:
+            self.publish(glove)
+
+    def getPublishedNumber(self):
+        return self._count
+
+    def close(self):
+        """Release the shared memory, which is destroyed: the readers can't attach any more"""
+        if self._shm is None:
+            return
+        self._header.release()
+        self._data.release()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+class FrameBusReader:
+    """A consumer of the bus. Each reader has its own position, it starts with the next frame
+        published after it attached"""
+    def __init__(self, name):
+        self._shm = attachSharedMemory(name)
+        self._header = self._shm.buf[:HEADER_SIZE * 8].cast('Q')
+        if self._header[0] != MAGIC or self._header[1] != GLOVE_RECORD_SIZE:
+            self._header.release()
+            self._shm.close()
+            raise ValueError("The shared memory " + name + " is not a frame bus")
+        self._capacity = self._header[2]
+        self._data = self._shm.buf[HEADER_SIZE * 8:getBusSize(self._capacity)].cast('d')
+        self._next = self._header[3]
+        self._lost_nb = 0
+
+    def readRecords(self, max_nb=None):
+        """Return the records published since the last call, oldest first"""
+        count = self._header[3]
+        start = self._next
+        if count - start > self._capacity:
+            # the writer went round the ring
+            self._lost_nb += count - self._capacity - start
+            start = count - self._capacity
+        end = count
+        if max_nb is not None and end - start > max_nb:
+            end = start + max_nb
+        d = self._data
+        res = list()
+        i = start
+        while i < end:
+            base = (i % self._capacity) * SLOT_SIZE
+            seq = 2 * i + 2
+            if d[base] == seq:
+                rec = d[base + 1:base + SLOT_SIZE].tolist()
+                if d[base] == seq:
+                    res.append(rec)
+                    i += 1
+                    continue
+            # overwritten while or before we read it
+            self._lost_nb += 1
+            i += 1
+        self._next = end
+        return res
+
+    def readGloves(self, max_nb=None, timeout=None):
+        """Return the gloves published since the last call, waiting at most timeout seconds
+            for the first one if there is none"""
+        rec_list = self.readRecords(max_nb)
+        if len(rec_list) == 0 and timeout is not None:
+            deadline = time.monotonic() + timeout
+            while len(rec_list) == 0 and time.monotonic() < deadline:
+                time.sleep(0.001)
+                rec_list = self.readRecords(max_nb)
+        return [gloveFromRecord(rec) for rec in rec_list]
+
+    def getLostNumber(self):
+        """How many frames were overwritten before this reader could read them"""
+        return self._lost_nb
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._header.release()
+        self._data.release()
+        self._shm.close()
+        self._shm = None
@@ -0,0 +1,143 @@
+"""The per-frame work of the recognition fused in one function: the distances between the
+    fingers, the update of the weighted average of the segment and, when the segment is
+    complete, the discriminant of every class of a RubineModel.
+
+    fusedStep is plain Python; it is compiled with Numba when it is installed, the pure
+    Python function is used otherwise. It gives the features of FeatureExtractor (up to the
+    rounding of their last bit) and the scores of RubineModel.getScores."""
+import math
+
+try:
+    import numba
+    import numpy
+except ImportError:
+    numba = None
+
+# index in the accumulator of the sum of the weights and of the number of frames,
+# after the weighted sums of the features
+ACC_WEIGHT = 6
+ACC_COUNT = 7
+ACC_SIZE = 8
+# returned by fusedStep while the segment is not complete
+NOT_COMPLETE = -2
+
+def fusedStep(x0, y0, z0, x1, y1, z1, x2, y2, z2, weight, acc, weight_matrix, base_weight_list, seg_threshold, avg_list):
+    """Add a frame, given by the positions of the thumb, the index and the middle finger, to the
+        segment accumulated in acc. When the segment is complete, its features are written in
+        avg_list, acc is reset and the index of the class with the highest score is returned
+        (-1 if there is no class); NOT_COMPLETE is returned otherwise"""
+    acc[0] += weight * math.sqrt(x0 * x0 + y0 * y0 + z0 * z0)
+    acc[1] += weight * math.sqrt(x1 * x1 + y1 * y1 + z1 * z1)
+    acc[2] += weight * math.sqrt(x2 * x2 + y2 * y2 + z2 * z2)
+    acc[3] += weight * math.sqrt((x0 - x1) * (x0 - x1) + (y0 - y1) * (y0 - y1) + (z0 - z1) * (z0 - z1))
+    acc[4] += weight * math.sqrt((x1 - x2) * (x1 - x2) + (y1 - y2) * (y1 - y2) + (z1 - z2) * (z1 - z2))
+    acc[5] += weight * math.sqrt((x0 - x2) * (x0 - x2) + (y0 - y2) * (y0 - y2) + (z0 - z2) * (z0 - z2))
+    acc[ACC_WEIGHT] += weight
+    acc[ACC_COUNT] += 1
+    if acc[ACC_COUNT] < seg_threshold:
+        return NOT_COMPLETE
+
+    total_weight = acc[ACC_WEIGHT]
+    i = 0
+    while i < 6:
+        if total_weight != 0:
+            avg_list[i] = acc[i] / total_weight
+        else:
+            avg_list[i] = acc[i]
+        acc[i] = 0.0
+        i += 1
+    acc[ACC_WEIGHT] = 0.0
+    acc[ACC_COUNT] = 0
+
+    best = -1
+    best_v = 0.0
+    c = 0
+    while c < len(base_weight_list):
+        w_list = weight_matrix[c]
+        v = base_weight_list[c]
+        i = 0
+        while i < 6:
+            v += w_list[i] * avg_list[i]
+            i += 1
+        if best == -1 or v > best_v:
+            best = c
+            best_v = v
+        c += 1
+    return best
+
+if numba is not None:
+    compiledFusedStep = numba.njit(cache=True)(fusedStep)
+else:
+    compiledFusedStep = None
+
+def hasCompiledKernel():
+    return compiledFusedStep is not None
+
+
+class FrameKernel:
+    """Recognize the hand pose frame by frame with one call of fusedStep per frame.
+        The weights are taken from a RubineModel, which is never modified, so the kernel
+        only converts them again when it is given another model"""
+    def __init__(self, seg_threshold=5, compiled=None):
+        """compiled --> use the Numba kernel, by default when Numba is installed"""
+        if compiled is None:
+            compiled = hasCompiledKernel()
+        if compiled and not hasCompiledKernel():
+            raise ImportError("Numba is needed by the compiled kernel")
+        self._compiled = compiled
+        self._seg_threshold = seg_threshold
+        self._model = None
+        self._name_list = tuple()
+        if compiled:
+            self._step = compiledFusedStep
+            self._acc = numpy.zeros(ACC_SIZE)
+            self._avg_list = numpy.zeros(6)
+            self._weight_matrix = numpy.zeros((0, 6))
+            self._base_weight_list = numpy.zeros(0)
+        else:
+            self._step = fusedStep
+            self._acc = [0.0] * ACC_SIZE
+            self._avg_list = [0.0] * 6
+            self._weight_matrix = tuple()
+            self._base_weight_list = tuple()
+
+    def isCompiled(self):
+        return self._compiled
+
+    def setModel(self, model):
+        """Use the weights of a RubineModel"""
+        if model is self._model:
+            return
+        if self._compiled:
+            self._weight_matrix = numpy.array(model._weight_matrix, dtype=numpy.float64).reshape((len(model._name_list), 6))
+            self._base_weight_list = numpy.array(model._base_weight_list, dtype=numpy.float64)
+        else:
+            self._weight_matrix = model._weight_matrix
+            self._base_weight_list = model._base_weight_list
+        self._name_list = model._name_list
+        self._model = model
+
+    def addFrame(self, g, weight=1.0):
+        """Add a frame (a Glove) to the segment. Return the name of the recognized class when the
+            segment is complete ("" if there is no trained class), None otherwise"""
+        p0 = g._fingers[0]._position
+        p1 = g._fingers[1]._position
+        p2 = g._fingers[2]._position
+        best = self._step(p0[0], p0[1], p0[2], p1[0], p1[1], p1[2], p2[0], p2[1], p2[2], weight,
+                          self._acc, self._weight_matrix, self._base_weight_list, self._seg_threshold, self._avg_list)
+        if best == NOT_COMPLETE:
+            return None
+        if best == -1:
+            return ""
+        return self._name_list[best]
+
+    def getFeatures(self):
+        """The features of the last complete segment"""
+        return [float(v) for v in self._avg_list]
+
+    def reset(self):
+        """Forget the frames of the segment in progress"""
+        i = 0
+        while i < ACC_SIZE:
+            self._acc[i] = 0.0
+            i += 1
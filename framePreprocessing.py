@@ -0,0 +1,155 @@
+import math
+
+from recoDataStructure import *
+
+# The length (mm) of the average finger of the reference hand, from the first
+# phalanx to the tip. Normalised positions are expressed for this hand.
+REFERENCE_FINGER_LENGTH = 80.0
+
+def isFingerLost(finger):
+    """The tracker sends NaN or (0, 0, 0) for the position of a finger it lost"""
+    p = finger._position
+    for v in p:
+        if math.isnan(v):
+            return True
+    return p[0] == 0.0 and p[1] == 0.0 and p[2] == 0.0
+
+class HandProfile:
+    """The hand geometry of a user, estimated from the phalanx lengths and the tip radius
+        sent by the tracker for every finger"""
+    def __init__(self):
+        self._frame_nb = 0
+        # sum over the frames of the length of each finger
+        self._length_sum = [0.0] * len(FINGER_NAME_LIST)
+
+    def addGlove(self, glove):
+        """Take the geometry of a glove into account"""
+        i = 0
+        while i < len(glove._fingers):
+            f = glove._fingers[i]
+            self._length_sum[i] += f._phalanx_length[0] + f._phalanx_length[1] + f._phalanx_length[2] + f._radius_tip
+            i += 1
+        self._frame_nb += 1
+
+    def getFrameNumber(self):
+        return self._frame_nb
+
+    def getFingerLength(self):
+        """The average length of a finger of this hand"""
+        if self._frame_nb == 0:
+            return REFERENCE_FINGER_LENGTH
+        return sum(self._length_sum) / (self._frame_nb * len(self._length_sum))
+
+    def getScale(self):
+        """How much bigger than the reference hand this hand is"""
+        length = self.getFingerLength()
+        if length <= 0:
+            return 1.0
+        return length / REFERENCE_FINGER_LENGTH
+
+    def saveToFile(self, fpath):
+        with open(fpath, 'w') as f:
+            f.write(str(self._frame_nb) + "\n")
+            f.write(" ".join([str(l) for l in self._length_sum]) + "\n")
+
+    def loadFromFile(self, fpath):
+        with open(fpath, 'r') as f:
+            lines = f.readlines()
+        self._frame_nb = int(lines[0][:-1])
+        self._length_sum = [float(l) for l in lines[1].split()]
+
+
+class FramePreprocessor:
+    """Stage between the DataReceiver and the FeatureExtractor.
+        Frames where a finger is lost are dropped; frames whose tracking quality is under the
+        threshold are dropped, or only down-weighted in the average of the segment if
+        drop_bad_quality is False. The finger positions are then scaled to the reference hand
+        with the HandProfile of the user, so that the features don't depend on the hand size.
+        When the profile isn't calibrated yet, the good frames are used to calibrate it and are
+        dropped: the positions are only scaled once the scale of the hand is fixed."""
+    def __init__(self, quality_threshold=0.5, drop_bad_quality=True, normalize=True, profile=None, calibration_frame_nb=50):
+        self._quality_threshold = quality_threshold
+        self._drop_bad_quality = drop_bad_quality
+        self._normalize = normalize
+        # the profile keeps being estimated with the first calibration_frame_nb good frames
+        if profile is None:
+            profile = HandProfile()
+        self._profile = profile
+        self._calibration_frame_nb = calibration_frame_nb
+
+        # statistics
+        self._frame_nb = 0
+        self._dropped_nb = 0
+        self._calibration_nb = 0
+
+    def getConfig(self):
+        """A string describing the parameters of the preprocessing, see FeatureCache.
+            The hand profile is described by its current scale"""
+        return "FramePreprocessor(%r, %r, %r, %r, %r)" % (self._quality_threshold, self._drop_bad_quality, self._normalize, self._profile.getScale(), self._calibration_frame_nb)
+
+    def isFingerLost(self, finger):
+        return isFingerLost(finger)
+
+    def process(self, glove):
+        """Return (glove, weight) for the frame to give to the FeatureExtractor, or (None, 0) to skip it"""
+        self._frame_nb += 1
+        if glove is None or len(glove._fingers) < len(FINGER_NAME_LIST):
+            self._dropped_nb += 1
+            return None, 0.0
+        for f in glove._fingers:
+            if self.isFingerLost(f):
+                self._dropped_nb += 1
+                return None, 0.0
+
+        weight = 1.0
+        quality = float(glove._quality)
+        if quality < self._quality_threshold:
+            if self._drop_bad_quality or quality <= 0:
+                self._dropped_nb += 1
+                return None, 0.0
+            weight = quality / self._quality_threshold
+        elif self.isCalibrating():
+            self._profile.addGlove(glove)
+            if self._normalize:
+                self._calibration_nb += 1
+                return None, 0.0
+
+        if self._normalize:
+            if self.isCalibrating():
+                # a bad frame before the scale is known
+                self._dropped_nb += 1
+                return None, 0.0
+            glove = self.normalizeGlove(glove)
+        return glove, weight
+
+    def getState(self):
+        """The calibration of the profile and the statistics, to read the same frames again
+            with setState (see RecoPipeline.trainOutOfCore)"""
+        return (self._profile._frame_nb, list(self._profile._length_sum), self._frame_nb, self._dropped_nb, self._calibration_nb)
+
+    def setState(self, state):
+        self._profile._frame_nb = state[0]
+        self._profile._length_sum = list(state[1])
+        self._frame_nb, self._dropped_nb, self._calibration_nb = state[2], state[3], state[4]
+
+    def normalizeGlove(self, glove):
+        """Return a copy of the glove with the finger positions scaled to the reference hand"""
+        scale = self._profile.getScale()
+        fingers = list()
+        for f in glove._fingers:
+            pos = [f._position[0] / scale, f._position[1] / scale, f._position[2] / scale]
+            fingers.append(Finger(f._name, pos, f._orientation, f._radius_tip, f._phalanx_length, f._phalanx_angles))
+        return Glove(glove._timestamp, glove._id, glove._quality, glove._l_or_r, glove._finger_number, fingers, glove._position, glove._orientation)
+
+    def isCalibrating(self):
+        return self._profile.getFrameNumber() < self._calibration_frame_nb
+
+    def getProfile(self):
+        return self._profile
+
+    def getCalibrationNumber(self):
+        """How many frames were used to calibrate the profile instead of being recognized"""
+        return self._calibration_nb
+
+    def getDroppedNumber(self):
+        return self._dropped_nb
@@ -0,0 +1,229 @@
+"""Send the recognized gestures to other applications, as events with the label, the confidence,
+    the hand and the timestamps of the decision.
+
+    The events go to in-process callbacks and/or to local sockets (UDP or Unix datagram), encoded
+    in JSON or in a compact binary format. A datagram holds a batch of events:
+    - JSON: an array of objects {"label", "confidence", "hand", "timestamp", "receive_time", "decision_time"}
+    - binary: BATCH_HEADER (magic, number of events), then for each event EVENT_HEADER
+        (timestamp, receive time, decision time, confidence, hand, length of the label)
+        followed by the label in UTF-8. The unknown times and confidence are NaN.
+    The timestamp is the one of the tracker, the receive and decision times are given by
+    time.monotonic(), so they can be compared by the processes of the same machine."""
+import errno
+import json
+import math
+import socket
+import struct
+import time
+
+BATCH_MAGIC = b"GEV1"
+BATCH_HEADER = struct.Struct('<4sH')
+EVENT_HEADER = struct.Struct('<dddfbB')
+ENCODING_LIST = ('json', 'binary')
+# the errors of a consumer which is slow (full buffer) or not listening yet
+RETRY_ERRNO_LIST = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS, errno.EINTR, errno.ECONNREFUSED, errno.ENOENT)
+
+class GestureEvent:
+    """A gesture recognized for a hand (0 left, 1 right)"""
+    def __init__(self, label, confidence, hand, timestamp, receive_time=None, decision_time=None):
+        self._label = label
+        # probability of the label, None if the recognizer doesn't give it
+        self._confidence = confidence
+        self._hand = hand
+        self._timestamp = timestamp
+        self._receive_time = receive_time
+        self._decision_time = decision_time
+
+    def __str__(self):
+        return "GestureEvent("+self._label+", hand "+str(self._hand)+", confidence "+str(self._confidence)+")"
+
+    def toDict(self):
+        return {'label': self._label, 'confidence': self._confidence, 'hand': self._hand,
+                'timestamp': self._timestamp, 'receive_time': self._receive_time,
+                'decision_time': self._decision_time}
+
+def orNaN(x):
+    return float('nan') if x is None else x
+
+def orNone(x):
+    return None if math.isnan(x) else x
+
+def encodeEvent(e, encoding):
+    """The bytes of an event in a batch, see encodeBatch"""
+    if encoding == 'json':
+        return json.dumps(e.toDict(), separators=(',', ':')).encode('utf-8')
+    # cut on a character boundary, the consumer decodes the label
+    label = e._label.encode('utf-8')[:255].decode('utf-8', 'ignore').encode('utf-8')
+    return EVENT_HEADER.pack(e._timestamp, orNaN(e._receive_time), orNaN(e._decision_time),
+                             orNaN(e._confidence), e._hand, len(label)) + label
+
+def encodeBatch(part_list, encoding):
+    """The datagram of a batch of events encoded by encodeEvent"""
+    if encoding == 'json':
+        return b"[" + b",".join(part_list) + b"]"
+    return BATCH_HEADER.pack(BATCH_MAGIC, len(part_list)) + b"".join(part_list)
+
+def encodeEvents(event_list, encoding):
+    """Encode a batch of events in one datagram"""
+    return encodeBatch([encodeEvent(e, encoding) for e in event_list], encoding)
+
+def decodeEvents(data):
+    """The list of events of a datagram, in either encoding"""
+    if data[:len(BATCH_MAGIC)] != BATCH_MAGIC:
+        return [GestureEvent(d['label'], d['confidence'], d['hand'], d['timestamp'], d['receive_time'],
+                             d['decision_time']) for d in json.loads(data.decode('utf-8'))]
+    magic, n = BATCH_HEADER.unpack_from(data, 0)
+    offset = BATCH_HEADER.size
+    res = list()
+    k = 0
+    while k < n:
+        timestamp, receive_time, decision_time, confidence, hand, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        label = data[offset:offset + length].decode('utf-8')
+        offset += length
+        res.append(GestureEvent(label, orNone(confidence), hand, timestamp, orNone(receive_time), orNone(decision_time)))
+        k += 1
+    return res
+
+
+class DatagramTransport:
+    """A non-blocking datagram socket to a consumer. When the consumer is slow (its socket buffer
+        is full) or not started yet, the events are kept, at most max_pending of them, and sent
+        with the next ones in a single datagram. Each event is encoded once"""
+    def __init__(self, family, address, encoding='json', max_pending=64):
+        if encoding not in ENCODING_LIST:
+            raise ValueError("Unknown encoding of the gesture events: "+str(encoding))
+        self._address = address
+        self._encoding = encoding
+        self._max_pending = max_pending
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._pending_list = list()
+        self._sent_nb = 0
+        self._batch_nb = 0
+        self._dropped_nb = 0
+
+    def send(self, event):
+        """Send an event, with the ones pending. Return False if they are kept for later"""
+        self._pending_list.append(encodeEvent(event, self._encoding))
+        return self.flush()
+
+    def flush(self):
+        """Send the events pending, e.g. when the recognition is idle: with events emitted only
+            when the label changes, the last one would wait for the next change otherwise.
+            Return False if they are still kept for later"""
+        if len(self._pending_list) == 0:
+            return True
+        try:
+            self._socket.sendto(encodeBatch(self._pending_list, self._encoding), self._address)
+        except OSError as e:
+            if e.errno not in RETRY_ERRNO_LIST:
+                raise
+            if len(self._pending_list) > self._max_pending:
+                self._dropped_nb += len(self._pending_list) - self._max_pending
+                del self._pending_list[:len(self._pending_list) - self._max_pending]
+            return False
+        if len(self._pending_list) > 1:
+            self._batch_nb += 1
+        self._sent_nb += len(self._pending_list)
+        self._pending_list = list()
+        return True
+
+    def getStatistics(self):
+        """Return a dict with the numbers of events sent, pending and dropped, and of batches
+            of more than one event"""
+        return {'sent': self._sent_nb, 'pending': len(self._pending_list),
+                'dropped': self._dropped_nb, 'batches': self._batch_nb}
+
+    def close(self):
+        self._socket.close()
+
+class UdpTransport(DatagramTransport):
+    def __init__(self, host, port, encoding='json', max_pending=64):
+        DatagramTransport.__init__(self, socket.AF_INET, (host, port), encoding, max_pending)
+
+class UnixTransport(DatagramTransport):
+    """To a Unix datagram socket bound to path by the consumer"""
+    def __init__(self, path, encoding='json', max_pending=64):
+        DatagramTransport.__init__(self, socket.AF_UNIX, path, encoding, max_pending)
+
+def createTransport(spec, encoding='json'):
+    """A transport from 'udp:HOST:PORT' or 'unix:PATH'"""
+    kind, sep, address = spec.partition(':')
+    if kind == 'udp':
+        host, sep, port = address.rpartition(':')
+        return UdpTransport(host or '127.0.0.1', int(port), encoding)
+    if kind == 'unix':
+        return UnixTransport(address, encoding)
+    raise ValueError("Expected udp:HOST:PORT or unix:PATH, got "+spec)
+
+def openListener(spec):
+    """A socket bound to the address of a transport spec, to receive the events"""
+    kind, sep, address = spec.partition(':')
+    if kind == 'udp':
+        host, sep, port = address.rpartition(':')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host or '127.0.0.1', int(port)))
+    elif kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(address)
+    else:
+        raise ValueError("Expected udp:HOST:PORT or unix:PATH, got "+spec)
+    return sock
+
+
+class GesturePublisher:
+    """Emit the decisions of the recognition as GestureEvents to callbacks and transports.
+        An event is emitted when the label of a hand changes; with a rate, the label of a hand
+        is also repeated at most rate times per second while it doesn't change.
+        The callbacks are called by the thread which recognizes, they must return quickly"""
+    def __init__(self, rate=None):
+        self._min_interval = None if rate is None else 1.0 / rate
+        self._callback_list = list()
+        self._transport_list = list()
+        # hand -> (last label emitted, its decision time)
+        self._last_dict = dict()
+        self._emitted_nb = 0
+
+    def addCallback(self, callback):
+        """callback(event) is called for each event"""
+        self._callback_list.append(callback)
+
+    def addTransport(self, transport):
+        self._transport_list.append(transport)
+
+    def publish(self, label, confidence, hand, timestamp, receive_time=None):
+        """Called for each decision. Return the event if it was emitted, None otherwise"""
+        decision_time = time.monotonic()
+        last = self._last_dict.get(hand)
+        if last is not None and last[0] == label:
+            if self._min_interval is None or decision_time - last[1] < self._min_interval:
+                return None
+        self._last_dict[hand] = (label, decision_time)
+        event = GestureEvent(label, confidence, hand, timestamp, receive_time, decision_time)
+        for callback in self._callback_list:
+            try:
+                callback(event)
+            except Exception as e:
+                print("A gesture event callback failed:", e)
+        for transport in self._transport_list:
+            transport.send(event)
+        self._emitted_nb += 1
+        return event
+
+    def flush(self):
+        """Send the events the transports kept while their consumer was slow"""
+        for transport in self._transport_list:
+            transport.flush()
+
+    def getEmittedNumber(self):
+        return self._emitted_nb
+
+    def getStatistics(self):
+        """The statistics of each transport, see DatagramTransport.getStatistics"""
+        return [t.getStatistics() for t in self._transport_list]
+
+    def close(self):
+        for transport in self._transport_list:
+            transport.close()
+        self._transport_list = list()
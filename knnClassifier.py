@@ -0,0 +1,123 @@
+from classifier import Classifier
+from recoUtils import KDTree
+
+class KNNClassifier(Classifier):
+    """A classifier which votes among the k nearest training samples of a RecoTuple.
+        It has the same gesture classes and model file as Rubine,
+        but the samples are indexed in a k-d tree instead of being summarised by weights,
+        so that gestures with several distinct poses can be recognized."""
+    def __init__(self, feature_file, k=5):
+        Classifier.__init__(self, feature_file)
+        self._k = k
+        self._tree = KDTree(len(self._feature_list))
+        # gesture class name -> number of its samples in the tree
+        self._indexed_nb = dict()
+
+    def buildIndex(self):
+        """Build a balanced tree with the training samples of every class"""
+        point_list = list()
+        label_list = list()
+        indexed_nb = dict()
+        for c in self._class_list:
+            point_list += c._sample_list[:c._train_sample_nb]
+            label_list += [c._name] * c._train_sample_nb
+            indexed_nb[c._name] = c._train_sample_nb
+        # a new tree, the current one may still be used by the recognition
+        self._tree = KDTree(len(self._feature_list), point_list, label_list)
+        self._indexed_nb = indexed_nb
+        print("Index built with", len(point_list), "samples.")
+
+    def updateIndex(self, gclass):
+        """Insert the new training samples of a class into the tree, or build it again
+            when too many points were inserted since the last build"""
+        start = self._indexed_nb.get(gclass._name, 0)
+        if self._tree is None or start > gclass._train_sample_nb:
+            # the samples of the class were replaced
+            self.buildIndex()
+            return
+        for s in gclass._sample_list[start:gclass._train_sample_nb]:
+            self._tree.insert(s, gclass._name)
+        self._indexed_nb[gclass._name] = gclass._train_sample_nb
+        if self._tree.getInsertedNumber() > len(self._tree) // 2:
+            self.buildIndex()
+
+    def train(self, gclass_name):
+        """Use 80 percent (the train ratio) of the sample list of a gesture class as neighbours, the rest is kept to check the precision"""
+        gclass = self.getGestureClassByName(gclass_name)
+        if gclass is None:
+            print("The gesture",gclass_name,"doesn't exist.")
+            return None
+        train_sample_nb = int(len(gclass._sample_list) * self._train_ratio)
+        if train_sample_nb < self._k:
+            # not enough samples
+            return 1
+        gclass._train_sample_nb = train_sample_nb
+        self.updateIndex(gclass)
+        print("Training has been done successfully. Gesture <",gclass_name,"> was updated.")
+        return 0
+
+    def updateModel(self):
+        # classes were loaded or replaced, the old samples may still be in the tree
+        self.buildIndex()
+
+    def createSnapshot(self):
+        snapshot = Classifier.createSnapshot(self)
+        # the snapshot builds its own tree when it is trained
+        snapshot._tree = None
+        snapshot._indexed_nb = dict()
+        return snapshot
+
+    def swapModel(self, snapshot):
+        self._tree = snapshot._tree
+        self._indexed_nb = snapshot._indexed_nb
+
+    def getTrainedClassNames(self):
+        return [c._name for c in self._class_list if self._indexed_nb.get(c._name, 0) > 0]
+
+    def showTrainingResult(self):
+        print("k-NN classifier with k =", self._k, "over", len(self._tree), "samples")
+        for c in self._class_list:
+            print(c._name, ":", c._train_sample_nb, "samples")
+
+    def recognition(self, s_list):
+        """Return the name of the class which has the most samples among the k nearest ones,
+            the nearest one decides in case of a tie"""
+        neighbour_list = self._tree.query(s_list, self._k)
+        if len(neighbour_list) == 0:
+            return ""
+        vote = dict()
+        for d, name in neighbour_list:
+            vote[name] = vote.get(name, 0) + 1
+        best_nb = max(vote.values())
+        for d, name in neighbour_list:
+            if vote[name] == best_nb:
+                c_name = name
+                break
+        print("The nearest neighbours vote for class:",c_name,"(",best_nb,"of",len(neighbour_list),")")
+        return c_name
+
+    def getScores(self, sample_list):
+        """The number of votes of each trained class among the k nearest samples"""
+        name_list = self.getTrainedClassNames()
+        column = dict()
+        for i, name in enumerate(name_list):
+            column[name] = i
+        tree = self._tree
+        res = list()
+        for s_list in sample_list:
+            score_list = [0.0] * len(name_list)
+            for d, name in tree.query(s_list, self._k):
+                # the tree may have been swapped after the names were read
+                if name in column:
+                    score_list[column[name]] += 1
+            res.append(score_list)
+        return res
+
+    def getProbabilities(self, sample_list):
+        res = list()
+        for score_list in self.getScores(sample_list):
+            total = sum(score_list)
+            if total > 0:
+                score_list = [v / total for v in score_list]
+            res.append(score_list)
+        return res
@@ -0,0 +1,83 @@
+import queue
+import threading
+
+class ModelTrainer:
+    """Train a classifier in a background thread while it keeps recognizing.
+        A training works on a snapshot of the classifier (see Classifier.createSnapshot);
+        as soon as it is done, the trained model replaces the live one with a single
+        assignment, so the recognition is never stopped nor sees a half-trained model.
+        The classes of the snapshot are then installed by poll(), which has to be called
+        from the thread which owns the classifier (e.g. a GUI timer)."""
+    def __init__(self, classifier):
+        self._classifier = classifier
+        # gesture classes waiting to be trained, one training at a time
+        self._pending_list = list()
+        self._busy = False
+        self._job_queue = queue.Queue()
+        self._done_queue = queue.Queue()
+        self._thread = None
+
+    def setClassifier(self, classifier):
+        self._classifier = classifier
+
+    def requestTraining(self, gclass_name):
+        """Train a gesture class in the background, the result is given by poll()"""
+        if gclass_name not in self._pending_list:
+            self._pending_list.append(gclass_name)
+        self.startNext()
+
+    def startNext(self):
+        if self._busy or len(self._pending_list) == 0:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="ModelTrainer")
+            self._thread.daemon = True
+            self._thread.start()
+        gclass_name = self._pending_list.pop(0)
+        self._busy = True
+        # the snapshot is taken here, by the owner of the classifier
+        self._job_queue.put((gclass_name, self._classifier, self._classifier.createSnapshot()))
+
+    def run(self):
+        """Body of the training thread"""
+        while True:
+            job = self._job_queue.get()
+            if job is None:
+                break
+            gclass_name, classifier, snapshot = job
+            try:
+                res = snapshot.train(gclass_name)
+            except Exception as e:
+                print("The training of <",gclass_name,"> failed:", e)
+                res = None
+            if res == 0:
+                classifier.swapModel(snapshot)
+            self._done_queue.put((gclass_name, res, classifier, snapshot))
+
+    def poll(self):
+        """Install the finished trainings and start the next one.
+            Return a list of (gesture class name, result of train)"""
+        res_list = list()
+        while True:
+            try:
+                gclass_name, res, classifier, snapshot = self._done_queue.get_nowait()
+            except queue.Empty:
+                break
+            if res == 0 and classifier is self._classifier:
+                # the classes which got samples during the training are trained again
+                for name in classifier.installSnapshot(snapshot):
+                    if name not in self._pending_list:
+                        self._pending_list.append(name)
+            self._busy = False
+            res_list.append((gclass_name, res))
+        self.startNext()
+        return res_list
+
+    def isBusy(self):
+        return self._busy or len(self._pending_list) != 0
+
+    def stop(self):
+        if self._thread is not None:
+            self._job_queue.put(None)
+            self._thread.join()
+            self._thread = None
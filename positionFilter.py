@@ -0,0 +1,112 @@
+import math
+
+from recoDataStructure import *
+from framePreprocessing import isFingerLost
+
+# default period between two frames when the timestamps can't be used (60 Hz tracker)
+DEFAULT_PERIOD = 1.0 / 60
+
+def smoothingFactor(cutoff, dt):
+    """The factor of the exponential smoothing for a cutoff frequency and a period"""
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class FingerPositionFilter:
+    """A One Euro filter on the position of every finger of both hands.
+        The state of the 2 * 5 fingers is stored in flat lists of coordinates, each frame is
+        filtered in constant time. The cutoff frequency rises with the speed of a finger,
+        so a still hand is strongly smoothed while a moving one has little lag.
+        A finger which jumps faster than max_speed (mm/s) is considered as a tracking glitch:
+        its previous position is kept, for at most max_outlier_frames frames in a row.
+        A lost finger (see framePreprocessing.isFingerLost) is passed through unchanged, so that
+        the FramePreprocessor still drops the frame, and is filtered again from its next position."""
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, max_speed=3000.0, max_outlier_frames=3):
+        self._min_cutoff = min_cutoff
+        self._beta = beta
+        self._d_cutoff = d_cutoff
+        self._max_speed = max_speed
+        self._max_outlier_frames = max_outlier_frames
+
+        finger_nb = 2 * len(FINGER_NAME_LIST)
+        # filtered position and speed of each coordinate, left hand first
+        self._x = [0.0] * (3 * finger_nb)
+        self._dx = [0.0] * (3 * finger_nb)
+        # number of frames in a row each finger has been rejected
+        self._outlier_nb = [0] * finger_nb
+        # the fingers whose filter starts again with their next position
+        self._lost = [True] * finger_nb
+        # timestamp of the last frame of each hand, None before the first one
+        self._last_time = [None, None]
+
+        self._rejected_nb = 0
+
+    def reset(self):
+        """Forget the state of the fingers, e.g. between two recordings"""
+        self._last_time = [None, None]
+        finger_nb = 2 * len(FINGER_NAME_LIST)
+        self._outlier_nb = [0] * finger_nb
+        self._lost = [True] * finger_nb
+
+    def getConfig(self):
+        """A string describing the parameters of the filter, see FeatureCache"""
+        return "FingerPositionFilter(%r, %r, %r, %r, %r)" % (self._min_cutoff, self._beta, self._d_cutoff, self._max_speed, self._max_outlier_frames)
+
+    def filterGlove(self, glove):
+        """Return a copy of the glove with filtered finger positions"""
+        hand = 0 if glove._l_or_r == 0 else 1
+        t = float(glove._timestamp)
+        last = self._last_time[hand]
+        self._last_time[hand] = t
+        first = last is None
+        dt = DEFAULT_PERIOD
+        if not first and t > last:
+            dt = t - last
+
+        x = self._x
+        dx = self._dx
+        a_d = smoothingFactor(self._d_cutoff, dt)
+        fingers = list()
+        n = 0
+        while n < len(glove._fingers):
+            f = glove._fingers[n]
+            k = hand * len(FINGER_NAME_LIST) + n
+            i = 3 * k
+            p = f._position
+            if isFingerLost(f):
+                self._lost[k] = True
+                self._outlier_nb[k] = 0
+                fingers.append(f)
+                n += 1
+                continue
+            if first or self._lost[k]:
+                self._lost[k] = False
+                x[i], x[i+1], x[i+2] = p[0], p[1], p[2]
+                dx[i] = dx[i+1] = dx[i+2] = 0.0
+            else:
+                # speed of the raw position compared to the filtered one
+                v0 = (p[0] - x[i]) / dt
+                v1 = (p[1] - x[i+1]) / dt
+                v2 = (p[2] - x[i+2]) / dt
+                speed = math.sqrt(v0 * v0 + v1 * v1 + v2 * v2)
+                if speed > self._max_speed and self._outlier_nb[k] < self._max_outlier_frames:
+                    # glitch: keep the previous position
+                    self._outlier_nb[k] += 1
+                    self._rejected_nb += 1
+                else:
+                    self._outlier_nb[k] = 0
+                    dx[i] += a_d * (v0 - dx[i])
+                    dx[i+1] += a_d * (v1 - dx[i+1])
+                    dx[i+2] += a_d * (v2 - dx[i+2])
+                    d_speed = math.sqrt(dx[i] * dx[i] + dx[i+1] * dx[i+1] + dx[i+2] * dx[i+2])
+                    a = smoothingFactor(self._min_cutoff + self._beta * d_speed, dt)
+                    x[i] += a * (p[0] - x[i])
+                    x[i+1] += a * (p[1] - x[i+1])
+                    x[i+2] += a * (p[2] - x[i+2])
+            fingers.append(Finger(f._name, [x[i], x[i+1], x[i+2]], f._orientation, f._radius_tip, f._phalanx_length, f._phalanx_angles))
+            n += 1
+        return Glove(glove._timestamp, glove._id, glove._quality, glove._l_or_r, glove._finger_number, fingers, glove._position, glove._orientation)
+
+    def getRejectedNumber(self):
+        """How many finger positions were rejected as glitches"""
+        return self._rejected_nb
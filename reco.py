@@ -0,0 +1,366 @@
+"""Command line entry point of the recognition pipeline, without the GUI.
+
+    python reco.py train -m MODEL [--out-of-core] [--base BASE_MODEL] GESTURE=FILE [GESTURE=FILE ...]
+    python reco.py recognize -m MODEL FILE [FILE ...]
+    python reco.py eval -m MODEL GESTURE=FILE [GESTURE=FILE ...]
+    python reco.py serve -m MODEL [--port 6000 | --bus NAME] [--events udp:HOST:PORT | unix:PATH]
+    python reco.py listen udp:HOST:PORT | unix:PATH
+    python reco.py publish --bus NAME [--port 6000]
+    python reco.py record --bus NAME FILE
+    python reco.py index [--chunks N] FILE [FILE ...]
+
+Each subcommand imports only the modules it needs, and the model is loaded from its
+compiled cache (MODEL.cache) when it is up to date.
+With publish, one process parses the messages of the tracker and puts the frames into a
+shared-memory frame bus (see frameBus), which several serve and record processes can read.
+With --events, serve sends the recognized gestures to other applications (see gesturePublisher),
+listen prints the events received."""
+import argparse
+import os
+import sys
+
+def createPipeline(args):
+    from recoPipeline import RecoPipeline
+    if args.backend == "knn":
+        from knnClassifier import KNNClassifier
+        classifier = KNNClassifier(args.features)
+    else:
+        from classifier import Rubine
+        classifier = Rubine(args.features)
+    rp = RecoPipeline(classifier, args.seg)
+    if args.adaptive:
+        from featureExtraction import AdaptiveFeatureExtractor
+        rp.setFeatureExtractor(AdaptiveFeatureExtractor(args.seg, args.max_seg, args.motion_threshold))
+    if args.feature_cache:
+        from featureCache import FeatureCache
+        rp.setFeatureCache(FeatureCache(max_size=args.cache_size * 1024 * 1024))
+    if args.filter:
+        from positionFilter import FingerPositionFilter
+        rp.setPositionFilter(FingerPositionFilter())
+    if args.normalize:
+        from framePreprocessing import FramePreprocessor, HandProfile
+        # the hand size is the one the model was trained with
+        profile = HandProfile()
+        if os.path.isfile(getProfilePath(args)):
+            profile.loadFromFile(getProfilePath(args))
+        elif args.command != "train":
+            print("No hand profile", getProfilePath(args), "- it is estimated with the first frames.", file=sys.stderr)
+        rp.setPreprocessor(FramePreprocessor(profile=profile))
+    return rp
+
+def getProfilePath(args):
+    """The hand profile of --normalize, next to the model by default"""
+    if args.profile is not None:
+        return args.profile
+    return args.model + ".profile"
+
+def loadPipeline(args):
+    rp = createPipeline(args)
+    if not os.path.isfile(args.model):
+        print("The model", args.model, "doesn't exist.", file=sys.stderr)
+        sys.exit(1)
+    rp.loadClassifier(args.model)
+    if args.groups is not None and not rp.setHierarchical(args.groups):
+        print("Only the Rubine classifier can score the classes by groups.", file=sys.stderr)
+    return rp
+
+def parsePairs(pair_list):
+    """Split GESTURE=FILE arguments"""
+    res = list()
+    for pair in pair_list:
+        if "=" not in pair:
+            print("Expected GESTURE=FILE, got", pair, file=sys.stderr)
+            sys.exit(2)
+        name, path = pair.split("=", 1)
+        res.append((name, path))
+    return res
+
+def commandTrain(args):
+    rp = createPipeline(args)
+    if args.out_of_core and not rp.canTrainOutOfCore():
+        print("Only the Rubine classifier can be trained out of core.", file=sys.stderr)
+        return 2
+    if args.sample_budget is not None:
+        rp.setSampleBudget(args.sample_budget, args.budget_policy)
+    if os.path.isfile(args.model):
+        rp.loadClassifier(args.model)
+    elif args.base is not None:
+        rp.loadBaseModel(args.base, args.prior_weight)
+    if args.out_of_core:
+        rp.trainOutOfCore(parsePairs(args.pairs), args.reservoir)
+    else:
+        for name, path in parsePairs(args.pairs):
+            rp.trainFromFile(path, name)
+    rp.saveClassifier(args.model)
+    if args.normalize:
+        rp.saveHandProfile(getProfilePath(args))
+    return 0
+
+def commandRecognize(args):
+    rp = loadPipeline(args)
+    for path in args.files:
+        # each segment is printed as soon as it is cut, without waiting for the end of the file
+        for rt in rp.iterRecoTuplesFromFile(path):
+            print(rt._timestamp, rp.predict([rt._s_list])[0])
+    return 0
+
+def commandEval(args):
+    rp = loadPipeline(args)
+    total_num = 0
+    right_num = 0
+    all_s_list = list()
+    all_label_list = list()
+    for name, path in parsePairs(args.pairs):
+        s_list = [rt._s_list for rt in rp.iterRecoTuplesFromFile(path)]
+        precision = rp.score(s_list, [name] * len(s_list))
+        print(name, path, len(s_list), "segments, precision", round(precision * 100, 2), "%")
+        total_num += len(s_list)
+        right_num += precision * len(s_list)
+        all_s_list += s_list
+        all_label_list += [name] * len(s_list)
+    if total_num != 0:
+        print("total", total_num, "segments, precision", round(right_num / total_num * 100, 2), "%")
+        model = rp.getClassifier().getModel()
+        if args.groups is not None and hasattr(model, "getFlatScores"):
+            reportHierarchical(model, all_s_list, all_label_list)
+        elif args.groups is not None:
+            print("No more classes than groups, all the classes are scored.")
+    return 0
+
+def reportHierarchical(model, s_list, label_list):
+    """Compare the precision and the time per segment of the hierarchical model to the flat scoring"""
+    import time
+    result_list = list()
+    for title, get_scores in (("flat", model.getFlatScores), ("hierarchical", model.getScores)):
+        t = time.perf_counter()
+        score_lists = get_scores(s_list)
+        t = time.perf_counter() - t
+        name_list = [model._name_list[score_list.index(max(score_list))] for score_list in score_lists]
+        right_num = len([1 for name, label in zip(name_list, label_list) if name == label])
+        result_list.append(name_list)
+        print("%-13s %8.2f us/segment, precision %.2f %%" % (title, t / len(s_list) * 1e6, right_num * 100.0 / len(s_list)))
+    same_num = len([1 for a, b in zip(result_list[0], result_list[1]) if a == b])
+    print(len(model._name_list), "classes in", model.getGroupNumber(), "groups, same class as the flat scoring for",
+          round(same_num * 100.0 / len(s_list), 2), "% of the segments")
+
+def iterFramesFromTracker(host, port):
+    """Yield the ARTGloveFrames received from the tracker, the malformed messages are skipped"""
+    import socket
+    import recoDataStructure as rds
+    from dataAcquisition import buildGloveFrame
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    print("Listening to the tracker on port", port)
+    frame = rds.ARTGloveFrame()
+    try:
+        while True:
+            datagram = sock.recv(65536)
+            try:
+                if not buildGloveFrame(datagram.decode("ascii", "replace"), frame):
+                    continue
+            except (ValueError, IndexError):
+                print("A malformed message is ignored.", file=sys.stderr)
+                continue
+            yield frame
+    finally:
+        sock.close()
+
+def iterGlovesFromBus(name):
+    """Yield the gloves published on a frame bus, until the process is interrupted"""
+    from frameBus import FrameBusReader
+    reader = FrameBusReader(name)
+    print("Reading the frame bus", name)
+    try:
+        while True:
+            for glove in reader.readGloves(timeout=0.5):
+                yield glove
+    finally:
+        if reader.getLostNumber() != 0:
+            print(reader.getLostNumber(), "frames were lost.", file=sys.stderr)
+        reader.close()
+
+def iterSamplesFromTracker(rp, host, port):
+    """Yield the right hand glove of each frame received from the tracker"""
+    for frame in iterFramesFromTracker(host, port):
+        yield rp.feedFrame(frame)
+
+def commandServe(args):
+    rp = loadPipeline(args)
+    last_name = None
+    if args.bus is not None:
+        # only the right hand is recognized, see DataReceiver
+        sample_iter = (g for g in iterGlovesFromBus(args.bus) if g._l_or_r == 1)
+    else:
+        sample_iter = iterSamplesFromTracker(rp, args.host, args.port)
+    if args.kernel:
+        from frameKernel import FrameKernel
+        rp.setFrameKernel(FrameKernel(args.seg))
+    publisher = None
+    if len(args.events) != 0:
+        import time
+        from gesturePublisher import GesturePublisher, createTransport
+        publisher = GesturePublisher(args.event_rate)
+        for spec in args.events:
+            publisher.addTransport(createTransport(spec, args.event_encoding))
+        rp.setPublisher(publisher)
+    try:
+        for sample in sample_iter:
+            if publisher is not None:
+                name = rp.recognizeSample(sample, time.monotonic())
+                publisher.flush()
+            else:
+                name = rp.recognizeSample(sample)
+            if name is not None and name != last_name:
+                print(sample._timestamp, name)
+                sys.stdout.flush()
+                last_name = name
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if publisher is not None:
+            print(publisher.getEmittedNumber(), "gesture events, transports:", publisher.getStatistics())
+            publisher.close()
+    return 0
+
+def commandListen(args):
+    from gesturePublisher import openListener, decodeEvents
+    sock = openListener(args.address)
+    print("Listening to the gesture events on", args.address)
+    try:
+        while True:
+            for event in decodeEvents(sock.recv(65536)):
+                print(event._timestamp, event._hand, event._label, event._confidence)
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        if args.address.startswith("unix:"):
+            os.unlink(args.address[len("unix:"):])
+    return 0
+
+def commandPublish(args):
+    from frameBus import FrameBusWriter
+    writer = FrameBusWriter(args.bus, args.capacity)
+    print("Publishing the frames on the bus", writer.getName())
+    try:
+        for frame in iterFramesFromTracker(args.host, args.port):
+            writer.publishFrame(frame)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(writer.getPublishedNumber(), "gloves have been published.")
+        writer.close()
+    return 0
+
+def commandRecord(args):
+    from dataRecorder import GloveRecorder
+    recorder = GloveRecorder(args.file)
+    recorder.start()
+    try:
+        for glove in iterGlovesFromBus(args.bus):
+            recorder.record(glove)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+    print(recorder.getStatistics())
+    return 0
+
+def commandIndex(args):
+    from recordingIndex import getRecordingIndex
+    for path in args.files:
+        index = getRecordingIndex(path)
+        if index is None:
+            print(path, "can't be indexed, only uncompressed text recordings can", file=sys.stderr)
+            continue
+        if len(index) == 0:
+            print(path, "0 frames")
+            continue
+        print(path, len(index), "frames from", index.getTimestamp(0), "to", index.getTimestamp(len(index) - 1),
+              "right hand:", len(index.selectFrames(side=1)))
+        if args.chunks is not None:
+            for start, stop in index.getChunks(args.chunks):
+                print("  frames", start, "to", stop, "bytes", index.getOffset(start), "to", index.getOffset(stop))
+    return 0
+
+def createParser():
+    parser = argparse.ArgumentParser(prog="reco", description="Gesture recognition with the ART glove")
+    sub = parser.add_subparsers(dest="command")
+
+    def addCommand(name, func, help_text):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("-m", "--model", required=True, help="the trained classifier file")
+        p.add_argument("--features", default="conf/feature_list.txt", help="the feature list")
+        p.add_argument("--backend", choices=["rubine", "knn"], default="rubine")
+        p.add_argument("--seg", type=int, default=5, help="number of frames in a segment")
+        p.add_argument("--adaptive", action="store_true",
+                       help="cut the segments at the pose changes, of --seg to --max-seg frames")
+        p.add_argument("--max-seg", type=int, default=30, help="maximum number of frames of an adaptive segment")
+        p.add_argument("--motion-threshold", type=float, default=80.0,
+                       help="speed of the features (mm/s) above which the hand is moving, with --adaptive")
+        p.add_argument("--filter", action="store_true", help="smooth the finger positions")
+        p.add_argument("--normalize", action="store_true", help="filter bad frames and normalise the hand size")
+        p.add_argument("--profile", default=None, help="the hand profile of --normalize, MODEL.profile by default")
+        p.add_argument("--feature-cache", action="store_true", help="keep the features of the recordings next to them")
+        p.add_argument("--groups", type=int, default=None,
+                       help="score the classes group by group, with this number of groups (rubine); eval compares it to the flat scoring")
+        p.add_argument("--cache-size", type=int, default=256, help="size limit (MB) of a feature cache directory")
+        p.set_defaults(func=func)
+        return p
+
+    p = addCommand("train", commandTrain, "train the model with recordings")
+    p.add_argument("pairs", nargs="+", metavar="GESTURE=FILE")
+    p.add_argument("--out-of-core", action="store_true", help="keep only the statistics of the samples (rubine)")
+    p.add_argument("--reservoir", type=int, default=200, help="test segments per gesture kept with --out-of-core")
+    p.add_argument("--base", help="adapt a new model from this base model (rubine)")
+    p.add_argument("--prior-weight", type=float, default=None, help="how many samples a class of the base model is worth")
+    p.add_argument("--sample-budget", type=int, default=None, help="maximum number of segments kept per gesture")
+    p.add_argument("--budget-policy", choices=["reservoir", "kcenter"], default="reservoir",
+                   help="how the segments kept are chosen")
+    p = addCommand("recognize", commandRecognize, "print the gesture of each segment of recordings")
+    p.add_argument("files", nargs="+", metavar="FILE")
+    p = addCommand("eval", commandEval, "compute the precision on labelled recordings")
+    p.add_argument("pairs", nargs="+", metavar="GESTURE=FILE")
+    p = addCommand("serve", commandServe, "recognize the gestures sent by the tracker")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=6000)
+    p.add_argument("--bus", help="read the frames from this frame bus instead of the tracker")
+    p.add_argument("--kernel", action="store_true", help="recognize with the fused frame kernel (rubine)")
+    p.add_argument("--events", action="append", default=[], metavar="ADDRESS",
+                   help="send the gesture events to udp:HOST:PORT or unix:PATH, can be repeated")
+    p.add_argument("--event-encoding", choices=["json", "binary"], default="json")
+    p.add_argument("--event-rate", type=float, default=None,
+                   help="repeat the current gesture at most this number of times per second, only the changes are sent by default")
+
+    p = sub.add_parser("publish", help="put the frames sent by the tracker on a shared-memory frame bus")
+    p.add_argument("--bus", default=None, help="name of the frame bus, a new one by default")
+    p.add_argument("--capacity", type=int, default=1024, help="number of frames kept in the bus")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=6000)
+    p.set_defaults(func=commandPublish)
+    p = sub.add_parser("record", help="record the frames of a frame bus to a file")
+    p.add_argument("--bus", required=True, help="name of the frame bus")
+    p.add_argument("file", metavar="FILE")
+    p.set_defaults(func=commandRecord)
+
+    p = sub.add_parser("listen", help="print the gesture events sent by serve --events")
+    p.add_argument("address", metavar="ADDRESS", help="udp:HOST:PORT or unix:PATH")
+    p.set_defaults(func=commandListen)
+
+    p = sub.add_parser("index", help="build the index of recordings, to read them by frame number or timestamp")
+    p.add_argument("--chunks", type=int, default=None, help="print how to split the recordings into this number of chunks")
+    p.add_argument("files", nargs="+", metavar="FILE")
+    p.set_defaults(func=commandIndex)
+    return parser
+
+def main(argv=None):
+    parser = createParser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,23 @@
-from recoUtils import Matrix
+import math
+import random
+
+from recoUtils import Matrix, SampleStatistics, selectCoreset
 
 GP = 4 # Global Precision for floating number 
 
+# how far the averages and the covariance matrix of the samples kept by a budget may be from the
+# ones of all the samples (see GestureClass.getSampleBudgetError)
+DEFAULT_BUDGET_TOLERANCE = 0.1
+
+FINGER_NAME_LIST = ['pouce','index','majeur','annulaire','auriculaire']
+
+# Layout of a glove as a flat list of numbers (see Glove.toRecord):
+# timestamp, id, quality, lr, finger number, position (3), orientation (9),
+# then for each finger: position (3), orientation (9), tip radius, phalanx length (3), phalanx angles (2)
+GLOVE_HEADER_SIZE = 17
+FINGER_RECORD_SIZE = 18
+GLOVE_RECORD_SIZE = GLOVE_HEADER_SIZE + 5 * FINGER_RECORD_SIZE
+
 class ARTGloveFrame:
     """The structure which contains a frame of tracking data"""
     def __init__(self):
@@ -9,6 +25,8 @@ class ARTGloveFrame:
         self._timestamp = 0
         self._gl = 0
         self._glove_list = None
+        # time.monotonic() when the message was received, None if unknown
+        self._receive_time = None
 
     def __str__(self):
         res = "FrameID: "+str(self._fr)+"\nTimestamp: "+str(self._timestamp)+"\nGloveNb: "+str(self._gl)+"\n"
@@ -40,15 +58,17 @@ class Finger:
         return res
 
     def toFile(self):
-        res = "<"+str(self._name)+">\n"
-        res += str(self._position[0])+" "+str(self._position[1])+" "+str(self._position[2])+"\n"
-        res += str(self._orientation[0])+" "+str(self._orientation[1])+" "+str(self._orientation[2])+"\n"
-        res += str(self._orientation[3])+" "+str(self._orientation[4])+" "+str(self._orientation[5])+"\n"
-        res += str(self._orientation[6])+" "+str(self._orientation[7])+" "+str(self._orientation[8])+"\n"
-        res += str(self._radius_tip)+"\n"
-        res += str(self._phalanx_length[0])+" "+str(self._phalanx_length[1])+" "+str(self._phalanx_length[2])+"\n"
-        res += str(self._phalanx_angles[0])+" "+str(self._phalanx_angles[1])+"\n"
-        return res
+        p = self._position
+        o = self._orientation
+        l = self._phalanx_length
+        a = self._phalanx_angles
+        return "<%s>\n%s %s %s\n%s %s %s\n%s %s %s\n%s %s %s\n%s\n%s %s %s\n%s %s\n" % (
+            self._name, p[0], p[1], p[2], o[0], o[1], o[2], o[3], o[4], o[5], o[6], o[7], o[8],
+            self._radius_tip, l[0], l[1], l[2], a[0], a[1])
+
+    def toRecord(self):
+        """Return the numeric data of the finger as a flat list, see FINGER_RECORD_SIZE"""
+        return list(self._position) + list(self._orientation) + [self._radius_tip] + list(self._phalanx_length) + list(self._phalanx_angles)
 
 class Glove:
     """The structure to store the raw data of a hand (coming from the glove of course)"""
@@ -77,24 +97,35 @@ class Glove:
         return res
     
     def toFile(self):
-        res = "<glove>\n"
-        res += str(self._timestamp) + "\n"
-        res += str(self._quality) + "\n"
-        if self._l_or_r == 0:
-            res += "left\n"
-        else:
-            res += "right\n"
-        res += str(self._finger_number)+"\n"
-        res += str(self._position[0])+" "+str(self._position[1])+" "+str(self._position[2])+"\n"
-        res += str(self._orientation[0])+" "+str(self._orientation[1])+" "+str(self._orientation[2])+"\n"
-        res += str(self._orientation[3])+" "+str(self._orientation[4])+" "+str(self._orientation[5])+"\n"
-        res += str(self._orientation[6])+" "+str(self._orientation[7])+" "+str(self._orientation[8])+"\n"
-        res += "<fingers>\n"
+        p = self._position
+        o = self._orientation
+        res = ["<glove>\n%s\n%s\n%s\n%s\n%s %s %s\n%s %s %s\n%s %s %s\n%s %s %s\n<fingers>\n" % (
+            self._timestamp, self._quality, "left" if self._l_or_r == 0 else "right", self._finger_number,
+            p[0], p[1], p[2], o[0], o[1], o[2], o[3], o[4], o[5], o[6], o[7], o[8])]
         for finger in self._fingers:
-            res += finger.toFile()
-        res += "</fingers>\n</glove>\n\n"
-        return res
-        
+            res.append(finger.toFile())
+        res.append("</fingers>\n</glove>\n\n")
+        return "".join(res)
+
+    def toRecord(self):
+        """Return the glove as a flat list of GLOVE_RECORD_SIZE floats"""
+        rec = [float(self._timestamp), float(self._id), float(self._quality), float(self._l_or_r), float(self._finger_number)]
+        rec += self._position
+        rec += self._orientation
+        for finger in self._fingers:
+            rec += finger.toRecord()
+        return rec
+
+
+def gloveFromRecord(rec):
+    """Create a Glove from a flat list of numbers, the opposite of Glove.toRecord"""
+    fingers = list()
+    i = GLOVE_HEADER_SIZE
+    for name in FINGER_NAME_LIST:
+        fingers.append(Finger(name, list(rec[i:i+3]), list(rec[i+3:i+12]), rec[i+12], list(rec[i+13:i+16]), list(rec[i+16:i+18])))
+        i += FINGER_RECORD_SIZE
+    return Glove(rec[0], int(rec[1]), rec[2], int(rec[3]), int(rec[4]), fingers, list(rec[5:8]), list(rec[8:17]))
+
 
 class RecoTuple:
     """To store the data of a glove after feature extraction"""
@@ -127,6 +158,34 @@ class GestureClass:
         self._train_sample_nb = 0
         self._base_weight = 0
         self._co_matrix = Matrix(len(self._feature_list))
+
+        # bumped whenever the sample list changes, the cached statistics
+        # below are only valid for the (version, train_sample_nb) they were computed for
+        self._version = 0
+        self._avg_list = None
+        self._avg_key = None
+        self._co_key = None
+        self._weight_key = None
+
+        # number of samples of a class trained out of core (see setStatistics): its
+        # samples are not kept, only their averages and covariance matrix
+        self._sample_nb = None
+
+        # the class of a base model this one is adapted from (see setPrior), and
+        # how many samples of the user the base class is worth
+        self._prior = None
+        self._prior_weight = 0
+
+        # the maximum number of samples kept, see setSampleBudget
+        self._budget = None
+        self._budget_policy = 'reservoir'
+        self._budget_tolerance = DEFAULT_BUDGET_TOLERANCE
+        self._seen_nb = 0
+        self._stream_stats = None
+        self._random = None
+        # the part of the samples kept for training, the other ones are held out to
+        # measure the precision (None if the class doesn't know it)
+        self._train_ratio = None
     
         #self._trained = False
 
@@ -140,57 +199,347 @@ class GestureClass:
             for ele in s:
                 res += str(ele) + " "
             res += "\n"
-        res += "</samples>\n</class>\n"
+        res += "</samples>\n"
+        if self._sample_nb is not None:
+            res += "<statistics>\n" + str(self._sample_nb) + "\n"
+            res += " ".join([str(a) for a in self._avg_list]) + "\n"
+            res += str(self._co_matrix)
+            res += "</statistics>\n"
+        res += "</class>\n"
         return res
+
+    def readStatistics(self, lines, i):
+        """Read the statistics written by __str__ from the line after <statistics>.
+            Return the index of the line </statistics>"""
+        sample_nb = int(lines[i])
+        avg_list = [float(a) for a in lines[i+1].split()]
+        size = self._co_matrix._size
+        k = 0
+        while k < size:
+            row = [float(v) for v in lines[i+2+k].split()]
+            m = 0
+            while m < size:
+                self._co_matrix.set(k,m,row[m])
+                m += 1
+            k += 1
+        self._version += 1
+        self._sample_nb = sample_nb
+        self._avg_list = avg_list
+        self._avg_key = self.getStatisticsKey()
+        self._co_key = self.getStatisticsKey()
+        return i + 2 + size
     
-    def getFeatureAverage(self, f_id):
-        """Compute the average value of a given feature"""
-        res = 0
+    def addSample(self, s_list):
+        """Append a sample and invalidate the cached statistics"""
+        if self._sample_nb is not None:
+            # the statistics of a class trained out of core can't be updated
+            # sample by sample, the class has to be trained again with its new samples
+            self._sample_nb = None
+            self._train_sample_nb = 0
+        if self._budget is not None:
+            self._seen_nb += 1
+            self._stream_stats.addSample(s_list)
+            if self._budget_policy == 'reservoir' and len(self._sample_list) >= self._budget:
+                # each of the samples seen so far is kept with the same probability. Only the
+                # training samples are replaced: the held-out ones at the end of the list stay
+                # the same, so the precision is measured on samples never trained on
+                k = self._random.randrange(self._seen_nb)
+                if k < self.getReservoirTrainNumber():
+                    self._sample_list[k] = s_list
+                    self._version += 1
+                return
+        self._sample_list.append(s_list)
+        self._version += 1
+        if self._budget_policy == 'kcenter' and self._budget is not None and len(self._sample_list) >= 2 * self._budget:
+            # reduced by batches, the selection looks at all the samples
+            self.reduceSamples()
+
+    def setSampleBudget(self, budget, policy='reservoir', tolerance=DEFAULT_BUDGET_TOLERANCE, seed=None, train_ratio=None):
+        """Keep at most budget samples (None for no limit), so that the model file, its loading and
+            the training stay bounded however long the user trains. The samples kept are chosen by:
+            - 'reservoir': a uniform random sample of all the samples added to the class
+            - 'kcenter': a coreset covering all the regions of the samples (see selectCoreset); it
+              is replaced by a random sample if its averages or covariance matrix are too far
+              from the ones of all the samples (more than tolerance, see getSampleBudgetError).
+              The selection is done when the class reaches twice the budget, so it keeps
+              between budget and 2 * budget samples
+            train_ratio is the part of the samples used for training (see Classifier.setTrainRatio),
+            the reservoir keeps the held-out ones apart"""
+        if policy not in ('reservoir', 'kcenter'):
+            raise ValueError("Unknown policy for the sample budget: "+str(policy))
+        self._budget = budget
+        self._train_ratio = train_ratio
+        self._budget_policy = policy
+        self._budget_tolerance = tolerance
+        if seed is None:
+            # the same samples are kept by classifiers fed with the same ones, e.g. in an ensemble
+            seed = self._name
+        self._random = random.Random(seed)
+        self._seen_nb = len(self._sample_list)
+        # the statistics of all the samples, the ones kept are compared to them
+        self._stream_stats = SampleStatistics(len(self._feature_list))
+        for s in self._sample_list:
+            self._stream_stats.addSample(s)
+        if budget is not None and len(self._sample_list) > budget:
+            self.reduceSamples()
+
+    def reduceSamples(self):
+        """Keep budget samples of the sample list, in their order"""
+        n = len(self._sample_list)
+        if self._budget_policy == 'kcenter':
+            stats = self._stream_stats
+            scale_list = list()
+            for i in range(len(self._feature_list)):
+                var = stats.getCenteredProduct(i, i, [stats.getAverage(f) for f in range(len(self._feature_list))]) / len(stats)
+                scale_list.append(math.sqrt(var) if var > 0 else 1.0)
+            index_list = selectCoreset(self._sample_list, self._budget, scale_list)
+            if max(self.getSampleBudgetError(index_list)) > self._budget_tolerance:
+                print("The coreset of gesture <",self._name,"> is too far from its samples, a random sample is kept.")
+                index_list = sorted(self._random.sample(range(n), self._budget))
+        elif self._train_ratio is None:
+            index_list = sorted(self._random.sample(range(n), self._budget))
+        else:
+            # the training and the held-out samples are reduced apart, none goes to the other part
+            split = int(n * self._train_ratio)
+            train_nb = self.getReservoirTrainNumber()
+            index_list = sorted(self._random.sample(range(split), train_nb))
+            index_list += sorted(self._random.sample(range(split, n), self._budget - train_nb))
+        self._sample_list[:] = [self._sample_list[i] for i in index_list]
+        self._train_sample_nb = min(self._train_sample_nb, len(self._sample_list))
+        self._version += 1
+
+    def getReservoirTrainNumber(self):
+        """How many of the budget samples are training samples, the same split as Classifier.train"""
+        if self._train_ratio is None:
+            return self._budget
+        return int(self._budget * self._train_ratio)
+
+    def getSampleBudgetError(self, index_list=None):
+        """Compare the samples kept (or the ones of index_list) to all the samples added since the
+            budget was set. Return (the largest difference of the average of a feature, in standard
+            deviations of the feature, the difference of the covariance matrices relative to the one
+            of all the samples, by the Frobenius norm)"""
+        if index_list is None:
+            index_list = range(len(self._sample_list))
+        kept = SampleStatistics(len(self._feature_list))
+        for i in index_list:
+            kept.addSample(self._sample_list[i])
+        stats = self._stream_stats
+        if len(kept) == 0 or len(stats) == 0:
+            return 0.0, 0.0
+        size = len(self._feature_list)
+        avg_list = [stats.getAverage(i) for i in range(size)]
+        kept_avg_list = [kept.getAverage(i) for i in range(size)]
+        avg_error = 0.0
+        diff = 0.0
+        norm = 0.0
+        i = 0
+        while i < size:
+            var = stats.getCenteredProduct(i, i, avg_list) / len(stats)
+            if var > 0:
+                avg_error = max(avg_error, abs(kept_avg_list[i] - avg_list[i]) / math.sqrt(var))
+            j = 0
+            while j < size:
+                v = stats.getCenteredProduct(i, j, avg_list) / len(stats)
+                kept_v = kept.getCenteredProduct(i, j, kept_avg_list) / len(kept)
+                diff += pow(kept_v - v, 2)
+                norm += pow(v, 2)
+                j += 1
+            i += 1
+        if norm == 0:
+            return avg_error, 0.0
+        return avg_error, math.sqrt(diff / norm)
+
+    def copy(self):
+        """Copy the class with its cached statistics, the samples themselves are shared"""
+        c = GestureClass(self._name, [Feature(f._name, f._weight) for f in self._feature_list])
+        c._sample_list = list(self._sample_list)
+        c._train_sample_nb = self._train_sample_nb
+        c._base_weight = self._base_weight
+        c._co_matrix = self._co_matrix.copy()
+        c._version = self._version
+        c._avg_list = self._avg_list
+        c._avg_key = self._avg_key
+        c._co_key = self._co_key
+        c._weight_key = self._weight_key
+        c._sample_nb = self._sample_nb
+        c._prior = self._prior
+        c._prior_weight = self._prior_weight
+        # the copy of a snapshot replaces the class after its training, it goes on with the same budget
+        c._budget = self._budget
+        c._budget_policy = self._budget_policy
+        c._budget_tolerance = self._budget_tolerance
+        c._seen_nb = self._seen_nb
+        c._stream_stats = self._stream_stats
+        c._random = self._random
+        c._train_ratio = self._train_ratio
+        return c
+
+    def clearSamples(self):
+        del self._sample_list[:]
+        self._train_sample_nb = 0
+        self._sample_nb = None
+        self._version += 1
+        if self._budget is not None:
+            self._seen_nb = 0
+            self._stream_stats = SampleStatistics(len(self._feature_list))
+
+    def getSampleNumber(self):
+        """The number of samples of the class, training and test ones"""
+        if self._sample_nb is not None:
+            return self._sample_nb
+        return len(self._sample_list) + self._prior_weight
+
+    def isTrained(self):
+        """Whether the class has weights: it has training samples or a prior"""
+        return self._train_sample_nb > 0 or self._prior is not None
+
+    def setPrior(self, prior, prior_weight):
+        """Adapt the class from the trained class of a base model: its averages and its covariance
+            matrix are the MAP estimates with the base class as a prior worth prior_weight samples,
+            so that a few samples of the user are enough (see calculateFeatureAverages)"""
+        self._prior = prior
+        self._prior_weight = prior_weight
+        self._version += 1
+
+    def isTrainedOutOfCore(self):
+        return self._sample_nb is not None
+
+    def setStatistics(self, stats, sample_nb):
+        """Take the averages and the covariance matrix from the SampleStatistics of the training
+            samples instead of the sample list, which is emptied.
+            sample_nb --> the number of samples, training and test ones"""
+        del self._sample_list[:]
+        self._version += 1
+        self._train_sample_nb = len(stats)
+        self._sample_nb = sample_nb
+        size = self._co_matrix._size
+        avg_list = [round(stats.getAverage(f_id), GP) for f_id in range(size)]
+        i = 0
+        while i < size:
+            j = i
+            while j < size:
+                res = stats.getCenteredProduct(i, j, avg_list)
+                self._co_matrix.set(i,j,round(res,GP))
+                self._co_matrix.set(j,i,round(res,GP))
+                j += 1
+            i += 1
+        self._avg_list = avg_list
+        self._avg_key = self.getStatisticsKey()
+        self._co_key = self.getStatisticsKey()
+        print("Covariance Matrix is done for gesture <",self._name,"> with",len(stats),"streamed samples")
+
+    def getStatisticsKey(self):
+        """The key identifying the training samples the cached statistics depend on"""
+        return (self._version, self._train_sample_nb)
+
+    def calculateFeatureAverages(self):
+        """Compute the average value of every feature once and cache them until the samples change"""
+        key = self.getStatisticsKey()
+        if self._avg_key == key:
+            return self._avg_list
+        avg_list = [0.0] * len(self._feature_list)
         i = 0
         while i < self._train_sample_nb:
-            res += self._sample_list[i][f_id]
+            s = self._sample_list[i]
+            f_id = 0
+            while f_id < len(avg_list):
+                avg_list[f_id] += s[f_id]
+                f_id += 1
             i += 1
-        res = round(res / self._train_sample_nb, GP)
-        return res
+        sample_nb = self._train_sample_nb
+        if self._prior is not None:
+            # the average of the base class counts as prior_weight samples
+            prior_avg_list = self._prior.calculateFeatureAverages()
+            f_id = 0
+            while f_id < len(avg_list):
+                avg_list[f_id] += self._prior_weight * prior_avg_list[f_id]
+                f_id += 1
+            sample_nb += self._prior_weight
+        f_id = 0
+        while f_id < len(avg_list):
+            avg_list[f_id] = round(avg_list[f_id] / sample_nb, GP)
+            f_id += 1
+        self._avg_list = avg_list
+        self._avg_key = key
+        return avg_list
+
+    def getFeatureAverage(self, f_id):
+        """Compute the average value of a given feature"""
+        return self.calculateFeatureAverages()[f_id]
+
+    def isCovarianceMatrixUpToDate(self):
+        return self._co_key == self.getStatisticsKey()
 
     def calculateCovarianceMatrix(self):
+        """Compute the covariance matrix of the training samples, skipped if the samples didn't change"""
+        if self.isCovarianceMatrixUpToDate():
+            return False
+        avg_list = self.calculateFeatureAverages()
+        size = self._co_matrix._size
         i = 0
-        j = 0
-        while i < self._co_matrix._size:
-            while j < self._co_matrix._size:
+        while i < size:
+            j = i
+            while j < size:
                 res = 0
                 k = 0
                 while k < self._train_sample_nb:
-                    res += (self._sample_list[k][i] - self.getFeatureAverage(i)) * (self._sample_list[k][j] - self.getFeatureAverage(j))
+                    s = self._sample_list[k]
+                    res += (s[i] - avg_list[i]) * (s[j] - avg_list[j])
                     k += 1
+                if self._prior is not None:
+                    res += self.getPriorScatter(i, j, avg_list)
+                # the matrix is symmetric
                 self._co_matrix.set(i,j,round(res,GP))
+                self._co_matrix.set(j,i,round(res,GP))
                 j += 1
-            j = 0
             i += 1
+        self._co_key = self.getStatisticsKey()
 
         print("Covariance Matrix is done for gesture <",self._name,">")
+        return True
+
+    def getPriorScatter(self, i, j, avg_list):
+        """The part of the prior in the (i, j) element of the covariance matrix of an adapted class:
+            the matrix of the base class scaled down to prior_weight samples, plus the
+            spread between the average of the base class and the adapted one"""
+        prior = self._prior
+        prior_avg_list = prior.calculateFeatureAverages()
+        res = self._prior_weight * (prior_avg_list[i] - avg_list[i]) * (prior_avg_list[j] - avg_list[j])
+        res += prior._co_matrix.get(i,j) * self._prior_weight / prior._train_sample_nb
+        return res
 
-    def calculateFeatureWeight(self, inv_ccmatrix):
+    def calculateFeatureWeight(self, inv_ccmatrix, cc_version=None):
+        """Compute the weight of each feature from the inverted common covariance matrix.
+            cc_version identifies the common matrix, the weights are kept if neither it nor the samples changed"""
         if inv_ccmatrix is None:
             print("Calculate common inverse matrix first")
             return None
         else:
+            key = (self.getStatisticsKey(), cc_version)
+            if cc_version is not None and self._weight_key == key:
+                return False
+            avg_list = self.calculateFeatureAverages()
             f_id = 0
             while f_id < len(self._feature_list):
                 i = 0
                 w = 0
                 while i < len(self._feature_list):
-                    w += inv_ccmatrix.get(i,f_id) * self.getFeatureAverage(i)
+                    w += inv_ccmatrix.get(i,f_id) * avg_list[i]
                     i += 1
                 self._feature_list[f_id].setWeight(round(w,GP))
                 f_id += 1
+            self.calculateBaseWeight()
+            self._weight_key = key
             print("Feature weights calculation is done.")
+            return True
         
     def calculateBaseWeight(self):
+        avg_list = self.calculateFeatureAverages()
         w = 0
         i = 0
         while i < len(self._feature_list):
-            w += self._feature_list[i]._weight * self.getFeatureAverage(i)
+            w += self._feature_list[i]._weight * avg_list[i]
             i += 1
         w = - (w / 2)
         self._base_weight = round(w,GP)
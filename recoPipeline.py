@@ -1,38 +1,228 @@
 from dataAcquisition import DataReceiver
-from featureExtraction import FeatureExtractor
+from featureExtraction import FeatureExtractor, DEFAULT_FEATURE_NAME_LIST
 from classifier import Rubine
+from recoUtils import SampleStatistics, ReservoirSample
+from recoDataStructure import RecoTuple
 
 class RecoPipeline:
     """A gesture dependents only on the forme of the hand, and is the same (symmetric) for left and right hand
         More complicated gestures sure dependent on the combination of both hands's gestures
     """
-    def __init__(self):
+    def __init__(self, classifier=None, seg_threshold=5):
+        """classifier --> any Classifier (e.g. Rubine, KNNClassifier, EnsembleClassifier), Rubine by default
+            seg_threshold --> the number of frames averaged in a segment"""
         # for training, use right hand
         self._dataReceiver = DataReceiver(1)
-        self._featureExtractor = FeatureExtractor()
         
-        self._classifier = Rubine("conf/feature_list.txt")
+        if classifier is None:
+            classifier = Rubine("conf/feature_list.txt")
+        self._classifier = classifier
+        # the features are the ones of the classifier
+        self._featureExtractor = FeatureExtractor(seg_threshold, classifier.getFeatureNames())
+        # trains the classifier in background while it keeps recognizing, created with the
+        # first training so that the recognition alone doesn't import the threading modules
+        self._modelTrainer = None
+
+        # optional stages between the data receiver and the feature extractor
+        self._positionFilter = None
+        self._preprocessor = None
+
+        # optional recognizer of motion gestures, fed with the same RecoTuples
+        self._temporalRecognizer = None
+        self._motionGesture = None
+
+        # optional FrameKernel replacing the feature extraction and the classifier for the recognition
+        self._frameKernel = None
+
+        # optional FeatureCache of the features of the recordings
+        self._featureCache = None
+
+        # optional GesturePublisher of the recognized gestures
+        self._publisher = None
         
+    def setPositionFilter(self, position_filter):
+        """Smooth the finger positions with a FingerPositionFilter, before the preprocessing"""
+        self._positionFilter = position_filter
+
+    def setPreprocessor(self, preprocessor):
+        """Filter and normalise the frames with a FramePreprocessor before the feature extraction"""
+        self._preprocessor = preprocessor
+
+    def setFrameKernel(self, kernel):
+        """Recognize the hand poses with a FrameKernel, which fuses the feature extraction and
+            the scores of the Rubine classifier in one call per frame. None to stop using it.
+            It isn't used while there is a temporal recognizer, which needs the RecoTuples"""
+        if kernel is not None and not isinstance(self._classifier, Rubine):
+            print("The frame kernel only works with the Rubine classifier.")
+            return
+        if kernel is not None and self._classifier.getFeatureNames() != DEFAULT_FEATURE_NAME_LIST:
+            print("The frame kernel only computes the default features.")
+            return
+        if kernel is not None and type(self._featureExtractor) is not FeatureExtractor:
+            print("The frame kernel only cuts segments of a fixed length.")
+            return
+        self._frameKernel = kernel
+
+    def setFeatureExtractor(self, extractor):
+        """Replace the feature extractor, e.g. by an AdaptiveFeatureExtractor; it computes the
+            features of the classifier"""
+        extractor.setFeatureNames(self._classifier.getFeatureNames())
+        self._featureExtractor = extractor
+        if type(extractor) is not FeatureExtractor:
+            self._frameKernel = None
+
+    def setPublisher(self, publisher):
+        """Send the recognized gestures to a GesturePublisher, None to stop. The classes are then
+            recognized with their probability (see Classifier.predictWithConfidence)"""
+        self._publisher = publisher
+
+    def flushEvents(self):
+        """Send the gesture events the publisher couldn't send yet, see GesturePublisher.flush"""
+        if self._publisher is not None:
+            self._publisher.flush()
+
+    def classifySegment(self, rtuple, receive_time=None):
+        """Return the name of the class recognized for a RecoTuple, published if there is a publisher"""
+        if self._publisher is None:
+            return self._classifier.predict([rtuple._s_list])[0]
+        name, confidence = self._classifier.predictWithConfidence(rtuple._s_list)
+        self._publisher.publish(name, confidence, rtuple._l_or_r, rtuple._timestamp, receive_time)
+        return name
+
+    def prepareFrame(self, sample):
+        """Pass a frame through the position filter and the preprocessing.
+            Return (glove, weight), the glove is None if the frame is dropped"""
+        if sample is None:
+            return None, 0.0
+        if self._positionFilter is not None:
+            sample = self._positionFilter.filterGlove(sample)
+        weight = 1.0
+        if self._preprocessor is not None:
+            sample, weight = self._preprocessor.process(sample)
+        return sample, weight
+
+    def processFrame(self, sample):
+        """Pass a frame through the preprocessing and the feature extraction.
+            Return the RecoTuple if a segment is done, None otherwise"""
+        sample, weight = self.prepareFrame(sample)
+        if sample is None:
+            return None
+        self._featureExtractor.addSampleFrame(sample, weight)
+        if self._featureExtractor._seg_activated == True:
+            return self._featureExtractor.getRecoTuple()
+        return None
+
+    def reset(self):
+        """Forget the frames seen so far, e.g. between two recordings or when the recognition
+            restarts: the state of the position filter, the segment being cut (by the feature
+            extractor or the frame kernel) and the sequence of the temporal recognizer"""
+        if self._positionFilter is not None:
+            self._positionFilter.reset()
+        self._featureExtractor.reset()
+        if self._frameKernel is not None:
+            self._frameKernel.reset()
+        if self._temporalRecognizer is not None:
+            self._temporalRecognizer.reset()
+
+    def setFeatureCache(self, cache):
+        """Keep the features of the recordings in a FeatureCache, None to stop using it"""
+        self._featureCache = cache
+
+    def getFrameConfig(self):
+        """A string describing how the features of a frame are computed, see FeatureCache.
+            The stages with a state (the filter, the calibration of the hand profile) are
+            described by their state when the recording is read"""
+        config = "features=" + ",".join([f._name for f in self._classifier._feature_list])
+        if self._positionFilter is not None:
+            config += ";" + self._positionFilter.getConfig()
+        if self._preprocessor is not None:
+            config += ";" + self._preprocessor.getConfig()
+        return config
+
+    def iterRecoTuplesFromFile(self, file_path):
+        """Yield the RecoTuples of the segments of a recording"""
+        if self._featureCache is not None:
+            for rtuple in self.iterCachedRecoTuples(file_path):
+                yield rtuple
+            return
+        self.reset()
+        try:
+            for sample in self._dataReceiver.iterDataFromFile(file_path):
+                rtuple = self.processFrame(sample)
+                if rtuple is not None:
+                    yield rtuple
+        finally:
+            self.reset()
+
+    def iterFeatureFrames(self, file_path, writer):
+        """Yield (feature values, header, weight) for the frames of a recording, and write them
+            to the cache: header, weight, then the feature values"""
+        for sample in self._dataReceiver.iterDataFromFile(file_path):
+            glove, weight = self.prepareFrame(sample)
+            if glove is None:
+                continue
+            s_list = self._featureExtractor.computeFeatures(glove)
+            header = (glove._timestamp, glove._id, glove._quality, glove._l_or_r, glove._finger_number)
+            writer.write(list(header) + [weight] + s_list)
+            yield s_list, header, weight
+
+    def iterCachedRecoTuples(self, file_path):
+        """Like iterRecoTuplesFromFile, but the segments are read from the feature cache when the
+            recording was seen with the same configuration, and are cut from the cached features
+            of the frames when only the segmentation changed"""
+        cache = self._featureCache
+        dim = self._featureExtractor.getFeatureNumber()
+        frame_config = self.getFrameConfig()
+        seg_config = frame_config + ";" + self._featureExtractor.getSegmentationConfig()
+        path = cache.lookup(file_path, seg_config)
+        if path is not None:
+            for rec in cache.iterRecords(path, 5 + dim):
+                yield RecoTuple(rec[0], int(rec[1]), rec[2], int(rec[3]), int(rec[4]), rec[5:])
+            return
+
+        seg_writer = cache.createWriter(file_path, seg_config)
+        frame_writer = None
+        frame_path = cache.lookup(file_path, frame_config)
+        if frame_path is not None:
+            frame_iter = ((rec[6:], (rec[0], int(rec[1]), rec[2], int(rec[3]), int(rec[4])), rec[5])
+                          for rec in cache.iterRecords(frame_path, 6 + dim))
+        else:
+            frame_writer = cache.createWriter(file_path, frame_config)
+            frame_iter = self.iterFeatureFrames(file_path, frame_writer)
+        complete = False
+        self.reset()
+        try:
+            for s_list, header, weight in frame_iter:
+                self._featureExtractor.addFeatureFrame(s_list, header, weight)
+                if self._featureExtractor._seg_activated:
+                    rtuple = self._featureExtractor.getRecoTuple()
+                    seg_writer.write([rtuple._timestamp, rtuple._id, rtuple._quality, rtuple._l_or_r, rtuple._finger_number] + rtuple._s_list)
+                    yield rtuple
+            complete = True
+        finally:
+            self.reset()
+            # the files of a recording which wasn't read to the end are dropped
+            for writer in (frame_writer, seg_writer):
+                if writer is None:
+                    continue
+                if complete:
+                    writer.commit()
+                else:
+                    writer.abort()
 
     def trainFromFile(self, file_path, gclass_name):
         """Use samples to train the pipeline (learning process)
             file_path --> the file which contains training samples
             gclass_name --> the name of associated gesture class
         """
-        self._dataReceiver.readDataFromFile(file_path)
         if not self._classifier.hasGestureClass(gclass_name):
             self._classifier.createGestureClass(gclass_name)
         
-        sample = self._dataReceiver.getOneSampleFrameFile()
-        # while there are still data to treat
-        while sample != None:
-            self._featureExtractor.addSampleFrame(sample)
-            if self._featureExtractor._seg_activated == True:
-                rtuple = self._featureExtractor.getRecoTuple()
-                #print(rtuple._s_list)
+        # the frames are decoded from the file (or the feature cache) while they are treated
+        for rtuple in self.iterRecoTuplesFromFile(file_path):
+            #print(rtuple._s_list)
             
-                self._classifier.addRecoTupleForTraining(rtuple, gclass_name)
-            sample = self._dataReceiver.getOneSampleFrameFile()
+            self._classifier.addRecoTupleForTraining(rtuple, gclass_name)
     
         # start the training process
         self._classifier.train(gclass_name)
@@ -58,28 +248,232 @@ class RecoPipeline:
 
         # reset the objects
         del self._dataReceiver._gloveDataList[:]
-        del self._featureExtractor._sample_list[:]
+        self.reset()
+
+    def trainOutOfCore(self, pair_list, reservoir_size=0):
+        """Train the classifier with recordings which don't fit in memory, with the same result
+            as trainFromFile for each of them. The recordings are read twice, frame by frame:
+            the first pass counts the segments of each gesture class, the second one
+            accumulates the statistics of the first 80 percent (the train ratio) of them.
+            pair_list --> list of (gesture class name, file path)
+            reservoir_size --> number of test segments per class kept to compute the precision.
+            Return a dict class name -> 0 if done, 1 if there are not enough samples,
+            None if the classifier can't be trained out of core"""
+        if not self.canTrainOutOfCore():
+            print("The classifier",self._classifier.__class__.__name__,"can't be trained out of core.")
+            return None
+        # the second pass has to cut the same segments as the first one, e.g. when the hand
+        # profile is still being calibrated: the preprocessor goes back to its state
+        state = None
+        if self._preprocessor is not None:
+            state = self._preprocessor.getState()
+        sample_nb_dict = dict()
+        for gclass_name, file_path in pair_list:
+            n = 0
+            for rtuple in self.iterRecoTuplesFromFile(file_path):
+                n += 1
+            sample_nb_dict[gclass_name] = sample_nb_dict.get(gclass_name, 0) + n
+        if state is not None:
+            self._preprocessor.setState(state)
+
+        dim = self._featureExtractor.getFeatureNumber()
+        stats_dict = dict()
+        reservoir_dict = dict()
+        # number of segments of each class seen in the second pass
+        seen_dict = dict()
+        for gclass_name, file_path in pair_list:
+            if gclass_name not in stats_dict:
+                stats_dict[gclass_name] = SampleStatistics(dim)
+                reservoir_dict[gclass_name] = ReservoirSample(reservoir_size)
+                seen_dict[gclass_name] = 0
+            stats = stats_dict[gclass_name]
+            train_nb = int(sample_nb_dict[gclass_name] * self._classifier._train_ratio)
+            for rtuple in self.iterRecoTuplesFromFile(file_path):
+                if seen_dict[gclass_name] < train_nb:
+                    stats.addSample(rtuple._s_list)
+                else:
+                    reservoir_dict[gclass_name].add(rtuple._s_list)
+                seen_dict[gclass_name] += 1
+
+        res = self._classifier.trainFromStatistics(stats_dict, sample_nb_dict)
+        for gclass_name, reservoir in reservoir_dict.items():
+            if res.get(gclass_name) == 0 and len(reservoir) != 0:
+                s_list = reservoir.getItems()
+                precision = self._classifier.score(s_list, [gclass_name] * len(s_list))
+                print("The precision of <",gclass_name,"> is:",round(precision, 4) * 100,"% on",len(s_list),"test segments")
+        return res
+
+    def getClassifier(self):
+        return self._classifier
+
+    def predict(self, sample_list):
+        """The name of the class recognized for the sample list of each RecoTuple"""
+        return self._classifier.predict(sample_list)
+
+    def score(self, sample_list, label_list):
+        """The fraction of the sample lists which are recognized as their label"""
+        return self._classifier.score(sample_list, label_list)
+
+    def setHierarchical(self, group_nb):
+        """Score the classes by groups, see Rubine.setHierarchical.
+            Return False if the classifier isn't a Rubine one"""
+        if not isinstance(self._classifier, Rubine):
+            return False
+        self._classifier.setHierarchical(group_nb)
+        return True
+
+    def saveHandProfile(self, fpath):
+        """Save the hand profile of the preprocessor, to normalise the frames of the same user
+            next time. Return False if there is no preprocessor"""
+        if self._preprocessor is None:
+            return False
+        self._preprocessor.getProfile().saveToFile(fpath)
+        return True
+
+    def canTrainOutOfCore(self):
+        """Whether the classifier builds its model from the statistics of the samples (Rubine)"""
+        return self._classifier.canTrainFromStatistics()
 
     def calcultatePrecision(self, gclass_name):
         """Get the precision of recognition for a given gesture class"""
         return self._classifier.calcultatePrecision(gclass_name)
 
+    def setClassifier(self, classifier):
+        """Replace the classifier, e.g. to compare another backend on the same data"""
+        self._classifier = classifier
+        self._featureExtractor.setFeatureNames(classifier.getFeatureNames())
+        if self._frameKernel is not None and (not isinstance(classifier, Rubine) or classifier.getFeatureNames() != DEFAULT_FEATURE_NAME_LIST):
+            # see setFrameKernel
+            print("The frame kernel is dropped, it only works with the default features of a Rubine classifier.")
+            self._frameKernel = None
+        if self._modelTrainer is not None:
+            self._modelTrainer.setClassifier(classifier)
+
+    def setSampleBudget(self, budget, policy='reservoir'):
+        """Keep at most budget samples per gesture class, see Classifier.setSampleBudget"""
+        self._classifier.setSampleBudget(budget, policy)
+
+    def hasGestureClass(self, gclass_name):
+        return self._classifier.hasGestureClass(gclass_name)
+
+    def createGestureClass(self, gclass_name):
+        self._classifier.createGestureClass(gclass_name)
+
+    def getGestureClassNumber(self):
+        return len(self._classifier._class_list)
+
+    def train(self, gclass_name):
+        """Train the classifier with the samples received for a gesture class.
+            Return 0 if done, 1 if there are not enough samples"""
+        res = self._classifier.train(gclass_name)
+        if res == 0:
+            self._classifier.showTrainingResult()
+        return res
+
+    def trainInBackground(self, gclass_name):
+        """Train the classifier for a gesture class without stopping the recognition,
+            the result is given by pollTraining()"""
+        if self._modelTrainer is None:
+            from modelTrainer import ModelTrainer
+            self._modelTrainer = ModelTrainer(self._classifier)
+        self._modelTrainer.requestTraining(gclass_name)
+
+    def pollTraining(self):
+        """Install the models trained in background since the last call.
+            Return a list of (gesture class name, 0 if done / 1 if there are not enough samples)"""
+        if self._modelTrainer is None:
+            return list()
+        res_list = self._modelTrainer.poll()
+        for name, res in res_list:
+            if res == 0:
+                self._classifier.showTrainingResult()
+                break
+        return res_list
+
+    def isTraining(self):
+        return self._modelTrainer is not None and self._modelTrainer.isBusy()
+
+    def saveClassifier(self, fpath):
+        self._classifier.saveClassifierToFile(fpath)
+        self._classifier.saveCompiledModel(fpath)
+
+    def loadClassifier(self, fpath):
+        """Load the classifier, from its compiled cache when it is up to date"""
+        self._classifier.loadClassifier(fpath)
+
+    def loadBaseModel(self, fpath, prior_weight=None):
+        """Adapt the classifier from a base model trained with the samples of many users,
+            so that a user only needs a few samples per gesture (Rubine only)"""
+        if not isinstance(self._classifier, Rubine):
+            print("Only the Rubine classifier can be adapted from a base model.")
+            return
+        if prior_weight is None:
+            self._classifier.loadBaseModel(fpath)
+        else:
+            self._classifier.loadBaseModel(fpath, prior_weight)
+
     def trainRealTime(self, gclass_name, g_frame):
         """ For real time training"""
         self._dataReceiver.readRealTimeData(g_frame)
-        self._featureExtractor.addSampleFrame(self._dataReceiver.getOneSampleFrameRT())
-        if self._featureExtractor._seg_activated == True:
-            rtuple = self._featureExtractor.getRecoTuple()
+        rtuple = self.processFrame(self._dataReceiver.getOneSampleFrameRT())
+        if rtuple is not None:
             self._classifier.addRecoTupleForTraining(rtuple, gclass_name)
 
+    def setTemporalRecognizer(self, recognizer):
+        """Use a DTWRecognizer to recognize motion gestures beside the hand poses"""
+        self._temporalRecognizer = recognizer
+        self._motionGesture = None
+
+    def trainMotionFromFile(self, file_path, gclass_name):
+        """Use a file containing one performance of a motion gesture as a template"""
+        self._temporalRecognizer.createGestureClass(gclass_name)
+        for rtuple in self.iterRecoTuplesFromFile(file_path):
+            self._temporalRecognizer.addRecoTupleForTraining(rtuple, gclass_name)
+        return self._temporalRecognizer.train(gclass_name)
+
+    def getMotionGesture(self):
+        """The last motion gesture recognized by the temporal recognizer, None if there is none"""
+        return self._motionGesture
+
+    def recognizeSample(self, sample, receive_time=None):
+        """Return the name of the class recognized when the glove completes a segment, None otherwise.
+            receive_time --> time.monotonic() when the frame was received, for the publisher"""
+        if self._frameKernel is not None and self._temporalRecognizer is None:
+            sample, weight = self.prepareFrame(sample)
+            if sample is None:
+                return None
+            # the model is replaced as a whole after each training
+            self._frameKernel.setModel(self._classifier.getModel())
+            name = self._frameKernel.addFrame(sample, weight)
+            if name is not None and self._publisher is not None:
+                # the kernel gives no probability
+                self._publisher.publish(name, None, sample._l_or_r, sample._timestamp, receive_time)
+            return name
+        rtuple = self.processFrame(sample)
+        if rtuple is None:
+            return None
+        if self._temporalRecognizer is not None:
+            self._motionGesture = self._temporalRecognizer.recognition(rtuple)
+        return self.classifySegment(rtuple, receive_time)
+
+    def feedFrame(self, g_frame):
+        """Read an ARTGloveFrame received from the tracker, return the glove to recognize
+            (only the right hand for now, see DataReceiver)"""
+        self._dataReceiver.readRealTimeData(g_frame)
+        return self._dataReceiver.getOneSampleFrameRT()
+
     def recognition(self, g_frame):
         """The main function to do gesture recognition, now only for right hand (TODO)"""
-        self._dataReceiver.readRealTimeData(g_frame)
-        sample = self._dataReceiver.getOneSampleFrameRT()
+        sample = self.feedFrame(g_frame)
 
-        self._featureExtractor.addSampleFrame(sample)
-        if self._featureExtractor._seg_activated == True:
-            rtuple = self._featureExtractor.getRecoTuple()
+        if self._frameKernel is not None and self._temporalRecognizer is None:
+            return self.recognizeSample(sample, g_frame._receive_time)
+        rtuple = self.processFrame(sample)
+        if rtuple is not None:
+            if self._temporalRecognizer is not None:
+                self._motionGesture = self._temporalRecognizer.recognition(rtuple)
+            if self._publisher is not None:
+                return self.classifySegment(rtuple, g_frame._receive_time)
             return self._classifier.recognition(rtuple._s_list)
         else:
             return None
@@ -87,24 +481,20 @@ class RecoPipeline:
     def recognitionFromFile(self, file_path):
         """Gesture recognition for the data stored in a file"""
         print("Begin recognition process from file...")
-        self._dataReceiver.readDataFromFile(file_path)
-        
-        sample = self._dataReceiver.getOneSampleFrameFile()
         
         # while there are still data to treat
         n = 0
-        while sample != None:
-            self._featureExtractor.addSampleFrame(sample)
-            if self._featureExtractor._seg_activated == True:
-                rtuple = self._featureExtractor.getRecoTuple()
+        for rtuple in self.iterRecoTuplesFromFile(file_path):
+            if self._publisher is not None:
+                self.classifySegment(rtuple)
+            else:
                 self._classifier.recognition(rtuple._s_list)
-                print(rtuple._l_or_r, rtuple._timestamp)
-                n += 1
-            sample = self._dataReceiver.getOneSampleFrameFile()
+            print(rtuple._l_or_r, rtuple._timestamp)
+            n += 1
         print(n,"gestures are recognized from file.")
 
         
 if __name__ == "__main__":
     rp = RecoPipeline()
-    rp.train("data/flat_twohands.txt", "flat")
+    rp.trainFromFile("data/flat_twohands.txt", "flat")
     rp.calcultatePrecision("flat")
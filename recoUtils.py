@@ -1,4 +1,7 @@
+import heapq
 import math
+import random
+import threading
 
 def distanceOfPosition(pos1, pos2):
     """To get the distance between 2 given 3D points."""
@@ -23,6 +26,11 @@ class Matrix:
             res += '\n'
         return res
 
+    def copy(self):
+        m = Matrix(self._size)
+        m._rowlist = [list(row) for row in self._rowlist]
+        return m
+
     def get(self, r, c):
         """Get an element with the row and column number, start from 0"""
         return self._rowlist[r][c]
@@ -57,17 +65,29 @@ class Matrix:
     
 
     def determinant(self):
-        #print("determinant")
-        #print(self)
-        if self._size == 2:
-            return self._rowlist[0][0]*self._rowlist[1][1] - self._rowlist[0][1]*self._rowlist[1][0]
-        else:
-            res = 0
-            i = 0
-            while i < len(self._rowlist[0]):
-                res += pow(-1, i) * self._rowlist[0][i] * self.createSubMatrix(0,i).determinant()
-                i += 1
-            return res
+        """The determinant by Gaussian elimination with partial pivoting: the expansion by minors
+            costs n! operations, which is already too slow for a dozen features"""
+        m = [list(row) for row in self._rowlist]
+        res = 1
+        k = 0
+        while k < self._size:
+            pivot = max(range(k, self._size), key=lambda r: abs(m[r][k]))
+            if m[pivot][k] == 0:
+                return 0
+            if pivot != k:
+                m[k], m[pivot] = m[pivot], m[k]
+                res = -res
+            res *= m[k][k]
+            r = k + 1
+            while r < self._size:
+                f = m[r][k] / m[k][k]
+                c = k
+                while c < self._size:
+                    m[r][c] -= f * m[k][c]
+                    c += 1
+                r += 1
+            k += 1
+        return res
 
     def transpose(self):
         matrix = Matrix(self._size)
@@ -99,25 +119,424 @@ class Matrix:
         return matrix.transpose()
 
     def inverted(self):
-        """Get an inversed copy of the matrix.
-            a) Find the determinant of A -- |A|, shouldn't be 0
-            b) Find the adjoint of A -- adj(A)
-            c) The formula: Inv(A) = adj(A)/|A|"""
-        det = self.determinant()
-        if det == 0:
-            print("Impossible to get inverse, det=0")
-            return None
+        """Get an inversed copy of the matrix, by Gauss-Jordan elimination with partial pivoting.
+            Return None if the matrix is singular"""
+        n = self._size
+        # the matrix augmented with the identity, reduced until the left part is the identity
+        a = [list(row) + [0] * n for row in self._rowlist]
+        i = 0
+        while i < n:
+            a[i][n+i] = 1
+            i += 1
+        k = 0
+        while k < n:
+            pivot = max(range(k, n), key=lambda r: abs(a[r][k]))
+            if a[pivot][k] == 0:
+                print("Impossible to get inverse, det=0")
+                return None
+            a[k], a[pivot] = a[pivot], a[k]
+            p = a[k][k]
+            a[k] = [v / p for v in a[k]]
+            r = 0
+            while r < n:
+                if r != k and a[r][k] != 0:
+                    f = a[r][k]
+                    row = a[k]
+                    a[r] = [v - f * w for v, w in zip(a[r], row)]
+                r += 1
+            k += 1
+        m = Matrix(n)
+        m._rowlist = [row[n:] for row in a]
+        return m
+
+
+class SampleStatistics:
+    """The sufficient statistics of a stream of samples: their number, the sum of each feature
+        and the sum of the products of each pair of features. The values are shifted by the
+        first sample so that the sums stay small and the covariance doesn't lose precision"""
+    def __init__(self, dim):
+        self._dim = dim
+        self._n = 0
+        self._shift_list = None
+        self._sum_list = [0.0] * dim
+        # upper half of the symmetric matrix of the sums of products
+        self._product_rowlist = [[0.0] * (dim - i) for i in range(dim)]
+
+    def __len__(self):
+        return self._n
+
+    def addSample(self, s_list):
+        if self._shift_list is None:
+            self._shift_list = list(s_list)
+        d_list = [s - k for s, k in zip(s_list, self._shift_list)]
+        i = 0
+        while i < self._dim:
+            d = d_list[i]
+            self._sum_list[i] += d
+            row = self._product_rowlist[i]
+            j = i
+            while j < self._dim:
+                row[j - i] += d * d_list[j]
+                j += 1
+            i += 1
+        self._n += 1
+
+    def getAverage(self, i):
+        return self._shift_list[i] + self._sum_list[i] / self._n
+
+    def getCenteredProduct(self, i, j, center_list):
+        """The sum over the samples of (s[i] - center_list[i]) * (s[j] - center_list[j])"""
+        if j < i:
+            i, j = j, i
+        di = center_list[i] - self._shift_list[i]
+        dj = center_list[j] - self._shift_list[j]
+        return (self._product_rowlist[i][j - i] - di * self._sum_list[j]
+                - dj * self._sum_list[i] + self._n * di * dj)
+
+
+class ReservoirSample:
+    """A uniform random sample of at most capacity items of a stream of unknown length"""
+    def __init__(self, capacity, seed=None):
+        self._capacity = capacity
+        self._item_list = list()
+        self._seen_nb = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return len(self._item_list)
+
+    def add(self, item):
+        self._seen_nb += 1
+        if len(self._item_list) < self._capacity:
+            self._item_list.append(item)
         else:
-            m = self.adjoint()
+            k = self._random.randrange(self._seen_nb)
+            if k < self._capacity:
+                self._item_list[k] = item
+
+    def getItems(self):
+        return self._item_list
+
+
+def kMeans(point_list, weight_list, k, distance, seed=0, iteration_nb=20):
+    """Group weighted points into at most k clusters by the k-means algorithm, the first centers
+        being chosen by k-means++. distance(a, b) must be a squared distance for which the weighted
+        average of the points of a cluster is its center (e.g. a Mahalanobis distance).
+        Return the list of the clusters, as lists of point indices"""
+    rnd = random.Random(seed)
+    n = len(point_list)
+    if k >= n:
+        return [[i] for i in range(n)]
+    center_list = [list(point_list[rnd.randrange(n)])]
+    while len(center_list) < k:
+        d_list = [min([distance(p, c) for c in center_list]) for p in point_list]
+        total = sum(d_list)
+        if total <= 0:
+            break
+        x = rnd.uniform(0, total)
+        i = 0
+        while i < n - 1 and x > d_list[i]:
+            x -= d_list[i]
+            i += 1
+        center_list.append(list(point_list[i]))
+
+    owner_list = None
+    iteration = 0
+    while iteration < iteration_nb:
+        new_owner_list = [min(range(len(center_list)), key=lambda c: distance(p, center_list[c])) for p in point_list]
+        if new_owner_list == owner_list:
+            break
+        owner_list = new_owner_list
+        for c in range(len(center_list)):
+            index_list = [i for i in range(n) if owner_list[i] == c]
+            total = sum([weight_list[i] for i in index_list])
+            if total <= 0:
+                # an empty cluster keeps its center
+                continue
+            center_list[c] = [sum([weight_list[i] * point_list[i][f] for i in index_list]) / total
+                              for f in range(len(point_list[0]))]
+        iteration += 1
+    cluster_list = [[i for i in range(n) if owner_list[i] == c] for c in range(len(center_list))]
+    return [index_list for index_list in cluster_list if len(index_list) > 0]
+
+def selectCoreset(point_list, k, scale_list):
+    """Return the sorted indices of k points summarizing point_list: k centers are chosen farthest
+        first (the greedy k-center algorithm), so that every region of the points has one, then the
+        point closest to the average of the cluster of each center is kept instead of the center,
+        which is often an outlier. The features are divided by scale_list in the distances"""
+    n = len(point_list)
+    if k >= n:
+        return list(range(n))
+
+    def distance(a, b):
+        return sum([pow((x - y) / s, 2) for x, y, s in zip(a, b, scale_list)])
+
+    def closestToAverage(index_list):
+        avg = [sum([point_list[i][f] for i in index_list]) / len(index_list) for f in range(len(scale_list))]
+        return min(index_list, key=lambda i: distance(point_list[i], avg))
+
+    first = closestToAverage(range(n))
+    center_nb = 1
+    # distance of each point to its center, and the index of the center
+    d_list = [distance(p, point_list[first]) for p in point_list]
+    owner_list = [0] * n
+    while center_nb < k:
+        far = max(range(n), key=d_list.__getitem__)
+        p = point_list[far]
+        i = 0
+        while i < n:
+            d = distance(point_list[i], p)
+            if d < d_list[i]:
+                d_list[i] = d
+                owner_list[i] = center_nb
+            i += 1
+        center_nb += 1
+
+    cluster_list = [list() for c in range(center_nb)]
+    for i, c in enumerate(owner_list):
+        cluster_list[c].append(i)
+    return sorted([closestToAverage(index_list) for index_list in cluster_list if len(index_list) > 0])
+
+
+class RingBuffer:
+    """A bounded FIFO buffer between a producer and a consumer thread.
+        When the buffer is full, the policy decides what happens to a new item:
+        'drop_newest' refuses it, 'drop_oldest' overwrites the oldest one
+        and 'block' makes the producer wait for some free space"""
+    def __init__(self, capacity, policy='drop_newest'):
+        if policy not in ('drop_newest', 'drop_oldest', 'block'):
+            raise ValueError("Unknown policy for the ring buffer: "+str(policy))
+        self._capacity = capacity
+        self._policy = policy
+        self._item_list = [None]*capacity
+        self._head = 0 # index of the oldest item
+        self._size = 0
+        self._dropped_nb = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def push(self, item, timeout=None):
+        """Add an item, return False if an item had to be dropped.
+            Once the buffer is closed, the new items are refused and counted as dropped"""
+        with self._cond:
+            if self._closed:
+                self._dropped_nb += 1
+                return False
+            if self._size == self._capacity:
+                if self._policy == 'block':
+                    self._cond.wait_for(lambda: self._size < self._capacity or self._closed, timeout)
+                    if self._size == self._capacity or self._closed:
+                        self._dropped_nb += 1
+                        return False
+                elif self._policy == 'drop_oldest':
+                    self._item_list[self._head] = None
+                    self._head = (self._head + 1) % self._capacity
+                    self._size -= 1
+                    self._dropped_nb += 1
+                    self._item_list[(self._head + self._size) % self._capacity] = item
+                    self._size += 1
+                    self._cond.notify_all()
+                    return False
+                else:
+                    self._dropped_nb += 1
+                    return False
+            self._item_list[(self._head + self._size) % self._capacity] = item
+            self._size += 1
+            self._cond.notify_all()
+            return True
+
+    def pushAll(self, item_list):
+        """Add the items in arrival order with a single wake-up of the consumer.
+            Return the number of items dropped"""
+        if self._policy == 'block':
+            return len([item for item in item_list if not self.push(item)])
+        dropped_nb = 0
+        with self._cond:
+            if self._closed:
+                self._dropped_nb += len(item_list)
+                return len(item_list)
+            for item in item_list:
+                if self._size == self._capacity:
+                    dropped_nb += 1
+                    if self._policy == 'drop_newest':
+                        continue
+                    self._item_list[self._head] = None
+                    self._head = (self._head + 1) % self._capacity
+                    self._size -= 1
+                self._item_list[(self._head + self._size) % self._capacity] = item
+                self._size += 1
+            self._dropped_nb += dropped_nb
+            self._cond.notify_all()
+        return dropped_nb
+
+    def popAll(self, max_nb=None, timeout=None):
+        """Remove and return up to max_nb items in arrival order,
+            wait at most timeout seconds if the buffer is empty"""
+        with self._cond:
+            if self._size == 0 and not self._closed:
+                self._cond.wait_for(lambda: self._size > 0 or self._closed, timeout)
+            n = self._size
+            if max_nb is not None and max_nb < n:
+                n = max_nb
+            res = list()
             i = 0
-            j = 0
-            while i < m._size:
-                while j < m._size:
-                    m._rowlist[i][j] = m._rowlist[i][j] / det
-                    j += 1
-                j = 0
+            while i < n:
+                res.append(self._item_list[self._head])
+                self._item_list[self._head] = None
+                self._head = (self._head + 1) % self._capacity
                 i += 1
-            return m
+            self._size -= n
+            if n > 0:
+                self._cond.notify_all()
+            return res
+
+    def close(self):
+        """Refuse the new items and wake up the threads waiting on the buffer,
+            the remaining items can still be popped"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def open(self):
+        """Accept items again after close"""
+        with self._cond:
+            self._closed = False
+
+    def isClosed(self):
+        return self._closed
+
+    def getDroppedNumber(self):
+        return self._dropped_nb
+
+
+class LatencyMonitor:
+    """The latencies, in seconds, of the frames received from the tracker:
+        - 'network': receive time - timestamp of the tracker. The two clocks have an unknown
+            offset, so it is given relative to the smallest one seen: the delay of a frame
+            compared to the fastest one (network and socket queueing)
+        - 'queue': from the receive time to the start of the processing by the pipeline
+        - 'decision': from the receive time of the frame which completes a segment to the
+            recognized gesture
+        The count, mean and maximum of each are kept since the last reset"""
+    NAME_LIST = ('network', 'queue', 'decision')
+
+    def __init__(self):
+        self._offset = None
+        self.reset()
+
+    def reset(self):
+        # name -> [count, sum, max]
+        self._stat_dict = dict([(name, [0, 0.0, 0.0]) for name in self.NAME_LIST])
+
+    def add(self, name, latency):
+        stat = self._stat_dict[name]
+        stat[0] += 1
+        stat[1] += latency
+        if latency > stat[2]:
+            stat[2] = latency
+
+    def addFrame(self, tracker_time, receive_time, start_time):
+        offset = receive_time - tracker_time
+        if self._offset is None or offset < self._offset:
+            self._offset = offset
+        self.add('network', offset - self._offset)
+        self.add('queue', start_time - receive_time)
+
+    def addDecision(self, receive_time, decision_time):
+        self.add('decision', decision_time - receive_time)
+
+    def getStatistics(self):
+        """Return a dict name -> (count, mean, max), the mean and max are None without latency"""
+        res = dict()
+        for name, (n, total, maximum) in self._stat_dict.items():
+            if n == 0:
+                res[name] = (0, None, None)
+            else:
+                res[name] = (n, total / n, maximum)
+        return res
+
+
+class KDTree:
+    """A k-d tree over labelled points for nearest neighbour queries.
+        It is built balanced from a list of points, then points can be inserted one by one;
+        getInsertedNumber tells how many points were inserted since the last build."""
+    def __init__(self, dim, point_list=None, label_list=None):
+        self._dim = dim
+        self._root = None
+        self._size = 0
+        self._inserted_nb = 0
+        if point_list:
+            self.build(point_list, label_list)
+
+    def __len__(self):
+        return self._size
+
+    def build(self, point_list, label_list):
+        """Build a balanced tree, replacing the current one"""
+        self._root = self.buildNode(list(zip(point_list, label_list)), 0)
+        self._size = len(point_list)
+        self._inserted_nb = 0
+
+    def buildNode(self, item_list, depth):
+        # a node is a list [point, label, axis, left, right]
+        if len(item_list) == 0:
+            return None
+        axis = depth % self._dim
+        item_list.sort(key=lambda item: item[0][axis])
+        m = len(item_list) // 2
+        return [item_list[m][0], item_list[m][1], axis,
+                self.buildNode(item_list[:m], depth + 1),
+                self.buildNode(item_list[m+1:], depth + 1)]
+
+    def insert(self, point, label):
+        node = [point, label, 0, None, None]
+        self._size += 1
+        self._inserted_nb += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            axis = current[2]
+            side = 3 if point[axis] < current[0][axis] else 4
+            if current[side] is None:
+                node[2] = (axis + 1) % self._dim
+                current[side] = node
+                return
+            current = current[side]
+
+    def getInsertedNumber(self):
+        return self._inserted_nb
+
+    def query(self, point, k):
+        """Return the k nearest points as a list of (squared distance, label), nearest first"""
+        # max-heap of the best candidates, by negative distance
+        heap = list()
+        # nodes to visit with the squared distance from the point to their half-space
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or (len(heap) == k and bound >= -heap[0][0]):
+                continue
+            p = node[0]
+            d = 0.0
+            for a, b in zip(point, p):
+                d += (a - b) * (a - b)
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, id(node), node[1]))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, id(node), node[1]))
+            diff = point[node[2]] - p[node[2]]
+            near, far = (node[3], node[4]) if diff < 0 else (node[4], node[3])
+            # the near side is visited first, the far one only if it can still contain a closer point
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        res = [(-d, label) for d, i, label in heap]
+        res.sort(key=lambda r: r[0])
+        return res
 
 if __name__ == "__main__":
     # test for 4
@@ -0,0 +1,185 @@
+import threading
+import time
+
+import recoDataStructure as rds
+from dataAcquisition import buildGloveFrame, getGloveKey
+from recoUtils import RingBuffer, LatencyMonitor
+
+# what the worker does with a message of the tracker
+MODE_TRAINING = 'training'
+MODE_RECOGNITION = 'recognition'
+MODE_RECORDING = 'recording'
+
+class RecoWorker:
+    """Run a RecoPipeline in a background thread, so that the thread which receives the
+        messages of the tracker (the GUI thread of the client) only puts them into a ring buffer.
+        The worker parses the messages, trains, recognizes or records the frames, and keeps
+        a summary of the results since the last call of poll(): the last recognized gesture and
+        the number of times each gesture was recognized. The GUI polls it at the display rate,
+        so its cost doesn't depend on the frame rate of the tracker.
+        The pipeline is used by the worker with getLock() held, the other threads must hold it
+        too when they use the pipeline (e.g. to train from a file or to install a model).
+        Each message comes with its receive time (time.monotonic()), which gives the latencies
+        of a LatencyMonitor. When the worker is behind, only the newest message of each glove
+        is recognized (see setMaxDelay)."""
+    def __init__(self, pipeline, capacity=1024, batch_size=64):
+        self._rp = pipeline
+        self._batch_size = batch_size
+        # the oldest frames are dropped when the pipeline is too slow
+        self._buffer = RingBuffer(capacity, 'drop_oldest')
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+        self._data = rds.ARTGloveFrame()
+        # the messages to recognize waiting longer than this are skipped, but the newest
+        # of each glove; None to recognize all of them
+        self._max_delay = None
+
+        # messages pushed / treated, to wait for the ones in the buffer
+        self._cond = threading.Condition()
+        self._pushed_nb = 0
+        self._done_nb = 0
+
+        # results since the last poll
+        self._result_lock = threading.Lock()
+        self._last_gname = None
+        self._count_dict = dict()
+        self._frame_nb = 0
+        self._segment_nb = 0
+        self._skipped_nb = 0
+        self._monitor = LatencyMonitor()
+
+    def getLock(self):
+        return self._lock
+
+    def setMaxDelay(self, max_delay):
+        """Skip the older messages of a glove in recognition mode when the oldest message
+            waiting was received more than max_delay seconds ago. The training and the
+            recording always get all the messages"""
+        self._max_delay = max_delay
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._buffer.open()
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name="RecoWorker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def push(self, msg, mode, gname=None, recorder=None, receive_time=None):
+        """Called for each message of the tracker, in the mode of the client when it arrived:
+            MODE_TRAINING for the gesture class gname, MODE_RECOGNITION, or MODE_RECORDING
+            with a GloveRecorder. Return False if an older message was dropped"""
+        if receive_time is None:
+            receive_time = time.monotonic()
+        return self.pushBatch([(msg, receive_time)], mode, gname, recorder) == 0
+
+    def pushBatch(self, msg_list, mode, gname=None, recorder=None):
+        """Push the (message, receive time) received together, with a single wake-up of the
+            worker. Return the number of older messages dropped"""
+        with self._cond:
+            self._pushed_nb += len(msg_list)
+        dropped_nb = self._buffer.pushAll([(msg, receive_time, mode, gname, recorder) for msg, receive_time in msg_list])
+        if dropped_nb != 0:
+            # the dropped messages count as treated
+            with self._cond:
+                self._done_nb += dropped_nb
+                self._cond.notify_all()
+        return dropped_nb
+
+    def run(self):
+        """Body of the worker thread"""
+        while True:
+            item_list = self._buffer.popAll(self._batch_size, 0.5)
+            if len(item_list) == 0:
+                # idle: retry the gesture events a slow consumer didn't take
+                with self._lock:
+                    self._rp.flushEvents()
+                if not self._running:
+                    break
+                continue
+            done_nb = len(item_list)
+            if self._max_delay is not None and time.monotonic() - item_list[0][1] > self._max_delay:
+                item_list = self.keepNewest(item_list)
+            with self._lock:
+                for msg, receive_time, mode, gname, recorder in item_list:
+                    try:
+                        self.processMessage(msg, receive_time, mode, gname, recorder)
+                    except Exception as e:
+                        print("The worker failed to treat a frame:", e)
+            with self._cond:
+                self._done_nb += done_nb
+                self._cond.notify_all()
+
+    def keepNewest(self, item_list):
+        """Keep only the newest message of each glove among the ones to recognize"""
+        key_list = [getGloveKey(item[0]) if item[2] == MODE_RECOGNITION else None for item in item_list]
+        newest_dict = dict()
+        for i, item in enumerate(item_list):
+            if item[2] == MODE_RECOGNITION:
+                newest_dict[key_list[i]] = i
+        res = list()
+        for i, item in enumerate(item_list):
+            if item[2] != MODE_RECOGNITION or newest_dict[key_list[i]] == i:
+                res.append(item)
+        with self._result_lock:
+            self._skipped_nb += len(item_list) - len(res)
+        return res
+
+    def processMessage(self, msg, receive_time, mode, gname, recorder):
+        start_time = time.monotonic()
+        if not buildGloveFrame(msg, self._data):
+            return
+        self._data._receive_time = receive_time
+        reco_gname = None
+        if mode == MODE_TRAINING:
+            self._rp.trainRealTime(gname, self._data)
+        elif mode == MODE_RECOGNITION:
+            reco_gname = self._rp.recognition(self._data)
+        elif mode == MODE_RECORDING:
+            # Attention, only for one hand
+            recorder.record(self._data._glove_list[0])
+        with self._result_lock:
+            self._frame_nb += 1
+            self._monitor.addFrame(self._data._timestamp, receive_time, start_time)
+            if reco_gname is not None:
+                self._monitor.addDecision(receive_time, time.monotonic())
+                self._last_gname = reco_gname
+                self._count_dict[reco_gname] = self._count_dict.get(reco_gname, 0) + 1
+                self._segment_nb += 1
+
+    def poll(self):
+        """Return and reset the summary of the results since the last call: a dict with
+            the last recognized gesture (None if there is none), the number of times each
+            gesture was recognized, the numbers of frames and segments treated, the
+            total numbers of frames dropped and skipped, and the statistics of the
+            latencies (see LatencyMonitor.getStatistics)"""
+        with self._result_lock:
+            res = {'gesture': self._last_gname, 'counts': self._count_dict,
+                   'frames': self._frame_nb, 'segments': self._segment_nb,
+                   'dropped': self._buffer.getDroppedNumber(), 'skipped': self._skipped_nb,
+                   'latency': self._monitor.getStatistics()}
+            self._last_gname = None
+            self._count_dict = dict()
+            self._frame_nb = 0
+            self._segment_nb = 0
+            self._monitor.reset()
+        return res
+
+    def waitIdle(self, timeout=1.0):
+        """Wait until the messages pushed so far are treated, e.g. before training with the
+            frames received. Return False on timeout"""
+        with self._cond:
+            target = self._pushed_nb
+            return self._cond.wait_for(lambda: self._done_nb >= target or self._thread is None, timeout)
+
+    def stop(self):
+        """Treat the messages left in the buffer, then stop the thread"""
+        if self._thread is None:
+            return
+        # the messages pushed after close are refused, the ones before are treated
+        self._buffer.close()
+        self._running = False
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,164 @@
+import bisect
+import os
+import struct
+from array import array
+
+import captureCodec
+
+INDEX_MAGIC = b"RIX1"
+# a glove is stored on 53 lines in a text recording
+GLOVE_LINE_NB = 53
+
+def getIndexPath(file_path):
+    return file_path + ".idx"
+
+def isIndexable(file_path):
+    """Only the uncompressed text recordings can be read from a byte offset"""
+    return captureCodec.getCompression(file_path) is None and not captureCodec.isDeltaQuantized(file_path)
+
+
+class RecordingIndex:
+    """The byte offset, the timestamp, the quality and the hand (0 left, 1 right) of each frame of a
+        text recording, so that a frame is found by its number or its timestamp in O(log n) and
+        read without parsing the frames before it.
+        The index is kept in a file next to the recording (see getIndexPath) and built again
+        when the recording changes"""
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._offset_list = array('Q')
+        self._timestamp_list = array('d')
+        self._quality_list = array('d')
+        self._side_list = array('b')
+        # the size of the recording up to the end of the last complete frame
+        self._end = 0
+        # (modification time, size) of the recording the index was made from
+        self._source_key = None
+
+    def __len__(self):
+        return len(self._offset_list)
+
+    def build(self):
+        """Scan the recording, only the header lines of the frames are parsed"""
+        self._source_key = self.getSourceKey()
+        with open(self._file_path, 'rb') as f:
+            offset = 0
+            line_nb = 0
+            header = list()
+            for line in f:
+                if line_nb == 0:
+                    start = offset
+                    header = list()
+                if line_nb < 4:
+                    header.append(line)
+                offset += len(line)
+                line_nb += 1
+                if line_nb == GLOVE_LINE_NB:
+                    self._offset_list.append(start)
+                    self._timestamp_list.append(float(header[1]))
+                    self._quality_list.append(float(header[2]))
+                    self._side_list.append(0 if header[3].strip() == b'left' else 1)
+                    self._end = offset
+                    line_nb = 0
+
+    def getSourceKey(self):
+        stat = os.stat(self._file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def isUpToDate(self):
+        return self._source_key == self.getSourceKey()
+
+    def save(self):
+        path = getIndexPath(self._file_path)
+        tmp_path = path + ".tmp" + str(os.getpid())
+        mtime, size = self._source_key
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC + struct.pack('<qqqq', mtime, size, len(self), self._end))
+            self._offset_list.tofile(f)
+            self._timestamp_list.tofile(f)
+            self._quality_list.tofile(f)
+            self._side_list.tofile(f)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Read the index file. Return False if there is none or if it is older than the recording"""
+        try:
+            with open(getIndexPath(self._file_path), 'rb') as f:
+                head = f.read(len(INDEX_MAGIC) + 32)
+                if head[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+                    return False
+                mtime, size, frame_nb, end = struct.unpack('<qqqq', head[len(INDEX_MAGIC):])
+                if (mtime, size) != self.getSourceKey():
+                    return False
+                self._offset_list.fromfile(f, frame_nb)
+                self._timestamp_list.fromfile(f, frame_nb)
+                self._quality_list.fromfile(f, frame_nb)
+                self._side_list.fromfile(f, frame_nb)
+                self._end = end
+                self._source_key = (mtime, size)
+        except (IOError, OSError, EOFError, struct.error):
+            self.__init__(self._file_path)
+            return False
+        return True
+
+    def getOffset(self, i):
+        """The byte offset of the frame i, or of the end of the last frame if i == len(self)"""
+        if i == len(self):
+            return self._end
+        return self._offset_list[i]
+
+    def getTimestamp(self, i):
+        return self._timestamp_list[i]
+
+    def getQuality(self, i):
+        return self._quality_list[i]
+
+    def getSide(self, i):
+        return self._side_list[i]
+
+    def findFrame(self, timestamp):
+        """The number of the first frame at or after timestamp (len(self) if there is none).
+            The timestamps of a recording increase"""
+        return bisect.bisect_left(self._timestamp_list, timestamp)
+
+    def getFrameRange(self, t_start, t_end):
+        """The frame numbers (start, stop) of the frames from t_start included to t_end excluded"""
+        return self.findFrame(t_start), self.findFrame(t_end)
+
+    def selectFrames(self, side=None, min_quality=None):
+        """The numbers of the frames of a hand and/or of a minimum quality, without reading them"""
+        res = list()
+        for i in range(len(self)):
+            if side is not None and self._side_list[i] != side:
+                continue
+            if min_quality is not None and self._quality_list[i] < min_quality:
+                continue
+            res.append(i)
+        return res
+
+    def getChunks(self, chunk_nb):
+        """Split the recording into chunk_nb ranges of frames (start, stop) of about the same size,
+            which can be read by independent readers"""
+        n = len(self)
+        res = list()
+        k = 0
+        while k < chunk_nb:
+            start = n * k // chunk_nb
+            stop = n * (k + 1) // chunk_nb
+            if stop > start:
+                res.append((start, stop))
+            k += 1
+        return res
+
+def getRecordingIndex(file_path):
+    """The index of a recording, read from its index file, or built and saved if it is out of date.
+        Return None if the recording can't be indexed (compressed or delta quantised)"""
+    if not isIndexable(file_path):
+        return None
+    index = RecordingIndex(file_path)
+    if not index.load():
+        index.build()
+        try:
+            index.save()
+        except (IOError, OSError) as e:
+            print("Can't save the index of the recording:", e)
+    return index
@@ -0,0 +1,202 @@
+"""Evaluate many configurations of the recognition on labelled recordings, in parallel:
+    the segment length, the feature subset and the part of the samples used for the training.
+
+    python sweep.py [options] GESTURE=FILE [GESTURE=FILE ...]
+
+The recordings are parsed and the features of every frame are computed once, for all the
+features of the search space; each worker process gets them when it starts and only cuts
+the segments and trains a Rubine classifier for its configurations. For each configuration
+the precision on the test segments (the ones not used for the training) is reported with
+the recognition cost, the time per frame of the feature extraction and of the scores."""
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from classifier import Rubine
+from featureExtraction import FeatureExtractor, FEATURE_FINGER_PAIRS, DEFAULT_FEATURE_NAME_LIST
+from recoPipeline import RecoPipeline
+
+# number of frames used to measure the recognition cost
+COST_FRAME_NB = 500
+COST_RUN_NB = 5
+
+# set in each worker by initWorker
+_frame_data = None
+
+def extractFrames(pair_list, name_list, use_filter, normalize):
+    """Compute the features of name_list for every frame of the recordings.
+        Return (list of (gesture class name, list of (feature values, header, weight)), some gloves)"""
+    rp = RecoPipeline(Rubine(list(name_list)))
+    if use_filter:
+        from positionFilter import FingerPositionFilter
+        rp.setPositionFilter(FingerPositionFilter())
+    if normalize:
+        from framePreprocessing import FramePreprocessor
+        rp.setPreprocessor(FramePreprocessor())
+    fe = rp._featureExtractor
+    recording_list = list()
+    glove_list = list()
+    for gclass_name, file_path in pair_list:
+        frame_list = list()
+        for sample in rp._dataReceiver.iterDataFromFile(file_path):
+            glove, weight = rp.prepareFrame(sample)
+            if glove is None:
+                continue
+            header = (glove._timestamp, glove._id, glove._quality, glove._l_or_r, glove._finger_number)
+            frame_list.append((fe.computeFeatures(glove), header, weight))
+            if len(glove_list) < COST_FRAME_NB:
+                glove_list.append(glove)
+        recording_list.append((gclass_name, frame_list))
+    return recording_list, glove_list
+
+def measureCost(classifier, seg_threshold, name_list, glove_list):
+    """The time per frame, in us, of the recognition path: the features of each frame and the
+        scores of each segment. The best of some runs, as other processes may share the CPUs"""
+    cost = None
+    k = 0
+    while k < COST_RUN_NB:
+        fe = FeatureExtractor(seg_threshold, list(name_list))
+        t = time.perf_counter()
+        for g in glove_list:
+            fe.addSampleFrame(g)
+            if fe._seg_activated:
+                classifier.predict([fe.getRecoTuple()._s_list])
+        t = (time.perf_counter() - t) / max(1, len(glove_list)) * 1e6
+        if cost is None or t < cost:
+            cost = t
+        k += 1
+    return cost
+
+def initWorker(frame_data):
+    global _frame_data
+    _frame_data = frame_data
+    # the training is verbose
+    sys.stdout = open(os.devnull, 'w')
+
+def evaluateConfig(config):
+    """Train and test a configuration (segment length, feature names, train ratio) on the
+        frames of the worker. Return (config, precision, cost in us per frame, results of train)"""
+    seg_threshold, name_list, train_ratio = config
+    all_name_list, recording_list, glove_list = _frame_data
+    column_list = [all_name_list.index(name) for name in name_list]
+
+    classifier = Rubine(list(name_list))
+    classifier.setTrainRatio(train_ratio)
+    fe = FeatureExtractor(seg_threshold, list(name_list))
+    for gclass_name, frame_list in recording_list:
+        if not classifier.hasGestureClass(gclass_name):
+            classifier.createGestureClass(gclass_name)
+        for s_list, header, weight in frame_list:
+            fe.addFeatureFrame([s_list[i] for i in column_list], header, weight)
+            if fe._seg_activated:
+                classifier.addRecoTupleForTraining(fe.getRecoTuple(), gclass_name)
+        fe.reset()
+
+    train_res = dict()
+    for c in classifier._class_list:
+        train_res[c._name] = classifier.train(c._name)
+    if 1 in train_res.values():
+        return config, None, None, train_res
+
+    sample_list = list()
+    label_list = list()
+    for c in classifier._class_list:
+        sample_list += c._sample_list[c._train_sample_nb:]
+        label_list += [c._name] * (len(c._sample_list) - c._train_sample_nb)
+    precision = classifier.score(sample_list, label_list)
+
+    cost = measureCost(classifier, seg_threshold, name_list, glove_list)
+    return config, precision, cost, train_res
+
+def createConfigList(args):
+    feature_set_list = list()
+    for feature_set in args.features:
+        if feature_set == "default":
+            feature_set_list.append(tuple(DEFAULT_FEATURE_NAME_LIST))
+        else:
+            feature_set_list.append(tuple(feature_set.split(",")))
+    for name_list in feature_set_list:
+        for name in name_list:
+            if name not in FEATURE_FINGER_PAIRS:
+                print("Unknown feature", name, "- known ones:", " ".join(FEATURE_FINGER_PAIRS), file=sys.stderr)
+                sys.exit(2)
+    config_list = list(itertools.product(args.seg, feature_set_list, args.train_ratio))
+    if args.random is not None and args.random < len(config_list):
+        # random search: a sample of the grid
+        config_list = random.Random(args.seed).sample(config_list, args.random)
+    return config_list
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sweep", description="Parallel search of the recognition parameters")
+    parser.add_argument("pairs", nargs="+", metavar="GESTURE=FILE")
+    parser.add_argument("--seg", type=int, nargs="+", default=[5], help="segment lengths")
+    parser.add_argument("--features", nargs="+", default=["default"],
+                        help="feature subsets, comma separated names, 'default' for conf/feature_list.txt")
+    parser.add_argument("--train-ratio", type=float, nargs="+", default=[0.8], help="parts of the samples used for the training")
+    parser.add_argument("--random", type=int, default=None, help="evaluate only this number of random configurations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes, one per CPU by default")
+    parser.add_argument("--target", type=float, default=None, help="precision (0-1) to reach with the cheapest configuration")
+    parser.add_argument("--filter", action="store_true", help="smooth the finger positions")
+    parser.add_argument("--normalize", action="store_true", help="filter bad frames and normalise the hand size")
+    args = parser.parse_args(argv)
+
+    pair_list = list()
+    for pair in args.pairs:
+        if "=" not in pair:
+            print("Expected GESTURE=FILE, got", pair, file=sys.stderr)
+            return 2
+        pair_list.append(tuple(pair.split("=", 1)))
+    config_list = createConfigList(args)
+
+    # the features of all the subsets are computed once
+    all_name_list = list()
+    for seg_threshold, name_list, train_ratio in config_list:
+        for name in name_list:
+            if name not in all_name_list:
+                all_name_list.append(name)
+    t = time.time()
+    recording_list, glove_list = extractFrames(pair_list, all_name_list, args.filter, args.normalize)
+    print(sum([len(f) for n, f in recording_list]), "frames extracted in", round(time.time() - t, 2), "s,",
+          len(config_list), "configurations to evaluate.")
+
+    pool = multiprocessing.Pool(args.jobs, initWorker, ((all_name_list, recording_list, glove_list),))
+    try:
+        result_list = list(pool.imap_unordered(evaluateConfig, config_list))
+    finally:
+        pool.close()
+        pool.join()
+
+    result_list.sort(key=lambda r: (r[2] is None, r[2]))
+    print("%-6s %-6s %-10s %-12s %s" % ("seg", "ratio", "precision", "cost us/fr", "features"))
+    best = None
+    best_precision = -1.0
+    for config, precision, cost, train_res in result_list:
+        seg_threshold, name_list, train_ratio = config
+        if precision is None:
+            untrained = [name for name in train_res if train_res[name] != 0]
+            print("%-6d %-6.2f %-10s %-12s %s (not enough samples: %s)" % (seg_threshold, train_ratio, "-", "-", ",".join(name_list), " ".join(untrained)))
+            continue
+        # on the Pareto front if no cheaper configuration is as precise
+        front = precision > best_precision
+        if front:
+            best_precision = precision
+        print("%-6d %-6.2f %-10.4f %-12.2f %s%s" % (seg_threshold, train_ratio, precision, cost, ",".join(name_list), " *" if front else ""))
+        if best is None and args.target is not None and precision >= args.target:
+            best = (config, precision, cost)
+    print("* no cheaper configuration is as precise")
+    if args.target is not None:
+        if best is None:
+            print("No configuration reaches the precision", args.target)
+        else:
+            config, precision, cost = best
+            print("The cheapest configuration reaching", args.target, "is: --seg", config[0],
+                  "--train-ratio", config[2], "--features", ",".join(config[1]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import captureCodec
+
+INFINITY = float("inf")
+
+def resampleSequence(seq, length):
+    """Resample a sequence of feature vectors to a given length by linear interpolation"""
+    if len(seq) == length:
+        return [list(v) for v in seq]
+    if len(seq) == 1:
+        return [list(seq[0]) for i in range(length)]
+    if length == 1:
+        return [list(seq[0])]
+    res = list()
+    step = (len(seq) - 1) / float(length - 1)
+    i = 0
+    while i < length:
+        pos = i * step
+        k = int(pos)
+        if k >= len(seq) - 1:
+            res.append(list(seq[-1]))
+        else:
+            t = pos - k
+            res.append([a + (b - a) * t for a, b in zip(seq[k], seq[k+1])])
+        i += 1
+    return res
+
+def computeEnvelope(seq, band):
+    """Upper and lower envelope of a sequence within the Sakoe-Chiba band, used by LB_Keogh"""
+    n = len(seq)
+    upper = list()
+    lower = list()
+    i = 0
+    while i < n:
+        window = seq[max(0, i - band):min(n, i + band + 1)]
+        upper.append([max(col) for col in zip(*window)])
+        lower.append([min(col) for col in zip(*window)])
+        i += 1
+    return upper, lower
+
+def squaredDistance(v1, v2):
+    res = 0.0
+    for a, b in zip(v1, v2):
+        res += (a - b) * (a - b)
+    return res
+
+def lowerBoundKeogh(seq, upper, lower, best_so_far=INFINITY):
+    """LB_Keogh: a lower bound of the DTW distance between seq and the sequence of the envelope"""
+    res = 0.0
+    for v, u_list, l_list in zip(seq, upper, lower):
+        for x, u, l in zip(v, u_list, l_list):
+            if x > u:
+                res += (x - u) * (x - u)
+            elif x < l:
+                res += (x - l) * (x - l)
+        if res >= best_so_far:
+            break
+    return res
+
+def dtwDistance(seq1, seq2, band, best_so_far=INFINITY):
+    """DTW distance (sum of squared distances) between two sequences of the same length
+        within a Sakoe-Chiba band. The computation is abandoned as soon as a whole row
+        exceeds best_so_far, INFINITY is returned in this case"""
+    n = len(seq1)
+    previous = [INFINITY] * (n + 1)
+    previous[0] = 0.0
+    i = 1
+    while i <= n:
+        current = [INFINITY] * (n + 1)
+        row_min = INFINITY
+        j = max(1, i - band)
+        last = min(n, i + band)
+        v = seq1[i-1]
+        while j <= last:
+            cost = squaredDistance(v, seq2[j-1])
+            m = previous[j-1]
+            if previous[j] < m:
+                m = previous[j]
+            if current[j-1] < m:
+                m = current[j-1]
+            current[j] = cost + m
+            if current[j] < row_min:
+                row_min = current[j]
+            j += 1
+        if row_min >= best_so_far:
+            return INFINITY
+        previous = current
+        i += 1
+    return previous[n]
+
+
+class Template:
+    """A recorded performance of a motion gesture, resampled to the length of the recognizer"""
+    def __init__(self, name, seq, band):
+        self._name = name
+        self._sequence = seq
+        self._upper, self._lower = computeEnvelope(seq, band)
+
+
+class DTWRecognizer:
+    """Recognize motion gestures: the feature vectors of the last RecoTuples are matched against
+        per-class templates with dynamic time warping. The templates are ordered by their
+        LB_Keogh lower bound so that most of them are discarded without computing the DTW."""
+    def __init__(self, length=16, band=2, window=None, reject_threshold=None):
+        # every sequence is resampled to this length before the matching
+        self._length = length
+        # radius of the Sakoe-Chiba band
+        self._band = band
+        # number of RecoTuples in the recognition window, the longest template by default
+        self._window = window
+        # the distance above which no gesture is recognized
+        self._reject_threshold = reject_threshold
+
+        self._class_list = list()
+        self._template_list = list()
+        # class name -> sequence being recorded for training
+        self._training_sequence = dict()
+        self._max_template_length = 0
+
+        # the last feature vectors received for recognition
+        self._stream = list()
+
+    def hasGestureClass(self, gclass_name):
+        return gclass_name in self._class_list
+
+    def createGestureClass(self, gclass_name):
+        if not self.hasGestureClass(gclass_name):
+            self._class_list.append(gclass_name)
+            print("New motion gesture <",gclass_name,"> has been added.")
+
+    def addRecoTupleForTraining(self, rt, gclass_name):
+        """Append the RecoTuple to the sequence being recorded for a gesture class"""
+        if not self.hasGestureClass(gclass_name):
+            print("The gesture class <",gclass_name,"> doesn't exist.")
+            return
+        self._training_sequence.setdefault(gclass_name, list()).append(list(rt._s_list))
+
+    def addTemplate(self, gclass_name, seq):
+        """Add a sequence of feature vectors as a template of a gesture class"""
+        self.createGestureClass(gclass_name)
+        self._template_list.append(Template(gclass_name, resampleSequence(seq, self._length), self._band))
+        if len(seq) > self._max_template_length:
+            self._max_template_length = len(seq)
+
+    def train(self, gclass_name):
+        """Close the sequence being recorded for a gesture class and keep it as a template.
+            Return 1 if the sequence is too short"""
+        seq = self._training_sequence.pop(gclass_name, list())
+        if len(seq) < 2:
+            print("Not enough samples for the motion gesture <",gclass_name,">")
+            return 1
+        self.addTemplate(gclass_name, seq)
+        print("A template of", len(seq), "segments has been added to <",gclass_name,">")
+        return 0
+
+    def getWindowLength(self):
+        if self._window is not None:
+            return self._window
+        return self._max_template_length
+
+    def recognizeSequence(self, seq):
+        """Return (class name, DTW distance) of the template closest to the sequence,
+            (None, INFINITY) if there is no template"""
+        query = resampleSequence(seq, self._length)
+        # sort the templates by their lower bound, the cheapest test first
+        bound_list = list()
+        for t in self._template_list:
+            bound_list.append((lowerBoundKeogh(query, t._upper, t._lower), t))
+        bound_list.sort(key=lambda b: b[0])
+
+        best = INFINITY
+        best_name = None
+        for lb, t in bound_list:
+            if lb >= best:
+                # the next templates can't be closer
+                break
+            d = dtwDistance(query, t._sequence, self._band, best)
+            if d < best:
+                best = d
+                best_name = t._name
+        return best_name, best
+
+    def recognition(self, rt):
+        """Add a RecoTuple to the recognition window and return the name of the recognized
+            motion gesture, or None if the window isn't full or the best match is rejected"""
+        length = self.getWindowLength()
+        if length < 2:
+            return None
+        self._stream.append(rt._s_list)
+        if len(self._stream) > length:
+            del self._stream[0]
+        if len(self._stream) < length:
+            return None
+        name, d = self.recognizeSequence(self._stream)
+        if self._reject_threshold is not None and d > self._reject_threshold:
+            return None
+        return name
+
+    def reset(self):
+        del self._stream[:]
+
+    def saveToFile(self, fpath):
+        """Save the templates, resampled, one per block"""
+        res = list()
+        for t in self._template_list:
+            res.append("<template>\n" + t._name + "\n")
+            for v in t._sequence:
+                res.append(" ".join([str(x) for x in v]) + "\n")
+            res.append("</template>\n")
+        with captureCodec.openFile(fpath, 'w') as f:
+            f.write("".join(res))
+        print(len(self._template_list), "templates have been saved.")
+
+    def loadFromFile(self, fpath):
+        with captureCodec.openFile(fpath, 'r') as f:
+            lines = f.readlines()
+        i = 0
+        while i < len(lines):
+            if lines[i][:-1] == "<template>":
+                name = lines[i+1][:-1]
+                i += 2
+                seq = list()
+                while lines[i][:-1] != "</template>":
+                    seq.append([float(x) for x in lines[i].split()])
+                    i += 1
+                self.addTemplate(name, seq)
+            i += 1
+        print(len(self._template_list), "templates have been loaded.")